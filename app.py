@@ -1,6 +1,7 @@
-from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException, Body
+from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException, Body, WebSocket, WebSocketDisconnect
 from fastapi.responses import FileResponse
 from fastapi.responses import StreamingResponse
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 import cv2 as cv
 import numpy as np
@@ -14,6 +15,10 @@ import tempfile
 import threading
 import json
 import asyncio
+import re
+import struct
+from email.utils import formatdate
+from functools import partial
 from typing import Union
 
 # Suppress FutureWarning from scikit-image used internally by insightface.
@@ -34,27 +39,33 @@ logger = logging.getLogger(__name__)
 # Add src to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.detector import YunetFaceDetector
+from src.detector import create_face_detector
+from src.detector_pool import DetectorPool
+from src.gallery_index import INDEX_KINDS
+from src.embedding_store import gallery_path, legacy_pickle_path, store_exists
 from src.recognizer import FaceRecognizer
+from src.database_utils import IMAGE_EXTENSIONS, build_database, check_images
 from src.monitor import ClassroomMonitorStage2
 from src.behavior_classifier import BehaviorClassifier
-from src.track_manager import TrackManager
-from src.fixes import resolve_duplicate_ids
-from src.visualization_utils import draw_tracking_results
+from src.frontend_processor import FrontendWebcamProcessor, FrontendIngestWorker, processing_size
 from src.mongo_client import (
     clear_classroom_events,
-    log_event,
     save_report,
     get_reports,
     get_student_trends,
-    add_training_sample,
     get_pending_review,
     submit_review,
     correct_event,
     get_labeled_samples,
 )
 from src.runtime_utils import get_acceleration_status
-import supervision as sv
+from src.capture import DROP_POLICIES
+from src.inference_broker import InferenceBroker
+from src.stream_worker import StreamWorkerProcess
+from src.broadcast import FrameHub
+from src.motion import MotionGate, TrackPredictor
+from src.tiled_detector import TiledFaceDetector, parse_regions
+from src.frame_encoder import VideoFrame, AdaptiveOutput, quantize_quality
 
 app = FastAPI()
 
@@ -98,8 +109,8 @@ def _env_float(name: str, default: float) -> float:
         return default
 
 
-def _self_learning_enabled() -> bool:
-    return os.getenv("ENABLE_SELF_LEARNING", "false").strip().lower() in {"1", "true", "yes", "on"}
+OVERLAY_MODES = ("server", "client")
+DETECTOR_BACKENDS = ("opencv", "onnxruntime")
 
 
 class AppConfig:
@@ -108,24 +119,98 @@ class AppConfig:
         self.upload_dir = os.getenv("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "classroom_uploads"))
         self.cleanup_uploads = _env_bool("CLEANUP_UPLOADS", True)
         self.detect_interval = _env_int("DETECT_INTERVAL", 1)
+        # Skip the face detector on frames where (almost) nothing moved since the last detection.
+        self.motion_gate = _env_bool("MOTION_GATE", False)
+        self.motion_threshold = max(0.0, _env_float("MOTION_THRESHOLD", 0.005))
+        self.motion_pixel_delta = max(1, _env_int("MOTION_PIXEL_DELTA", 15))
+        self.motion_max_skip = max(1, _env_int("MOTION_MAX_SKIP", 30))
+        # Move track boxes along their velocity on frames the detector skipped.
+        self.track_prediction = _env_bool("TRACK_PREDICTION", True)
+        self.track_prediction_horizon = max(0, _env_int("TRACK_PREDICTION_HORIZON", 8))
+        # Extra high-resolution detection passes over regions of the source frame where
+        # faces are too small at PROCESSING_WIDTH (back rows of a lecture hall).
+        self.tiled_detection = _env_bool("TILED_DETECTION", False)
+        self.detection_tiles = parse_regions(os.getenv("DETECTION_TILES", "0,0,1,0.5"))
+        self.detection_tile_scale = min(2.0, max(0.1, _env_float("DETECTION_TILE_SCALE", 1.0)))
+        self.detection_tile_size = max(64, _env_int("DETECTION_TILE_SIZE", 640))
+        self.detection_tile_workers = max(1, _env_int("DETECTION_TILE_WORKERS", 4))
         self.recheck_interval = _env_float("RECHECK_INTERVAL", 1.5)
         self.behavior_interval = _env_float("BEHAVIOR_INTERVAL", 3.0)
         self.processing_width = _env_int("PROCESSING_WIDTH", 768)
+        # server: boxes/labels are burned into the video. client: video frames stay raw and
+        # dashboards draw the per-frame metadata from /overlay/stream (or /ws/frontend).
+        self.overlay_mode = os.getenv("OVERLAY_MODE", "server").strip().lower()
+        if self.overlay_mode not in OVERLAY_MODES:
+            self.overlay_mode = "server"
+        # JPEG quality browsers are asked to use for webcam frames (see /ingest/capabilities).
+        self.ingest_jpeg_quality = min(100, max(1, _env_int("INGEST_JPEG_QUALITY", 72)))
+        # /video_feed JPEG quality when the viewer does not ask for one.
+        self.output_jpeg_quality = min(100, max(1, _env_int("OUTPUT_JPEG_QUALITY", 80)))
+        # Lower a viewer's quality, then frame rate, while its socket is backed up.
+        self.adaptive_output = _env_bool("ADAPTIVE_OUTPUT", True)
+        # /snapshot.jpg serves the cached latest frame while it is at most this old (seconds).
+        self.snapshot_max_age = max(0.0, _env_float("SNAPSHOT_MAX_AGE", 1.0))
         self.require_single_worker = _env_bool("REQUIRE_SINGLE_WORKER", True)
         self.max_stream_seconds = _env_int("MAX_STREAM_SECONDS", 0)
+        # Stop a stream's processing loop this long after its last viewer leaves (0 = keep running).
+        self.stream_idle_seconds = max(0, _env_int("STREAM_IDLE_SECONDS", 5))
+        # Start processing at /start_stream and keep it running without viewers (events and
+        # reports only); frames are drawn and encoded only while someone watches.
+        self.headless_streams = _env_bool("HEADLESS_STREAMS", False)
+        # Concurrent streams (cameras/sessions) per backend process; 0 = unlimited.
+        self.max_streams = max(0, _env_int("MAX_STREAMS", 8))
         # 0 = disabled. Set to e.g. 300 to snapshot every 5 minutes.
         self.session_snapshot_interval = _env_int("SESSION_SNAPSHOT_INTERVAL", 0)
         self.read_retry_count = _env_int("READ_RETRY_COUNT", 10)
         self.read_retry_interval = _env_float("READ_RETRY_INTERVAL", 0.3)
+        # Frames buffered between the capture reader thread and the processing loop.
+        self.capture_queue_size = max(1, _env_int("CAPTURE_QUEUE_SIZE", 2))
+        # drop_oldest (always process the freshest frame), drop_newest, or block.
+        # Uploaded files always use block so no video frames are skipped.
+        self.capture_drop_policy = os.getenv("CAPTURE_DROP_POLICY", "drop_oldest").strip().lower()
+        if self.capture_drop_policy not in DROP_POLICIES:
+            self.capture_drop_policy = "drop_oldest"
+        # Run detect/track/analyze/render/encode on separate threads over consecutive frames.
+        self.pipeline_enabled = _env_bool("PIPELINE_ENABLED", False)
+        self.pipeline_queue_size = max(1, _env_int("PIPELINE_QUEUE_SIZE", 2))
+        # thread: every stream runs inside the API process (shared models).
+        # process: each stream gets its own worker process (own model copies); frames move
+        # through shared-memory rings instead of being pickled.
+        self.stream_workers = os.getenv("STREAM_WORKERS", "thread").strip().lower()
+        if self.stream_workers not in {"thread", "process"}:
+            self.stream_workers = "thread"
+        self.shm_ring_slots = max(2, _env_int("SHM_RING_SLOTS", 3))
+        self.shm_max_frame_bytes = max(1, _env_int("SHM_MAX_FRAME_BYTES", 1920 * 1080 * 3))
+        self.shm_max_jpeg_bytes = max(1, _env_int("SHM_MAX_JPEG_BYTES", 2 * 1024 * 1024))
         self.behavior_max_batch = _env_int("BEHAVIOR_MAX_BATCH", 4)
+        # Shared broker that batches behavior crops and aligned faces across all streams.
+        self.inference_broker_enabled = _env_bool("INFERENCE_BROKER", False)
+        self.inference_max_batch = max(1, _env_int("INFERENCE_MAX_BATCH", 32))
+        self.inference_max_wait_ms = max(0.0, _env_float("INFERENCE_MAX_WAIT_MS", 8.0))
         self.recognition_threshold = _env_float("RECOGNITION_THRESHOLD", 0.1)
         self.recognition_min_margin = _env_float("RECOGNITION_MIN_MARGIN", 0.01)
+        # Gallery search: exact (float32), fp16 / int8 (quantized), ivf (approximate, for large galleries).
+        self.gallery_index = os.getenv("GALLERY_INDEX", "exact").strip().lower()
+        if self.gallery_index not in INDEX_KINDS:
+            self.gallery_index = "exact"
+        self.gallery_ivf_lists = max(0, _env_int("GALLERY_IVF_LISTS", 0))
+        self.gallery_ivf_probe = max(1, _env_int("GALLERY_IVF_PROBE", 8))
         # Disabled by default to preserve pre-automation recognition behavior.
         # Set >0 values to enable quality gating.
         self.min_recognition_face_size = _env_int("MIN_RECOGNITION_FACE_SIZE", 0)
         self.min_recognition_face_score = _env_float("MIN_RECOGNITION_FACE_SCORE", 0.0)
         self.detector_conf_threshold = _env_float("DETECTOR_CONF_THRESHOLD", 0.7)
         self.detector_nms_threshold = _env_float("DETECTOR_NMS_THRESHOLD", 0.3)
+        # opencv: cv.FaceDetectorYN. onnxruntime: same model in an onnxruntime session with
+        # thread controls and batched tiles. 0 threads = onnxruntime's default. A model exported
+        # with a fixed input size only matches opencv for frames that fit inside it.
+        self.detector_backend = os.getenv("DETECTOR_BACKEND", "opencv").strip().lower()
+        if self.detector_backend not in DETECTOR_BACKENDS:
+            self.detector_backend = "opencv"
+        self.detector_intra_op_threads = max(0, _env_int("DETECTOR_INTRA_OP_THREADS", 0))
+        self.detector_inter_op_threads = max(0, _env_int("DETECTOR_INTER_OP_THREADS", 0))
+        # Detector instances shared by thread-mode streams (one per input size in use).
+        self.detector_pool_size = max(1, _env_int("DETECTOR_POOL_SIZE", 4))
         self.detector_model_path = os.getenv(
             "DETECTOR_MODEL_PATH",
             os.path.join(self.base_dir, "face_detection_yunet_2023mar_int8.onnx")
@@ -163,53 +248,54 @@ class AppConfig:
 CONFIG = AppConfig()
 os.makedirs(CONFIG.upload_dir, exist_ok=True)
 
-# Global State
-class StreamState:
-    def __init__(self):
+DEFAULT_STREAM_ID = "default"
+_STREAM_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+_STUDENT_NAME_RE = re.compile(r"^[A-Za-z0-9_][A-Za-z0-9_ .'-]{0,63}$")
+
+# /ws/frontend frame header: format, width, height, payload length (network byte order).
+_WS_FRAME_HEADER = struct.Struct("!BHHI")
+WS_FORMAT_JPEG = 0
+WS_FORMAT_BGR = 1
+WS_FORMAT_GRAY = 2
+WS_FORMATS = {"jpeg": WS_FORMAT_JPEG, "bgr": WS_FORMAT_BGR, "gray": WS_FORMAT_GRAY}
+
+
+class StreamSession:
+    """
+    Per-camera stream state, keyed by stream id. Each session gets its own
+    monitor/processor (and so its own tracker and TrackManager); the loaded
+    models are shared through StreamState.
+    """
+    def __init__(self, stream_id: str):
+        self.stream_id = stream_id
         self.lock = threading.Lock()
         self.source = None
         self.is_running = False
         self.stop_requested = False
         self.stream_token = 0
         self.active_monitor = None
+        self.active_pipeline = None
         self.frontend_processor = None
+        self.frontend_ingest = None  # FrontendIngestWorker running frontend_processor
+        self.worker = None  # StreamWorkerProcess when STREAM_WORKERS=process
+        self.hub = None  # FrameHub fed by the stream's single producer loop
+        self.result_hub = None  # FrameHub of per-frame result/overlay metadata dicts
+        self.overlay_mode = CONFIG.overlay_mode
+        self.headless = CONFIG.headless_streams
+        self.producer_token = None
         self.active_source_type = None
         self.active_upload_path = None
-        self.model_path = CONFIG.detector_model_path
-        self.faces_dir = CONFIG.faces_dir
-        self.behavior_model_path = CONFIG.behavior_model_path
-        
+
         self.active_count = 0
-        self.frontend_last_jpeg = None
-        self.log_buffer = deque(maxlen=500)
-        self.log_sequence = 0
         self.event_buffer = deque(maxlen=1000)
         self.event_sequence = 0
         self.stream_ended_flag = False  # set True briefly when stream stops, for SSE auto-save
-        
-        # Models
-        self.detector = None
-        self.recognizer = None
-        self.behavior_classifier = None
-        self.behavior_model_valid = None
-        self.behavior_model_classes = []
 
-    def add_log(self, message: str, level: str = "info", **details):
-        with self.lock:
-            self.log_sequence += 1
-            log_entry = {
-                "id": self.log_sequence,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "level": level,
-                "message": message,
-                "details": details,
-            }
-            self.log_buffer.append(log_entry)
-            return log_entry
-
-    def get_logs_since(self, last_id: int):
-        with self.lock:
-            return [entry for entry in self.log_buffer if entry["id"] > last_id]
+        # Throughput/latency accounting for host sizing.
+        self.started_at = None
+        self.frames_processed = 0
+        self.frame_times = deque(maxlen=60)
+        self.latency_ms = 0.0
 
     def add_event(
         self,
@@ -225,6 +311,7 @@ class StreamState:
                 "id": self.event_sequence,
                 "event_id": event_id,
                 "created_at": datetime.now(timezone.utc).isoformat(),
+                "stream_id": self.stream_id,
                 "name": name,
                 "behavior": behavior,
                 "confidence": float(confidence),
@@ -237,25 +324,165 @@ class StreamState:
         with self.lock:
             return [entry for entry in self.event_buffer if entry["id"] > last_id]
 
+    def mark_started(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.frames_processed = 0
+            self.frame_times.clear()
+            self.latency_ms = 0.0
+
+    def record_frame(self, count: int, captured_at: Optional[float] = None):
+        """Record one processed frame; captured_at is when it left the decoder/browser."""
+        now = time.time()
+        with self.lock:
+            self.active_count = count
+            self.frames_processed += 1
+            self.frame_times.append(now)
+            if captured_at is not None:
+                latency = (now - captured_at) * 1000.0
+                # Smooth so a single slow frame does not dominate the figure.
+                self.latency_ms = latency if self.frames_processed == 1 else 0.9 * self.latency_ms + 0.1 * latency
+
+    def detach(self):
+        """Reset runtime fields; returns (monitor, worker, upload_path, source_type) for cleanup."""
+        with self.lock:
+            self.stop_requested = True
+            self.stream_token += 1
+            self.is_running = False
+            self.active_count = 0
+            active_monitor = self.active_monitor
+            worker = self.worker
+            active_upload_path = self.active_upload_path
+            source_type = self.active_source_type
+            self.active_monitor = None
+            self.active_pipeline = None
+            self.frontend_processor = None
+            self.worker = None
+            self.source = None
+            self.active_source_type = None
+            self.active_upload_path = None
+            hub = self.hub
+            self.hub = None
+            result_hub = self.result_hub
+            self.result_hub = None
+            ingest = self.frontend_ingest
+            self.frontend_ingest = None
+        if hub is not None:
+            hub.close()
+        if result_hub is not None:
+            result_hub.close()
+        if ingest is not None:
+            ingest.stop()
+        return active_monitor, worker, active_upload_path, source_type
+
+    def stats(self):
+        with self.lock:
+            fps = 0.0
+            if len(self.frame_times) > 1:
+                span = self.frame_times[-1] - self.frame_times[0]
+                if span > 0:
+                    fps = (len(self.frame_times) - 1) / span
+            stats = {
+                "stream_id": self.stream_id,
+                "active_students": self.active_count,
+                "is_running": self.is_running,
+                "source_type": self.active_source_type,
+                "worker": "process" if self.worker is not None else "thread",
+                "headless": self.headless,
+                "frames_processed": self.frames_processed,
+                "fps": round(fps, 2),
+                "latency_ms": round(self.latency_ms, 1),
+                "uptime_seconds": round(time.time() - self.started_at, 1) if self.started_at and self.is_running else 0.0,
+            }
+            if self.hub is not None:
+                stats.update(self.hub.stats())
+            if self.frontend_ingest is not None:
+                stats["ingest"] = self.frontend_ingest.stats()
+            processor = self.active_monitor or self.frontend_processor
+            if processor is not None and processor.motion_gate is not None:
+                stats["motion_gate"] = processor.motion_gate.stats()
+            if self.active_pipeline is not None:
+                # Per-stage queue depth/occupancy: the stage near occupancy 1.0 is the bottleneck.
+                stats["pipeline"] = self.active_pipeline.stats()
+            return stats
+
+
+# Global State
+class StreamState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}  # stream_id -> StreamSession
+        self.model_path = CONFIG.detector_model_path
+        self.faces_dir = CONFIG.faces_dir
+        self.behavior_model_path = CONFIG.behavior_model_path
+
+        self.log_buffer = deque(maxlen=500)
+        self.log_sequence = 0
+
+        # Models (loaded once, shared by every stream)
+        self.detector_pool = None
+        self.recognizer = None
+        self.behavior_classifier = None
+        self.behavior_model_valid = None
+        self.behavior_model_classes = []
+        self.inference_broker = None
+        self.gallery_lock = threading.RLock()  # one gallery change (enrolment, build, reload) at a time
+
+    def add_log(self, message: str, level: str = "info", **details):
+        with self.lock:
+            self.log_sequence += 1
+            log_entry = {
+                "id": self.log_sequence,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "level": level,
+                "message": message,
+                "details": details,
+            }
+            self.log_buffer.append(log_entry)
+            return log_entry
+
+    def get_logs_since(self, last_id: int):
+        with self.lock:
+            return [entry for entry in self.log_buffer if entry["id"] > last_id]
+
+    def get_session(self, stream_id: str, create: bool = False) -> Optional[StreamSession]:
+        with self.lock:
+            session = self.sessions.get(stream_id)
+            if session is None and create:
+                session = StreamSession(stream_id)
+                self.sessions[stream_id] = session
+            return session
+
+    def list_sessions(self):
+        with self.lock:
+            return list(self.sessions.values())
+
+    def running_count(self, exclude: Optional[str] = None) -> int:
+        return sum(
+            1 for s in self.list_sessions()
+            if s.stream_id != exclude and (s.is_running or s.source is not None)
+        )
+
     def load_models(self):
         try:
-            if self.detector is None:
-                self.detector = YunetFaceDetector(
-                    model_path=self.model_path,
-                    conf_threshold=CONFIG.detector_conf_threshold,
-                    nms_threshold=CONFIG.detector_nms_threshold,
+            if self.detector_pool is None:
+                self.detector_pool = DetectorPool(
+                    partial(create_face_detector, **_detector_kwargs()), max_instances=CONFIG.detector_pool_size
                 )
-                logger.info("Detector loaded")
-                self.add_log("Detector model loaded", "system", component="detector")
+                logger.info(f"Detector loaded ({CONFIG.detector_backend})")
+                self.add_log("Detector model loaded", "system", component="detector", backend=CONFIG.detector_backend)
             
-            embeddings_path = os.path.join(self.faces_dir, "embeddings.pkl")
-            if self.recognizer is None and os.path.exists(self.faces_dir) and os.path.exists(embeddings_path):
+            embeddings_path = gallery_path(self.faces_dir)
+            has_gallery = store_exists(embeddings_path) or os.path.exists(legacy_pickle_path(self.faces_dir))
+            if self.recognizer is None and os.path.exists(self.faces_dir) and has_gallery:
                 self.recognizer = FaceRecognizer(
                     faces_dir=self.faces_dir,
                     threshold=CONFIG.recognition_threshold,
-                    min_margin=CONFIG.recognition_min_margin
+                    min_margin=CONFIG.recognition_min_margin,
+                    index=CONFIG.gallery_index,
+                    index_options=_gallery_index_options(),
                 )
-                known_count = len(self.recognizer.known_faces)
+                known_count = len(self.recognizer.known_names)
                 logger.info(f"Recognizer loaded with {known_count} known identities")
                 self.add_log(
                     "Face recognizer loaded",
@@ -308,6 +535,23 @@ class StreamState:
                     component="behavior_classifier",
                     expected_path=self.behavior_model_path,
                 )
+
+            if CONFIG.inference_broker_enabled and self.inference_broker is None:
+                self.inference_broker = InferenceBroker(
+                    max_batch=CONFIG.inference_max_batch,
+                    max_wait_ms=CONFIG.inference_max_wait_ms,
+                ).start()
+                self.add_log(
+                    "Inference broker started",
+                    "system",
+                    component="inference_broker",
+                    max_batch=CONFIG.inference_max_batch,
+                    max_wait_ms=CONFIG.inference_max_wait_ms,
+                )
+            if self.inference_broker is not None:
+                # Models may load on a later call (e.g. embeddings built after startup).
+                self.inference_broker.behavior_classifier = self.behavior_classifier
+                self.inference_broker.recognizer = self.recognizer
         except Exception as e:
             logger.error(f"Error loading models: {e}")
             self.add_log("Error loading models", "error", error=str(e))
@@ -339,11 +583,16 @@ class StreamState:
                     self.behavior_classifier = candidate
                     self.behavior_model_valid = valid
                     self.behavior_model_classes = loaded
-                    # Update active monitor/frontend processor if running
-                    if self.active_monitor and hasattr(self.active_monitor, "track_manager"):
-                        self.active_monitor.track_manager.behavior_classifier = candidate
-                    if self.frontend_processor and hasattr(self.frontend_processor, "track_manager"):
-                        self.frontend_processor.track_manager.behavior_classifier = candidate
+                    sessions = list(self.sessions.values())
+                    if self.inference_broker is not None:
+                        self.inference_broker.behavior_classifier = candidate
+                # Update active monitors/frontend processors of every running stream
+                for session in sessions:
+                    with session.lock:
+                        if session.active_monitor and hasattr(session.active_monitor, "track_manager"):
+                            session.active_monitor.track_manager.behavior_classifier = candidate
+                        if session.frontend_processor and hasattr(session.frontend_processor, "track_manager"):
+                            session.frontend_processor.track_manager.behavior_classifier = candidate
                 self.add_log("Behavior classifier reloaded", "system", path=path)
                 return True
             self.add_log("Behavior model rejected: incompatible classes", "error", missing=missing)
@@ -353,159 +602,163 @@ class StreamState:
             return False
 
 
-class FrontendWebcamProcessor:
-    """
-    Processes browser-sent webcam frames through the same core
-    detection/tracking/recognition/behavior flow used by live/upload streams.
-    """
-    def __init__(
-        self,
-        detector,
-        recognizer=None,
-        behavior_classifier=None,
-        detect_interval=1,
-        recheck_interval=1.5,
-        behavior_interval=1.0,
-        processing_width=960,
-        event_callback=None,
-        min_recognition_face_size=0,
-        min_recognition_face_score=0.0,
-        behavior_max_batch=None,
-    ):
-        self.detector = detector
-        self.recognizer = recognizer
-        self.behavior_classifier = behavior_classifier
-        self.detect_interval = max(1, int(detect_interval))
-        self.processing_width = processing_width
-        self.event_callback = event_callback
-        self.global_frame_index = 0
-        self.last_detections = sv.Detections.empty()
-        self.frame_width = None
-        self.frame_height = None
-
-        # P1: version-safe ByteTrack construction
-        try:
-            self.tracker = sv.ByteTrack(
-                frame_rate=30,
-                track_activation_threshold=0.5,
-                lost_track_buffer=90,
+    def reload_gallery(self, build: bool = False):
+        """
+        Pick up embedding store changes without a restart. build=True first runs the
+        incremental build over faces_dir (only new or changed images are embedded, reusing
+        the recognizer's models in-process). The new index is built on the calling thread
+        while running streams keep matching against the current one, then swapped in.
+        Returns the build's per-student quality report (None when build=False).
+        """
+        with self.gallery_lock:
+            report = None
+            if build:
+                app_models = self.recognizer.app if self.recognizer is not None else None
+                report = build_database(self.faces_dir, workers=1, app=app_models)
+            if self.recognizer is None:
+                self.load_models()
+                recognizer = self.recognizer
+                if recognizer is None:
+                    return report
+                # Streams started without a gallery get the new recognizer.
+                for session in self.list_sessions():
+                    with session.lock:
+                        for processor in (session.active_monitor, session.frontend_processor):
+                            if processor is not None and getattr(processor, "recognizer", False) is None:
+                                processor.recognizer = recognizer
+            elif not self.recognizer.reload_database():
+                return report
+
+            recognizer = self.recognizer
+            for session in self.list_sessions():
+                with session.lock:
+                    worker = session.worker
+                if worker is not None:
+                    worker.set_gallery_generation(recognizer.generation)
+            self.add_log(
+                "Face gallery reloaded",
+                "system",
+                component="recognizer",
+                generation=recognizer.generation,
+                known_identities=len(recognizer.known_names),
             )
-        except TypeError:
-            self.tracker = sv.ByteTrack()
-        self.track_manager = TrackManager(
-            recheck_interval=recheck_interval,
-            behavior_classifier=behavior_classifier,
-            behavior_interval=behavior_interval,
-            max_behavior_batch=behavior_max_batch,
-            min_recognition_face_size=min_recognition_face_size,
-            min_recognition_face_score=min_recognition_face_score,
+            return report
+
+    def _rebuild_gallery(self):
+        """reload_gallery(build=True) that raises unless a new store generation was loaded."""
+        before = self.recognizer.generation if self.recognizer is not None else 0
+        report = self.reload_gallery(build=True)
+        if self.recognizer is None or self.recognizer.generation <= before:
+            raise RuntimeError("Face gallery was not updated")
+        return report
+
+    def _set_aside(self, student_dir: str) -> str:
+        """Move student_dir into a fresh directory under upload_dir and return the backup path."""
+        backup = os.path.join(
+            tempfile.mkdtemp(prefix="gallery_backup_", dir=CONFIG.upload_dir), os.path.basename(student_dir)
         )
+        shutil.move(student_dir, backup)
+        return backup
+
+    def enroll_student(self, student_dir: str, staged_paths, replace: bool = False):
+        """
+        Check staged uploads for a usable face, then move the usable ones into student_dir
+        and rebuild. Nothing in faces_dir or the gallery changes unless at least one new
+        image has a face; with replace=True the previous images are set aside until the new
+        generation is live. If the build fails the folder is restored and the error raised.
+        Returns (per-upload checks, build report or None).
+        """
+        with self.gallery_lock:
+            app_models = self.recognizer.app if self.recognizer is not None else None
+            checks = check_images(staged_paths, app=app_models)
+            usable = [path for path, (status, _) in zip(staged_paths, checks) if status == "ok"]
+            if not usable:
+                return checks, None
+
+            backup = self._set_aside(student_dir) if replace and os.path.isdir(student_dir) else None
+            os.makedirs(student_dir, exist_ok=True)
+            moved = []
+            try:
+                for path in usable:
+                    target = os.path.join(student_dir, os.path.basename(path))
+                    shutil.move(path, target)
+                    moved.append(target)
+                report = self._rebuild_gallery()
+            except Exception:
+                for path in moved:
+                    if os.path.exists(path):
+                        os.remove(path)
+                if backup is not None:
+                    shutil.rmtree(student_dir, ignore_errors=True)
+                    shutil.move(backup, student_dir)
+                    shutil.rmtree(os.path.dirname(backup), ignore_errors=True)
+                elif os.path.isdir(student_dir) and not os.listdir(student_dir):
+                    os.rmdir(student_dir)
+                raise
+            if backup is not None:
+                shutil.rmtree(os.path.dirname(backup), ignore_errors=True)
+            return checks, report
+
+    def remove_student(self, student_dir: str) -> bool:
+        """
+        Drop a student's images and rebuild. The folder is set aside rather than deleted
+        until the new generation is live, and restored if the build fails (the error is
+        raised). Returns False if the student has no folder.
+        """
+        with self.gallery_lock:
+            if not os.path.isdir(student_dir):
+                return False
+            backup = self._set_aside(student_dir)
+            try:
+                self._rebuild_gallery()
+            except Exception:
+                shutil.move(backup, student_dir)
+                shutil.rmtree(os.path.dirname(backup), ignore_errors=True)
+                raise
+            shutil.rmtree(os.path.dirname(backup), ignore_errors=True)
+            return True
 
-    def _ensure_input_size(self, frame):
-        if self.frame_width is not None and self.frame_height is not None:
-            return
-        h, w = frame.shape[:2]
-        if w <= 0 or h <= 0:
-            return
-        aspect_ratio = h / w
-        self.frame_width = int(self.processing_width)
-        self.frame_height = max(1, int(self.frame_width * aspect_ratio))
-        self.detector.set_input_size(self.frame_width, self.frame_height)
-
-    def process_frame(self, frame):
-        if frame is None or frame.size == 0:
-            return 0, None
-
-        self._ensure_input_size(frame)
-        frame = cv.resize(frame, (self.frame_width, self.frame_height))
-        self.global_frame_index += 1
-
-        faces = []
-        if self.global_frame_index % self.detect_interval == 0:
-            faces = self.detector.detect(frame)
-
-        if len(faces) > 0:
-            xywh = faces[:, :4]
-            conf = faces[:, -1]
-            x = xywh[:, 0]
-            y = xywh[:, 1]
-            w = xywh[:, 2]
-            h = xywh[:, 3]
-            xyxy = np.stack([x, y, x + w, y + h], axis=1)
-            detections = sv.Detections(
-                xyxy=xyxy,
-                confidence=conf,
-                class_id=np.zeros(len(faces), dtype=int),
-            )
-        else:
-            detections = sv.Detections.empty()
 
-        if self.global_frame_index % self.detect_interval == 0:
-            detections = self.tracker.update_with_detections(detections)
-            self.last_detections = detections
-        else:
-            detections = self.last_detections
+state = StreamState()
 
-        if self.recognizer or self.behavior_classifier:
-            self.track_manager.process_batch(frame, detections, faces, self.recognizer, profiler=None)
 
-        for i in range(len(detections)):
-            track_id = int(detections.tracker_id[i]) if detections.tracker_id is not None else -1
-            if track_id == -1:
-                continue
+def _resolve_stream_id(raw: Optional[str]) -> str:
+    stream_id = (raw or "").strip() or DEFAULT_STREAM_ID
+    if not _STREAM_ID_RE.match(stream_id):
+        raise HTTPException(status_code=400, detail="Invalid stream_id (use 1-64 of A-Z a-z 0-9 _ . -)")
+    return stream_id
 
-            meta = self.track_manager.get_metadata().get(track_id)
-            if not meta:
-                continue
-            current_b = meta.get("behavior", "negative")
-            last_logged_b = meta.get("last_logged_behavior")
-            last_logged_t = meta.get("last_logged_time", 0.0)
-            current_time = time.time()
-
-            should_log = current_b != last_logged_b or (current_time - last_logged_t) > 10.0
-            if should_log and current_b != "negative":
-                crop_path = meta.get("last_crop_path", "")
-                event_id = ""
-                if crop_path and _self_learning_enabled():
-                    event_id = add_training_sample(
-                        crop_path=crop_path,
-                        predicted=current_b,
-                        confidence=meta.get("behavior_conf", 0.0),
-                        tracker_id=track_id,
-                        name=meta.get("name", "Unknown"),
-                        source="logged",
-                    )
-                log_event(
-                    tracker_id=track_id,
-                    name=meta.get("name", "Unknown"),
-                    behavior=current_b,
-                    confidence=meta.get("behavior_conf", 0.0),
-                )
-                meta["last_logged_behavior"] = current_b
-                meta["last_logged_time"] = current_time
-                if self.event_callback:
-                    self.event_callback(
-                        {
-                            "track_id": track_id,
-                            "name": meta.get("name", "Unknown"),
-                            "behavior": current_b,
-                            "confidence": float(meta.get("behavior_conf", 0.0)),
-                            "event_id": event_id or None,
-                        }
-                    )
 
-        track_metadata = self.track_manager.get_metadata()
-        active_names = resolve_duplicate_ids(detections, track_metadata)
-        annotated = draw_tracking_results(frame.copy(), detections, track_metadata, active_names)
-        return int(len(detections)), annotated
+def _camera_id(stream_id: str) -> str:
+    # Keep the historical camera id for the default stream so stored events stay comparable.
+    return "cam_01" if stream_id == DEFAULT_STREAM_ID else stream_id
 
-state = StreamState()
 
+def _cleanup_upload(source_type, upload_path, context: str = ""):
+    if CONFIG.cleanup_uploads and source_type == "upload" and upload_path and os.path.exists(upload_path):
+        try:
+            os.remove(upload_path)
+        except Exception as e:
+            logger.warning(f"Failed to cleanup upload file{context} {upload_path}: {e}")
 
-def _build_session_snapshot() -> Union[dict, None]:
-    """Build a report snapshot from in-memory event buffer. Returns None if no events."""
-    with state.lock:
-        events = list(state.event_buffer)
+
+def _stop_session(session: StreamSession, context: str = ""):
+    """Detach and tear down a stream. Blocks while workers/threads join: call it off the event loop."""
+    active_monitor, worker, active_upload_path, source_type = session.detach()
+    try:
+        if active_monitor is not None:
+            active_monitor.release()
+        if worker is not None:
+            worker.release()
+    except Exception:
+        pass
+    _cleanup_upload(source_type, active_upload_path, context)
+
+
+def _build_session_snapshot(session: StreamSession) -> Union[dict, None]:
+    """Build a report snapshot from the stream's in-memory event buffer. Returns None if no events."""
+    with session.lock:
+        events = list(session.event_buffer)
     if not events:
         return None
 
@@ -542,6 +795,7 @@ def _build_session_snapshot() -> Union[dict, None]:
 
     return {
         "filename": filename,
+        "stream_id": session.stream_id,
         "total_students": len(students),
         "total_events": total_events,
         "session_start": session_start,
@@ -549,8 +803,8 @@ def _build_session_snapshot() -> Union[dict, None]:
     }
 
 
-def _on_detection_event(event):
-    state.add_event(
+def _on_detection_event(session: StreamSession, event):
+    session.add_event(
         name=event.get("name", "Unknown"),
         behavior=event.get("behavior", "negative"),
         confidence=event.get("confidence", 0.0),
@@ -560,12 +814,176 @@ def _on_detection_event(event):
     state.add_log(
         "Detection updated",
         "detection",
+        stream_id=session.stream_id,
         student_id=event.get("name", "Unknown"),
         tracker_id=event.get("track_id"),
         behavior=event.get("behavior", "negative"),
         confidence=event.get("confidence", 0.0),
     )
 
+
+
+def _motion_gate_kwargs() -> Optional[dict]:
+    if not CONFIG.motion_gate:
+        return None
+    return {
+        "threshold": CONFIG.motion_threshold,
+        "pixel_delta": CONFIG.motion_pixel_delta,
+        "max_skip": CONFIG.motion_max_skip,
+    }
+
+
+def _motion_gate() -> Optional[MotionGate]:
+    """A fresh per-stream MotionGate when MOTION_GATE is on."""
+    kwargs = _motion_gate_kwargs()
+    return MotionGate(**kwargs) if kwargs else None
+
+
+def _gallery_index_options() -> dict:
+    if CONFIG.gallery_index != "ivf":
+        return {}
+    return {"n_lists": CONFIG.gallery_ivf_lists or None, "n_probe": CONFIG.gallery_ivf_probe}
+
+
+def _detector_kwargs() -> dict:
+    return {
+        "model_path": state.model_path,
+        "conf_threshold": CONFIG.detector_conf_threshold,
+        "nms_threshold": CONFIG.detector_nms_threshold,
+        "backend": CONFIG.detector_backend,
+        "intra_op_threads": CONFIG.detector_intra_op_threads,
+        "inter_op_threads": CONFIG.detector_inter_op_threads,
+    }
+
+
+def _track_predictor_kwargs() -> Optional[dict]:
+    if not CONFIG.track_prediction:
+        return None
+    return {"max_horizon": CONFIG.track_prediction_horizon}
+
+
+def _track_predictor() -> Optional[TrackPredictor]:
+    """A fresh per-stream TrackPredictor when TRACK_PREDICTION is on."""
+    kwargs = _track_predictor_kwargs()
+    return TrackPredictor(**kwargs) if kwargs else None
+
+
+def _tiled_detection_kwargs() -> Optional[dict]:
+    if not CONFIG.tiled_detection or not CONFIG.detection_tiles:
+        return None
+    return {
+        "regions": CONFIG.detection_tiles,
+        "tile_scale": CONFIG.detection_tile_scale,
+        "tile_size": CONFIG.detection_tile_size,
+        "workers": CONFIG.detection_tile_workers,
+        "nms_threshold": CONFIG.detector_nms_threshold,
+    }
+
+
+def _face_detector():
+    """
+    A stream's face detector: a handle on the shared DetectorPool, wrapped in a
+    per-stream TiledFaceDetector (whose tiles also draw from the pool) when
+    TILED_DETECTION is on.
+    """
+    pool = state.detector_pool
+    kwargs = _tiled_detection_kwargs()
+    if not kwargs:
+        return pool.detector()
+    return TiledFaceDetector(pool.detector(), pool.detector, **kwargs)
+
+
+def _viewers_idle(*hubs) -> bool:
+    """True when none of the given hubs has had a subscriber for STREAM_IDLE_SECONDS."""
+    hubs = [hub for hub in hubs if hub is not None]
+    if CONFIG.stream_idle_seconds <= 0 or not hubs:
+        return False
+    return all(hub.idle_seconds() > CONFIG.stream_idle_seconds for hub in hubs)
+
+
+def _publish_result(session: StreamSession, result_hub: Optional[FrameHub], result: dict):
+    """Publish a processed frame's count and overlay metadata for /overlay/stream and /ws/frontend."""
+    if result_hub is None:
+        return
+    received_at = result.get("received_at")
+    result_hub.publish({
+        "type": "result",
+        "frame_id": result.get("frame_id"),
+        "captured_at": received_at,
+        "overlay": session.overlay_mode,
+        "active_students": int(result["count"]),
+        "lag_ms": round((time.time() - received_at) * 1000.0, 1) if received_at else None,
+        "frame_size": result.get("frame_size"),
+        "tracks": result.get("tracks") or [],
+    })
+
+
+def _on_frontend_result(session: StreamSession, hub: FrameHub, result_hub: FrameHub, result: dict):
+    if result["frame"] is not None:
+        hub.publish(VideoFrame(result["frame_id"], result["received_at"], image=result["frame"]))
+    session.record_frame(result["count"], captured_at=result["received_at"])
+    _publish_result(session, result_hub, result)
+
+
+def _on_worker_message(session: StreamSession, kind, *payload):
+    """Replay a stream worker's messages into the API process state."""
+    if kind == "event":
+        _on_detection_event(session, payload[0])
+    elif kind == "log":
+        message, level, details = payload
+        state.add_log(message, level, stream_id=session.stream_id, **details)
+    elif kind == "frame":
+        frame = payload[0]
+        session.record_frame(frame["count"], captured_at=frame["captured_at"])
+        with session.lock:
+            result_hub = session.result_hub
+        _publish_result(session, result_hub, {**frame, "received_at": frame["captured_at"]})
+
+
+def _start_stream_worker(session: StreamSession, source, source_type: str) -> StreamWorkerProcess:
+    """Spawn a worker process that loads its own models and runs this stream."""
+    spec = {
+        "source": source,
+        "source_type": source_type,
+        "camera_id": _camera_id(session.stream_id),
+        "detector": _detector_kwargs(),
+        # Only hand over models the API process managed to load (and validate).
+        "faces_dir": state.faces_dir if state.recognizer is not None else None,
+        # Lets a worker started without a gallery load one once the API publishes a generation.
+        "gallery_dir": state.faces_dir,
+        "recognition_threshold": CONFIG.recognition_threshold,
+        "recognition_min_margin": CONFIG.recognition_min_margin,
+        "gallery_index": CONFIG.gallery_index,
+        "gallery_index_options": _gallery_index_options(),
+        "behavior_model_path": state.behavior_model_path if state.behavior_classifier is not None else None,
+        "behavior_interval": CONFIG.behavior_interval,
+        "detect_interval": CONFIG.detect_interval,
+        "recheck_interval": CONFIG.recheck_interval,
+        "processing_width": CONFIG.processing_width,
+        "min_recognition_face_size": CONFIG.min_recognition_face_size,
+        "min_recognition_face_score": CONFIG.min_recognition_face_score,
+        "behavior_max_batch": CONFIG.behavior_max_batch,
+        "capture_queue_size": CONFIG.capture_queue_size,
+        "capture_drop_policy": CONFIG.capture_drop_policy,
+        "read_retry_count": CONFIG.read_retry_count,
+        "read_retry_interval": CONFIG.read_retry_interval,
+        "draw_overlays": session.overlay_mode == "server",
+        # On a variant step, so viewers at the default quality reuse the worker's bytes as-is.
+        "jpeg_quality": quantize_quality(CONFIG.output_jpeg_quality),
+        "motion_gate": _motion_gate_kwargs(),
+        "tiled_detection": _tiled_detection_kwargs(),
+        "track_prediction": _track_predictor_kwargs(),
+    }
+    return StreamWorkerProcess(
+        session.stream_id,
+        spec,
+        on_message=partial(_on_worker_message, session),
+        ring_slots=CONFIG.shm_ring_slots,
+        max_frame_bytes=CONFIG.shm_max_frame_bytes,
+        max_jpeg_bytes=CONFIG.shm_max_jpeg_bytes,
+    ).start()
+
+
 @app.on_event("startup")
 async def startup_event():
     workers = _env_int("WEB_CONCURRENCY", _env_int("UVICORN_WORKERS", 1))
@@ -579,18 +997,33 @@ async def startup_event():
 @app.post("/start_stream")
 async def start_stream(
     type: str = Form(...), 
-    file: UploadFile = File(None)
+    file: UploadFile = File(None),
+    stream_id: str = Form(DEFAULT_STREAM_ID),
+    overlay: str = Form(""),
+    headless: Optional[bool] = Form(None),
 ):
     """
     Configures the stream source.
     type: 'live' or 'upload' or 'frontend'
     file: The video file if type is 'upload'
+    stream_id: camera/session id; each id runs independently with shared models
+    overlay: 'server' (annotated video) or 'client' (raw video + /overlay/stream); defaults to OVERLAY_MODE
+    headless: process without waiting for a viewer and keep going when none is left; defaults to HEADLESS_STREAMS
     """
+    stream_id = _resolve_stream_id(stream_id)
+    overlay = (overlay or CONFIG.overlay_mode).strip().lower()
+    if overlay not in OVERLAY_MODES:
+        raise HTTPException(status_code=400, detail="Invalid overlay (use 'server' or 'client')")
+    if CONFIG.max_streams > 0 and state.running_count(exclude=stream_id) >= CONFIG.max_streams:
+        raise HTTPException(status_code=429, detail=f"Stream limit reached (MAX_STREAMS={CONFIG.max_streams})")
     state.load_models()
-    with state.lock:
-        # Invalidate any existing stream session.
-        state.stop_requested = True
-        state.stream_token += 1
+    session = state.get_session(stream_id, create=True)
+    with session.lock:
+        # Invalidate any existing session on this stream id.
+        session.stop_requested = True
+        session.stream_token += 1
+        session.overlay_mode = overlay
+        session.headless = CONFIG.headless_streams if headless is None else bool(headless)
     
     if type == 'upload':
         if not file:
@@ -602,309 +1035,485 @@ async def start_stream(
         with open(file_path, "wb+") as f:
             shutil.copyfileobj(file.file, f)
         
-        with state.lock:
-            state.source = file_path
-            state.active_source_type = "upload"
-            state.active_upload_path = file_path
-        logger.info(f"Stream configured for upload: {file_path}")
-        state.add_log("Upload stream configured", "system", source_type="upload", filename=safe_name)
+        with session.lock:
+            session.source = file_path
+            session.active_source_type = "upload"
+            session.active_upload_path = file_path
+        logger.info(f"Stream {stream_id} configured for upload: {file_path}")
+        state.add_log("Upload stream configured", "system", stream_id=stream_id, source_type="upload", filename=safe_name)
         
     elif type == 'live':
         live_source = CONFIG.camera_rtsp_url if CONFIG.camera_rtsp_url else 0
-        with state.lock:
-            state.source = live_source
-            state.active_source_type = "live"
-            state.active_upload_path = None
-        logger.info(f"Stream configured for live camera: {live_source}")
-        state.add_log("Live camera stream configured", "system", source_type="live")
+        with session.lock:
+            session.source = live_source
+            session.active_source_type = "live"
+            session.active_upload_path = None
+        logger.info(f"Stream {stream_id} configured for live camera: {live_source}")
+        state.add_log("Live camera stream configured", "system", stream_id=stream_id, source_type="live")
+
+    elif type == "frontend" and CONFIG.stream_workers == "process":
+        # Replace any worker still running for this stream id.
+        await asyncio.to_thread(_stop_session, session)
+        worker = _start_stream_worker(session, None, "frontend")
+        with session.lock:
+            session.source = None
+            session.worker = worker
+            session.result_hub = FrameHub()
+            session.active_source_type = "frontend"
+            session.active_upload_path = None
+            session.is_running = True
+            session.active_count = 0
+        session.mark_started()
+        logger.info(f"Stream {stream_id} configured for browser webcam ingestion (worker process)")
+        state.add_log(
+            "Frontend webcam stream configured", "system", stream_id=stream_id, source_type="frontend", worker="process"
+        )
 
     elif type == "frontend":
+        # Frames from the ingest thread are published here for /video_feed viewers.
+        hub = FrameHub()
+        result_hub = FrameHub()
         processor = FrontendWebcamProcessor(
-            detector=state.detector,
+            detector=_face_detector(),
             recognizer=state.recognizer,
             behavior_classifier=state.behavior_classifier,
             detect_interval=CONFIG.detect_interval,
             recheck_interval=CONFIG.recheck_interval,
             behavior_interval=CONFIG.behavior_interval,
             processing_width=CONFIG.processing_width,
-            event_callback=_on_detection_event,
+            event_callback=partial(_on_detection_event, session),
             min_recognition_face_size=CONFIG.min_recognition_face_size,
             min_recognition_face_score=CONFIG.min_recognition_face_score,
             behavior_max_batch=CONFIG.behavior_max_batch,
+            camera_id=_camera_id(stream_id),
+            inference_broker=state.inference_broker,
+            draw_overlays=overlay == "server",
+            should_render=hub.wants_frame,
+            motion_gate=_motion_gate(),
+            track_predictor=_track_predictor(),
         )
-        with state.lock:
-            state.source = None
-            state.frontend_processor = processor
-            state.active_source_type = "frontend"
-            state.active_upload_path = None
-            state.is_running = True
-            state.active_count = 0
-        logger.info("Stream configured for browser webcam ingestion")
-        state.add_log("Frontend webcam stream configured", "system", source_type="frontend")
+        ingest = FrontendIngestWorker(
+            processor,
+            on_result=partial(_on_frontend_result, session, hub, result_hub),
+            name=f"frontend-ingest-{stream_id}",
+        ).start()
+        with session.lock:
+            old_hub = session.hub
+            old_result_hub = session.result_hub
+            old_ingest = session.frontend_ingest
+            session.source = None
+            session.frontend_processor = processor
+            session.frontend_ingest = ingest
+            session.hub = hub
+            session.result_hub = result_hub
+            session.producer_token = session.stream_token
+            session.active_source_type = "frontend"
+            session.active_upload_path = None
+            session.is_running = True
+            session.active_count = 0
+        if old_hub is not None:
+            old_hub.close()
+        if old_result_hub is not None:
+            old_result_hub.close()
+        if old_ingest is not None:
+            old_ingest.stop()
+        session.mark_started()
+        logger.info(f"Stream {stream_id} configured for browser webcam ingestion")
+        state.add_log("Frontend webcam stream configured", "system", stream_id=stream_id, source_type="frontend")
         
     else:
         raise HTTPException(status_code=400, detail="Invalid type")
 
-    with state.lock:
+    with session.lock:
         # Allow the new session to start.
-        state.stop_requested = False
-    state.add_log("Stream start requested", "system", stream_type=type)
-    return {"status": "configured", "type": type}
+        session.stop_requested = False
+    if session.headless and type != "frontend":
+        # Nobody may ever open /video_feed for this stream; start processing now.
+        _ensure_producer(session)
+    state.add_log("Stream start requested", "system", stream_id=stream_id, stream_type=type)
+    return {"status": "configured", "type": type, "stream_id": stream_id, "overlay": overlay}
 
 @app.post("/stop_stream")
-async def stop_stream():
+async def stop_stream(stream_id: str = DEFAULT_STREAM_ID):
     """
-    Signals currently running stream loop to stop.
+    Signals the stream loop for stream_id to stop.
     """
-    with state.lock:
-        state.stop_requested = True
-        state.stream_token += 1
-        state.is_running = False
-        state.active_count = 0
-        state.frontend_last_jpeg = None
-        active_monitor = state.active_monitor
-        state.frontend_processor = None
-        active_upload_path = state.active_upload_path
-        source_type = state.active_source_type
-        state.active_monitor = None
-        state.source = None
-        state.active_source_type = None
-        state.active_upload_path = None
-    try:
-        if active_monitor is not None and active_monitor.cap:
-            active_monitor.cap.release()
-    except Exception:
-        pass
-    if CONFIG.cleanup_uploads and source_type == "upload" and active_upload_path and os.path.exists(active_upload_path):
-        try:
-            os.remove(active_upload_path)
-        except Exception as e:
-            logger.warning(f"Failed to cleanup upload file {active_upload_path}: {e}")
-    state.add_log("Stream stop requested", "system")
-    return {"status": "stopping"}
+    stream_id = _resolve_stream_id(stream_id)
+    session = state.get_session(stream_id)
+    if session is not None:
+        # Joining a worker process or capture thread can take seconds; keep it off the event loop.
+        await asyncio.to_thread(_stop_session, session)
+    state.add_log("Stream stop requested", "system", stream_id=stream_id)
+    return {"status": "stopping", "stream_id": stream_id}
 
 @app.post("/reset_data")
 async def reset_data():
     """
-    Stop active stream (if any), clear MongoDB classroom events, and clear in-memory logs.
+    Stop all active streams, clear MongoDB classroom events, and clear in-memory logs.
     """
-    with state.lock:
-        state.stop_requested = True
-        state.stream_token += 1
-        state.is_running = False
-        state.active_count = 0
-        state.frontend_last_jpeg = None
-        active_monitor = state.active_monitor
-        state.frontend_processor = None
-        active_upload_path = state.active_upload_path
-        source_type = state.active_source_type
-        state.active_monitor = None
-        state.source = None
-        state.active_source_type = None
-        state.active_upload_path = None
-    try:
-        if active_monitor is not None and active_monitor.cap:
-            active_monitor.cap.release()
-    except Exception:
-        pass
-    if CONFIG.cleanup_uploads and source_type == "upload" and active_upload_path and os.path.exists(active_upload_path):
-        try:
-            os.remove(active_upload_path)
-        except Exception as e:
-            logger.warning(f"Failed to cleanup upload file during reset {active_upload_path}: {e}")
+    await asyncio.gather(
+        *(asyncio.to_thread(_stop_session, session, " during reset") for session in state.list_sessions())
+    )
 
     deleted = clear_classroom_events()
     with state.lock:
         state.log_buffer.clear()
         # Reset sequence so a fresh run starts from clean log IDs.
         state.log_sequence = 0
-        state.event_buffer.clear()
-        state.event_sequence = 0
+        state.sessions.clear()
     return {"status": "ok", "mongodb_deleted": deleted}
 
-def generate_frames():
+def _maybe_snapshot(session: StreamSession, last_snapshot_at: float) -> float:
+    """Periodic session snapshot (if SESSION_SNAPSHOT_INTERVAL > 0); returns the new timestamp."""
+    if CONFIG.session_snapshot_interval <= 0:
+        return last_snapshot_at
+    now_t = time.time()
+    if (now_t - last_snapshot_at) < CONFIG.session_snapshot_interval:
+        return last_snapshot_at
+    snapshot = _build_session_snapshot(session)
+    if snapshot:
+        try:
+            save_report(snapshot)
+            logger.info("Session snapshot saved (stream=%s)", session.stream_id)
+        except Exception as snap_err:
+            logger.warning(f"Session snapshot failed: {snap_err}")
+    return now_t
+
+
+def _should_stop(
+    session: StreamSession, stream_token: int, hub: FrameHub, started_at: float, result_hub: Optional[FrameHub] = None
+) -> bool:
+    with session.lock:
+        stop_requested = session.stop_requested
+        token_changed = stream_token != session.stream_token
+        headless = session.headless
+    if stop_requested or token_changed:
+        logger.info("Stopping stream loop by request (stream=%s)", session.stream_id)
+        return True
+    if CONFIG.max_stream_seconds > 0 and (time.time() - started_at) > CONFIG.max_stream_seconds:
+        logger.info("Stopping stream loop due to MAX_STREAM_SECONDS (stream=%s)", session.stream_id)
+        return True
+    if not headless and _viewers_idle(hub, result_hub):
+        logger.info("Stopping stream loop: no viewers for %ss (stream=%s)", CONFIG.stream_idle_seconds, session.stream_id)
+        state.add_log("Stream stopped: no viewers", "system", stream_id=session.stream_id)
+        return True
+    return False
+
+
+def _finish_producer(session: StreamSession, stream_token: int, active_source_type, active_upload_path, hub: FrameHub):
+    """Common teardown for a producer loop: reset the session (if still ours), clean up, auto-save."""
+    hub.close()
+    result_hub = None
+    with session.lock:
+        # A restart on the same stream id has already reset the session; leave its new state alone.
+        if stream_token == session.stream_token:
+            result_hub = session.result_hub
+            session.result_hub = None
+            session.active_count = 0
+            session.is_running = False
+            session.active_monitor = None
+            session.active_pipeline = None
+            session.worker = None
+            session.frontend_processor = None
+            session.frontend_ingest = None
+            session.source = None
+            session.active_source_type = None
+            session.active_upload_path = None
+            session.stream_ended_flag = active_source_type != "frontend"
+    if result_hub is not None:
+        result_hub.close()
+    _cleanup_upload(active_source_type, active_upload_path)
+    if active_source_type != "frontend":
+        # Auto-save final report snapshot on stream end
+        try:
+            snapshot = _build_session_snapshot(session)
+            if snapshot:
+                save_report(snapshot)
+                logger.info("Auto-saved report on stream end (stream=%s)", session.stream_id)
+        except Exception as snap_err:
+            logger.warning(f"Auto-save report failed: {snap_err}")
+    state.add_log("Video stream stopped", "system", stream_id=session.stream_id)
+
+
+def _run_worker_producer(session: StreamSession, hub: FrameHub, stream_token: int):
     """
-    Generator that runs the monitor loop and yields JPEG frames.
+    Relay JPEG frames produced by the stream's worker process (STREAM_WORKERS=process).
+    Live/upload workers are spawned here; frontend workers by /start_stream.
     """
-    with state.lock:
-        local_source = state.source
-        stream_token = state.stream_token
-        active_source_type = state.active_source_type
-        active_upload_path = state.active_upload_path
+    stream_id = session.stream_id
+    with session.lock:
+        local_source = session.source
+        active_source_type = session.active_source_type
+        active_upload_path = session.active_upload_path
+        worker = session.worker
+        result_hub = session.result_hub
 
-    if active_source_type == "frontend":
-        try:
-            state.add_log("Video stream started", "system", source_type=active_source_type)
-            while True:
-                with state.lock:
-                    stop_requested = state.stop_requested
-                    token_changed = stream_token != state.stream_token
-                    frame_bytes = state.frontend_last_jpeg
-                if stop_requested or token_changed:
-                    break
-                if frame_bytes is not None:
-                    yield (
-                        b"--frame\r\n"
-                        b"Content-Type: image/jpeg\r\n\r\n" + frame_bytes + b"\r\n"
+    try:
+        if worker is None:
+            worker = _start_stream_worker(session, local_source, active_source_type)
+            with session.lock:
+                session.worker = worker
+                session.is_running = True
+            session.mark_started()
+        logger.info(f"Starting worker-process relay for stream {stream_id} source: {local_source}")
+        state.add_log(
+            "Video stream started", "system", stream_id=stream_id, source_type=active_source_type, worker="process"
+        )
+        started_at = time.time()
+        last_snapshot_at = time.time()
+        last_seq = 0
+
+        while not _should_stop(session, stream_token, hub, started_at, result_hub):
+            # The worker draws and encodes only as often as the current viewers take frames.
+            worker.set_render_interval(hub.render_interval())
+            latest = worker.wait_for_frame(after_seq=last_seq, timeout=0.25)
+            if latest is None:
+                if not worker.ended:
+                    continue
+                if worker.end_reason == "eof":
+                    logger.info("Video file finished (EOF): %s", local_source)
+                    state.add_log("Video finished", "system", stream_id=stream_id)
+                elif active_source_type != "frontend":
+                    state.add_log(
+                        "Stream ended (EOF or source error)",
+                        "warning",
+                        stream_id=stream_id,
+                        source=str(local_source),
                     )
-                else:
-                    time.sleep(0.03)
-        finally:
-            with state.lock:
-                state.active_count = 0
-                state.is_running = False
-                state.frontend_processor = None
-                state.source = None
-                state.active_source_type = None
-                state.active_upload_path = None
-                state.frontend_last_jpeg = None
-            state.add_log("Video stream stopped", "system")
-        return
+                break
+            last_seq, frame_bytes, captured_at, frame_id = latest
+            hub.publish(VideoFrame(
+                frame_id, captured_at, jpeg=frame_bytes, jpeg_quality=quantize_quality(CONFIG.output_jpeg_quality)
+            ))
+            last_snapshot_at = _maybe_snapshot(session, last_snapshot_at)
 
-    if local_source is None:
-        logger.warning("No source configured")
-        return
+    except Exception as e:
+        logger.error(f"Stream error ({stream_id}): {e}")
+        state.add_log("Streaming runtime error", "error", stream_id=stream_id, error=str(e))
+    finally:
+        if worker is not None:
+            worker.release()
+        _finish_producer(session, stream_token, active_source_type, active_upload_path, hub)
 
-    # Initialize Monitor
-    # We create a NEW monitor instance for each stream request to ensure clean state
-    # or we could manage a singleton if we wanted persistent tracking across reconnections,
-    # but for simplicity, new stream = new session.
-    
+
+def _run_stream_producer(session: StreamSession, hub: FrameHub, stream_token: int):
+    """
+    Run the monitor loop for one stream and publish JPEG frames to its hub
+    and their overlay metadata to the session's result hub.
+    """
+    stream_id = session.stream_id
+    with session.lock:
+        local_source = session.source
+        active_source_type = session.active_source_type
+        active_upload_path = session.active_upload_path
+        result_hub = session.result_hub
+        draw_overlays = session.overlay_mode == "server"
+
+    monitor = None
+    pipeline = None
     try:
         monitor = ClassroomMonitorStage2(
             input_source=local_source,
-            detector=state.detector,
+            detector=_face_detector(),
             recognizer=state.recognizer,
             behavior_classifier=state.behavior_classifier,
             behavior_interval=CONFIG.behavior_interval,
             detect_interval=CONFIG.detect_interval,
             recheck_interval=CONFIG.recheck_interval,
             processing_width=CONFIG.processing_width,
-            event_callback=_on_detection_event,
+            event_callback=partial(_on_detection_event, session),
             min_recognition_face_size=CONFIG.min_recognition_face_size,
             min_recognition_face_score=CONFIG.min_recognition_face_score,
             behavior_max_batch=CONFIG.behavior_max_batch,
+            camera_id=_camera_id(stream_id),
+            inference_broker=state.inference_broker,
+            draw_overlays=draw_overlays,
+            # Draw and encode only frames some viewer will receive.
+            should_render=hub.wants_frame,
+            motion_gate=_motion_gate(),
+            track_predictor=_track_predictor(),
+        )
+        with session.lock:
+            session.active_monitor = monitor
+            session.is_running = True
+        session.mark_started()
+
+        # Decode on a reader thread so it overlaps with inference. Live sources retry and
+        # reconnect inside the reader; uploads block instead of dropping frames.
+        is_upload = active_source_type == "upload"
+        reader = monitor.start_capture(
+            queue_size=CONFIG.capture_queue_size,
+            drop_policy="block" if is_upload else CONFIG.capture_drop_policy,
+            reconnect=not is_upload,
+            read_retry_count=CONFIG.read_retry_count,
+            read_retry_interval=CONFIG.read_retry_interval,
+            log_callback=partial(state.add_log, stream_id=stream_id),
+        )
+
+        if CONFIG.pipeline_enabled:
+            pipeline = monitor.build_pipeline(queue_size=CONFIG.pipeline_queue_size).start(source=reader)
+            with session.lock:
+                session.active_pipeline = pipeline
+
+        logger.info(f"Starting producer for stream {stream_id} source: {local_source}")
+        state.add_log(
+            "Video stream started",
+            "system",
+            stream_id=stream_id,
+            source_type=active_source_type,
+            pipelined=pipeline is not None,
         )
-        with state.lock:
-            state.active_monitor = monitor
-            state.is_running = True
-        
-        logger.info(f"Starting generator for source: {local_source}")
-        state.add_log("Video stream started", "system", source_type=active_source_type)
         started_at = time.time()
         last_snapshot_at = time.time()
 
-        while True:
-            with state.lock:
-                stop_requested = state.stop_requested
-                token_changed = stream_token != state.stream_token
-            if stop_requested or token_changed:
-                logger.info("Stopping stream loop by request")
-                break
-            if CONFIG.max_stream_seconds > 0 and (time.time() - started_at) > CONFIG.max_stream_seconds:
-                logger.info("Stopping stream loop due to MAX_STREAM_SECONDS")
-                break
-            # Read from monitor's cap (with retry for transient failures)
-            ret, frame = monitor.cap.read()
-            if not ret:
+        while not _should_stop(session, stream_token, hub, started_at, result_hub):
+            if pipeline is not None:
+                result = pipeline.get(timeout=0.5)
+                source_done = result is None and pipeline.drained
+            else:
+                result = monitor.read_frame(timeout=0.5)
+                source_done = result is None and reader.ended
+            if result is None:
+                if not source_done:
+                    continue
                 # For uploaded video files, EOF = end of video — stop immediately, no loop.
-                if active_source_type == "upload":
+                if reader.end_reason == "eof":
                     logger.info("Video file finished (EOF): %s", local_source)
-                    state.add_log("Video finished", "system")
-                    break
-
-                # For live sources (RTSP/webcam), retry then attempt reconnect.
-                for attempt in range(CONFIG.read_retry_count):
-                    time.sleep(CONFIG.read_retry_interval)
-                    ret, frame = monitor.cap.read()
-                    if ret:
-                        break
-                if not ret:
-                    # Reopen capture — handles connection drops for live streams
-                    time.sleep(1.0)
-                    try:
-                        monitor.cap.release()
-                        reopen_src = local_source
-                        if isinstance(local_source, str) and local_source.startswith("rtsp://"):
-                            reopen_src = local_source + ("&" if "?" in local_source else "?") + "rtsp_transport=tcp"
-                        monitor.cap = cv.VideoCapture(reopen_src, cv.CAP_FFMPEG)
-                        if monitor.cap.isOpened():
-                            ret, frame = monitor.cap.read()
-                            if ret:
-                                logger.info("Stream reconnected")
-                                state.add_log("Stream reconnected", "system")
-                    except Exception as e:
-                        logger.warning(f"Reconnect failed: {e}")
-                if not ret:
+                    state.add_log("Video finished", "system", stream_id=stream_id)
+                else:
                     logger.info("Stream ended (EOF or Error) source=%s", local_source)
-                    state.add_log("Stream ended (EOF or source error)", "warning", source=str(local_source))
-                    break
-                
-            # Process
-            processed_frame, count = monitor.process_frame(frame)
-            with state.lock:
-                state.active_count = count
-            
-            # Encode
-            ret, buffer = cv.imencode('.jpg', processed_frame)
-            frame_bytes = buffer.tobytes()
-            
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            
-            # Periodic session snapshot (if SESSION_SNAPSHOT_INTERVAL > 0)
-            if CONFIG.session_snapshot_interval > 0:
-                now_t = time.time()
-                if (now_t - last_snapshot_at) >= CONFIG.session_snapshot_interval:
-                    snapshot = _build_session_snapshot()
-                    if snapshot:
-                        try:
-                            save_report(snapshot)
-                            logger.info("Session snapshot saved")
-                        except Exception as snap_err:
-                            logger.warning(f"Session snapshot failed: {snap_err}")
-                    last_snapshot_at = now_t
+                    state.add_log(
+                        "Stream ended (EOF or source error)",
+                        "warning",
+                        stream_id=stream_id,
+                        source=str(local_source),
+                    )
+                break
+
+            if pipeline is not None:
+                # Processed by the pipeline stages.
+                count = result["count"]
+                rendered = result["frame"] if result["rendered"] else None
+                frame_id = result["frame_id"]
+                captured_at = result["captured_at"]
+                tracks = result["tracks"]
+                frame_size = [result["frame"].shape[1], result["frame"].shape[0]]
+            else:
+                # Process
+                processed_frame, count = monitor.process_frame(result.frame)
+                rendered = processed_frame if monitor.rendered else None
+                frame_id = result.frame_id
+                captured_at = result.captured_at
+                tracks = monitor.last_tracks
+                frame_size = [processed_frame.shape[1], processed_frame.shape[0]]
+            session.record_frame(count, captured_at=captured_at)
+            if rendered is not None:
+                # Encoded per viewer variant on demand (see generate_frames).
+                hub.publish(VideoFrame(frame_id, captured_at, image=rendered))
+            _publish_result(session, result_hub, {
+                "frame_id": frame_id,
+                "count": count,
+                "received_at": captured_at,
+                "tracks": tracks,
+                "frame_size": frame_size,
+            })
+            last_snapshot_at = _maybe_snapshot(session, last_snapshot_at)
 
     except Exception as e:
-        logger.error(f"Stream error: {e}")
-        state.add_log("Streaming runtime error", "error", error=str(e))
+        logger.error(f"Stream error ({stream_id}): {e}")
+        state.add_log("Streaming runtime error", "error", stream_id=stream_id, error=str(e))
     finally:
-        with state.lock:
-            state.active_count = 0
-            state.is_running = False
-            state.active_monitor = None
-            state.source = None
-            state.active_source_type = None
-            state.active_upload_path = None
-            state.stream_ended_flag = True
-        if 'monitor' in locals():
-            if monitor.cap:
-                monitor.cap.release()
+        if pipeline is not None:
+            pipeline.close()
+        if monitor is not None:
+            monitor.release()
             if hasattr(monitor, 'profiler') and monitor.profiler:
                 try:
                     monitor.profiler.save()
                 except Exception as e:
                     logger.warning(f"Profiler save failed: {e}")
-        if CONFIG.cleanup_uploads and active_source_type == "upload" and active_upload_path and os.path.exists(active_upload_path):
-            try:
-                os.remove(active_upload_path)
-            except Exception as e:
-                logger.warning(f"Failed to cleanup upload file {active_upload_path}: {e}")
-        # Auto-save final report snapshot on stream end
-        try:
-            snapshot = _build_session_snapshot()
-            if snapshot:
-                save_report(snapshot)
-                logger.info("Auto-saved report on stream end")
-        except Exception as snap_err:
-            logger.warning(f"Auto-save report failed: {snap_err}")
-        state.add_log("Video stream stopped", "system")
+        _finish_producer(session, stream_token, active_source_type, active_upload_path, hub)
+
+
+def _ensure_producer(session: StreamSession) -> Optional[FrameHub]:
+    """
+    Return the hub of the stream's processing loop, starting the loop on first use.
+    Later viewers attach to the same hub instead of opening the source again.
+    """
+    with session.lock:
+        if (
+            session.hub is not None
+            and not session.hub.closed
+            and session.producer_token == session.stream_token
+        ):
+            return session.hub
+        if session.active_source_type is None:
+            return None
+        if session.active_source_type != "frontend" and session.source is None:
+            return None
+        use_worker = CONFIG.stream_workers == "process"
+        if session.active_source_type == "frontend" and not use_worker:
+            # In-process frontend streams publish from /frontend_frame; there is no loop to start.
+            return None
+        hub = FrameHub()
+        if session.result_hub is None or session.result_hub.closed:
+            session.result_hub = FrameHub()
+        target = _run_worker_producer if use_worker else _run_stream_producer
+        producer = threading.Thread(
+            target=target,
+            args=(session, hub, session.stream_token),
+            name=f"stream-producer-{session.stream_id}",
+            daemon=True,
+        )
+        session.hub = hub
+        session.producer_token = session.stream_token
+    producer.start()
+    return hub
+
+
+async def generate_frames(session: StreamSession, output: AdaptiveOutput):
+    """
+    Async generator that yields one viewer's MJPEG frames for a stream.
+    Each frame is encoded in the viewer's variant (max width, quality) unless another
+    viewer already had it encoded; the time the socket takes to accept a part drives
+    the viewer's adaptive backoff.
+    """
+    hub = _ensure_producer(session)
+    if hub is None:
+        logger.warning("No source configured for stream %s", session.stream_id)
+        return
+    async for frame in hub.subscribe(viewer=output):
+        jpeg = frame.cached(output.max_width, output.quality)
+        if jpeg is None:
+            jpeg = await asyncio.to_thread(frame.encode, output.max_width, output.quality)
+            if jpeg is None:
+                continue
+        # X-Frame-Id pairs the image with its /overlay/stream metadata for clients that parse parts.
+        sent_at = time.monotonic()
+        yield (b'--frame\r\n'
+               b'Content-Type: image/jpeg\r\n'
+               b'X-Frame-Id: ' + str(frame.frame_id).encode() + b'\r\n\r\n' + jpeg + b'\r\n')
+        # Resumed once the server has handed the part to the socket (after any flow-control wait).
+        output.record_send(time.monotonic() - sent_at)
 
 @app.get("/video_feed")
-async def video_feed():
+async def video_feed(
+    stream_id: str = DEFAULT_STREAM_ID,
+    max_fps: float = 0.0,
+    max_width: int = 0,
+    quality: int = 0,
+    adaptive: bool = True,
+):
     """
     MJPEG Streaming Endpoint
+    max_fps: optional per-viewer output cap (0 = every new frame)
+    max_width: downscale frames wider than this (0 = processing resolution)
+    quality: JPEG quality 1-100 (0 = OUTPUT_JPEG_QUALITY)
+    adaptive: lower quality, then frame rate, while this viewer's connection is backed up
     """
+    session = state.get_session(_resolve_stream_id(stream_id))
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown stream_id")
     headers = {
         "Cache-Control": "no-cache, no-store, must-revalidate",
         "Pragma": "no-cache",
@@ -914,46 +1523,268 @@ async def video_feed():
         "X-Accel-Buffering": "no",
     }
     return StreamingResponse(
-        generate_frames(),
+        generate_frames(session, AdaptiveOutput(
+            max_fps=max(0.0, max_fps),
+            max_width=max(0, max_width),
+            quality=quality if quality > 0 else CONFIG.output_jpeg_quality,
+            adaptive=adaptive and CONFIG.adaptive_output,
+        )),
         media_type="multipart/x-mixed-replace; boundary=frame",
         headers=headers
     )
 
 
-@app.post("/frontend_frame")
-async def frontend_frame(file: UploadFile = File(...)):
+@app.get("/snapshot.jpg")
+async def snapshot(request: Request, stream_id: str = DEFAULT_STREAM_ID, width: int = 0, quality: int = 0):
     """
-    Accepts a browser webcam frame (JPEG) and runs one backend processing step.
-    Used when /start_stream type=frontend is active.
+    Latest frame of a stream as a single JPEG, for dashboards and thumbnail walls.
+    width: optional thumbnail width; each (width, quality) variant is encoded once per
+    frame and shared with every other snapshot and /video_feed viewer of that frame.
+    Supports If-None-Match (ETag changes with every new frame); X-Frame-Id and
+    X-Captured-At identify the frame. A frame older than SNAPSHOT_MAX_AGE triggers a
+    one-off render of the next one (waiting up to 2 s) instead of a full video stream.
     """
-    with state.lock:
-        processor = state.frontend_processor
-        source_type = state.active_source_type
-        is_running = state.is_running
+    session = state.get_session(_resolve_stream_id(stream_id))
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown stream_id")
+    hub = _ensure_producer(session)
+    with session.lock:
+        hub = hub or session.hub
+        token = session.producer_token
+    if hub is None:
+        raise HTTPException(status_code=409, detail="Stream is not running")
+
+    latest = hub.latest()
+    captured_at = latest[1].captured_at if latest is not None else None
+    if latest is None or captured_at is None or time.time() - captured_at > CONFIG.snapshot_max_age:
+        hub.request_frame()
+        fresh = await hub.next_frame(after_version=latest[0] if latest else 0, timeout=2.0)
+        latest = fresh or latest
+    else:
+        hub.touch()
+    if latest is None:
+        raise HTTPException(status_code=503, detail="No frame yet", headers={"Retry-After": "1"})
 
-    if source_type != "frontend" or processor is None or not is_running:
+    _, frame = latest
+    quality = quality if quality > 0 else CONFIG.output_jpeg_quality
+    etag = f'"{token}-{frame.frame_id}-{max(0, width)}-{quality}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "X-Frame-Id": str(frame.frame_id),
+    }
+    if frame.captured_at is not None:
+        headers["X-Captured-At"] = f"{frame.captured_at:.3f}"
+        headers["Last-Modified"] = formatdate(frame.captured_at, usegmt=True)
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    jpeg = frame.cached(width, quality)
+    if jpeg is None:
+        jpeg = await asyncio.to_thread(frame.encode, width, quality)
+    if jpeg is None:
+        raise HTTPException(status_code=500, detail="Frame encoding failed")
+    return Response(content=jpeg, media_type="image/jpeg", headers=headers)
+
+
+@app.post("/frontend_frame")
+async def frontend_frame(file: UploadFile = File(...), stream_id: str = Form(DEFAULT_STREAM_ID)):
+    """
+    Accepts a browser webcam frame (JPEG) and queues it for processing.
+    Used when /start_stream type=frontend is active for stream_id.
+
+    Returns immediately: decoding and inference run on the stream's ingest thread
+    (or worker process), and a frame still waiting there is replaced by this one.
+    active_students and lag_ms describe the most recently processed frame.
+    """
+    received_at = time.time()
+    session = state.get_session(_resolve_stream_id(stream_id))
+    if session is None:
+        raise HTTPException(status_code=409, detail="Frontend live mode is not active")
+    with session.lock:
+        ingest = session.frontend_ingest
+        worker = session.worker
+        hub = session.hub
+        result_hub = session.result_hub
+        source_type = session.active_source_type
+        is_running = session.is_running
+        headless = session.headless
+
+    if source_type != "frontend" or (ingest is None and worker is None) or not is_running:
+        raise HTTPException(status_code=409, detail="Frontend live mode is not active")
+    if ingest is not None and not headless and _viewers_idle(hub, result_hub):
+        # Same rule as producer loops: nobody has watched the preview for a while.
+        await asyncio.to_thread(_stop_session, session)
+        state.add_log("Stream stopped: no viewers", "system", stream_id=session.stream_id)
         raise HTTPException(status_code=409, detail="Frontend live mode is not active")
 
     payload = await file.read()
     if not payload:
         raise HTTPException(status_code=400, detail="Empty frame payload")
 
-    np_buf = np.frombuffer(payload, dtype=np.uint8)
-    frame = cv.imdecode(np_buf, cv.IMREAD_COLOR)
-    if frame is None:
-        raise HTTPException(status_code=400, detail="Invalid image payload")
-
-    count, annotated = processor.process_frame(frame)
-    if annotated is not None:
-        ok, buffer = cv.imencode(".jpg", annotated)
-        if ok:
-            with state.lock:
-                state.frontend_last_jpeg = buffer.tobytes()
-    with state.lock:
-        state.active_count = count
-        state.is_running = True
+    if worker is not None:
+        # The worker process decodes and picks the newest frame from shared memory.
+        try:
+            worker.submit_frame(payload, timestamp=received_at)
+        except ValueError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        replaced = False
+    else:
+        replaced = ingest.submit(payload, received_at=received_at)
+
+    with session.lock:
+        count = session.active_count
+        lag_ms = session.latency_ms
+    return {
+        "status": "ok",
+        "active_students": count,
+        "lag_ms": round(lag_ms, 1),
+        "replaced_pending": replaced,
+    }
+
+
+def _parse_ws_frames(data: bytes):
+    """Split one /ws/frontend binary message into (format, width, height, payload) frames."""
+    frames = []
+    offset = 0
+    while offset < len(data):
+        if len(data) - offset < _WS_FRAME_HEADER.size:
+            raise ValueError("Truncated frame header")
+        fmt, width, height, length = _WS_FRAME_HEADER.unpack_from(data, offset)
+        offset += _WS_FRAME_HEADER.size
+        if length == 0 or len(data) - offset < length:
+            raise ValueError("Truncated frame payload")
+        frames.append((fmt, width, height, data[offset:offset + length]))
+        offset += length
+    return frames
+
+
+def _ingest_formats():
+    """Pixel formats browsers may send. Grayscale only when the behavior model works on gray input anyway."""
+    formats = ["jpeg", "bgr"]
+    classifier = state.behavior_classifier
+    if classifier is not None and getattr(classifier, "grayscale", False):
+        formats.append("gray")
+    return formats
+
+
+def _ws_frame_payload(fmt: int, width: int, height: int, payload: bytes):
+    """JPEG bytes are passed through for the ingest thread to decode; raw pixels are wrapped without a copy."""
+    if fmt == WS_FORMAT_JPEG:
+        return payload
+    if fmt == WS_FORMAT_BGR:
+        if width <= 0 or height <= 0 or len(payload) != width * height * 3:
+            raise ValueError("Raw BGR frame size does not match width x height x 3")
+        return np.frombuffer(payload, dtype=np.uint8).reshape(height, width, 3)
+    if fmt == WS_FORMAT_GRAY and "gray" in _ingest_formats():
+        if width <= 0 or height <= 0 or len(payload) != width * height:
+            raise ValueError("Raw gray frame size does not match width x height")
+        return np.frombuffer(payload, dtype=np.uint8).reshape(height, width)
+    raise ValueError(f"Unsupported frame format {fmt}")
+
+
+@app.get("/ingest/capabilities")
+async def ingest_capabilities(stream_id: str = DEFAULT_STREAM_ID, width: int = 0, height: int = 0):
+    """
+    How browser clients should send webcam frames so the server does no rescaling:
+    target size, JPEG quality and accepted pixel formats.
+    width/height: the client's capture size, used to derive the target height
+    before the stream has processed its first frame.
+    """
+    stream_id = _resolve_stream_id(stream_id)
+    session = state.get_session(stream_id)
+    processor = worker = None
+    if session is not None:
+        with session.lock:
+            processor = session.frontend_processor
+            worker = session.worker
+
+    target = None
+    if processor is not None:
+        target = processor.target_size(width, height)
+    elif worker is not None and worker.last_frame.get("frame_size"):
+        target = tuple(worker.last_frame["frame_size"])
+    else:
+        target = processing_size(CONFIG.processing_width, width, height)
+
+    formats = _ingest_formats()
+    return {
+        "stream_id": stream_id,
+        "target_width": target[0] if target else CONFIG.processing_width,
+        "target_height": target[1] if target else None,
+        "jpeg_quality": CONFIG.ingest_jpeg_quality,
+        "formats": formats,
+        "ws_formats": {name: code for name, code in WS_FORMATS.items() if name in formats},
+        "max_frame_bytes": CONFIG.shm_max_frame_bytes if CONFIG.stream_workers == "process" else None,
+    }
+
+
+@app.websocket("/ws/frontend")
+async def frontend_ws(websocket: WebSocket, stream_id: str = DEFAULT_STREAM_ID):
+    """
+    Persistent ingestion channel for browser webcam frames (alternative to POST /frontend_frame).
+
+    Client -> server: binary messages carrying one or more frames, each prefixed by a
+    9-byte big-endian header: format (u8: 0 = JPEG, 1 = raw BGR, 2 = raw gray when
+    /ingest/capabilities lists it), width, height (u16) and payload length (u32).
+    Width/height may be 0 for JPEG.
+    Server -> client: JSON text messages, {"type": "result", ...} with frame id, count,
+    lag and overlay metadata (as on /overlay/stream) for each processed frame, {"type": "event", ...} for behavior events,
+    and {"type": "error", "detail": ...} for rejected frames.
+    """
+    await websocket.accept()
+    try:
+        stream_id = _resolve_stream_id(stream_id)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    session = state.get_session(stream_id)
+    ingest = worker = result_hub = source_type = None
+    if session is not None:
+        with session.lock:
+            ingest = session.frontend_ingest
+            worker = session.worker
+            result_hub = session.result_hub
+            source_type = session.active_source_type
+    if source_type != "frontend" or (ingest is None and worker is None) or result_hub is None:
+        await websocket.close(code=1008, reason="Frontend live mode is not active")
+        return
 
-    return {"status": "ok", "active_students": count}
+    async def send_results():
+        # Only forward events raised after this client connected.
+        existing = session.get_events_since(0)
+        last_event_id = existing[-1]["id"] if existing else 0
+        async for result in result_hub.subscribe():
+            await websocket.send_json(result)
+            for event in session.get_events_since(last_event_id):
+                last_event_id = event["id"]
+                await websocket.send_json({"type": "event", **event})
+        # Stream stopped or restarted: end this channel.
+        await websocket.close(code=1000)
+
+    sender = asyncio.create_task(send_results())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("bytes")
+            if not data:
+                continue
+            received_at = time.time()
+            try:
+                frames = [_ws_frame_payload(*frame) for frame in _parse_ws_frames(data)]
+                for frame in frames:
+                    if worker is not None:
+                        worker.submit_frame(frame, timestamp=received_at)
+                    else:
+                        ingest.submit(frame, received_at=received_at)
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        sender.cancel()
 
 @app.get("/logs/stream")
 async def stream_logs():
@@ -994,35 +1825,45 @@ async def get_logs(since_id: int = 0):
     return {"logs": state.get_logs_since(since_id)}
 
 @app.get("/events")
-async def get_events(since_id: int = 0):
+async def get_events(since_id: int = 0, stream_id: str = DEFAULT_STREAM_ID):
     """
-    Polling fallback endpoint for behavior events.
+    Polling fallback endpoint for behavior events of one stream.
     """
-    return {"events": state.get_events_since(since_id)}
+    session = state.get_session(_resolve_stream_id(stream_id))
+    return {"events": session.get_events_since(since_id) if session else []}
 
 
 @app.get("/events/stream")
-async def stream_events():
+async def stream_events(stream_id: str = DEFAULT_STREAM_ID):
     """
-    Server-Sent Events stream for behavior events (lower latency than polling).
+    Server-Sent Events stream for behavior events of one stream (lower latency than polling).
     """
+    stream_id = _resolve_stream_id(stream_id)
+
     async def event_generator():
         last_id = 0
         heartbeat_at = time.monotonic()
+        session = None
         try:
             yield "event: connected\ndata: {}\n\n"
             while True:
-                new_events = state.get_events_since(last_id)
-                for entry in new_events:
-                    last_id = entry["id"]
-                    payload = json.dumps(entry)
-                    yield f"id: {entry['id']}\nevent: event\ndata: {payload}\n\n"
-                with state.lock:
-                    ended = state.stream_ended_flag
+                # The session may be created (or replaced by /reset_data) after connecting.
+                current = state.get_session(stream_id)
+                if current is not session:
+                    session = current
+                    last_id = 0
+                if session is not None:
+                    new_events = session.get_events_since(last_id)
+                    for entry in new_events:
+                        last_id = entry["id"]
+                        payload = json.dumps(entry)
+                        yield f"id: {entry['id']}\nevent: event\ndata: {payload}\n\n"
+                    with session.lock:
+                        ended = session.stream_ended_flag
+                        if ended:
+                            session.stream_ended_flag = False
                     if ended:
-                        state.stream_ended_flag = False
-                if ended:
-                    yield "event: stream_ended\ndata: {}\n\n"
+                        yield "event: stream_ended\ndata: {}\n\n"
                 if (time.monotonic() - heartbeat_at) >= 10:
                     heartbeat_at = time.monotonic()
                     yield "event: heartbeat\ndata: {}\n\n"
@@ -1038,6 +1879,42 @@ async def stream_events():
     return StreamingResponse(event_generator(), media_type="text/event-stream", headers=headers)
 
 
+@app.get("/overlay/stream")
+async def stream_overlay(stream_id: str = DEFAULT_STREAM_ID, max_fps: float = 0.0):
+    """
+    Server-Sent Events stream of per-frame overlay metadata for one stream: frame_id
+    (matches X-Frame-Id on /video_feed parts), frame_size, active_students and per-track
+    boxes, behavior boxes, display names and behavior labels. With overlay=client the
+    video is sent without annotations and dashboards draw these instead.
+    Starts the stream's processing loop if no viewer has yet.
+    """
+    session = state.get_session(_resolve_stream_id(stream_id))
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown stream_id")
+    _ensure_producer(session)
+    with session.lock:
+        result_hub = session.result_hub
+    if result_hub is None:
+        raise HTTPException(status_code=409, detail="Stream is not running")
+
+    async def event_generator():
+        try:
+            yield "event: connected\ndata: {}\n\n"
+            async for result in result_hub.subscribe(max_fps=max(0.0, max_fps)):
+                payload = json.dumps(result)
+                yield f"id: {result['frame_id']}\nevent: overlay\ndata: {payload}\n\n"
+            yield "event: stream_ended\ndata: {}\n\n"
+        except (asyncio.CancelledError, GeneratorExit):
+            return
+
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no",
+    }
+    return StreamingResponse(event_generator(), media_type="text/event-stream", headers=headers)
+
+
 # ── Self-learning feedback API ───────────────────────────────────────────
 @app.post("/feedback/correct")
 async def feedback_correct(body: dict = Body(...)):
@@ -1116,10 +1993,133 @@ async def reload_behavior_model(body: dict = Body(default_factory=dict)):
     return {"status": "ok", "message": "Behavior model reloaded"}
 
 
+def _student_dir(name: str) -> str:
+    name = (name or "").strip()
+    if not _STUDENT_NAME_RE.match(name) or name == os.path.basename(gallery_path(state.faces_dir)):
+        raise HTTPException(status_code=400, detail="Invalid student name")
+    return os.path.join(state.faces_dir, name)
+
+
+def _gallery_summary() -> dict:
+    recognizer = state.recognizer
+    return {
+        "loaded": recognizer is not None,
+        "generation": recognizer.generation if recognizer is not None else 0,
+        "known_identities": len(recognizer.known_names) if recognizer is not None else 0,
+        "index": CONFIG.gallery_index,
+    }
+
+
+@app.get("/gallery")
+async def get_gallery():
+    """Loaded gallery generation and the enrolled students."""
+    recognizer = state.recognizer
+    names = [str(name) for name in recognizer.known_names] if recognizer is not None else []
+    return {**_gallery_summary(), "students": names}
+
+
+@app.post("/gallery/students")
+async def enroll_student(
+    name: str = Form(...),
+    files: list[UploadFile] = File(...),
+    replace: bool = Form(False),
+):
+    """
+    Enroll (or add images to) a student: images are saved under faces/<name>/, only they
+    are embedded, and the new gallery is swapped into running streams without a restart.
+    replace=true drops the student's previous images, but only once a new image is usable.
+    Uploads without a usable face are rejected and never reach faces/.
+    """
+    student_dir = _student_dir(name)
+    images = []
+    for upload in files:
+        payload = await upload.read()
+        img = cv.imdecode(np.frombuffer(payload, dtype=np.uint8), cv.IMREAD_COLOR) if payload else None
+        if img is None:
+            raise HTTPException(status_code=400, detail=f"Not a readable image: {upload.filename}")
+        images.append((upload.filename or "", payload, img))
+    if not images:
+        raise HTTPException(status_code=400, detail="No images uploaded")
+
+    # Staged outside faces/ so a rejected upload never touches the student's folder or the gallery.
+    staging = tempfile.mkdtemp(prefix="enroll_", dir=CONFIG.upload_dir)
+    try:
+        stamp = int(time.time() * 1000)
+        staged = []
+        for i, (filename, payload, img) in enumerate(images):
+            ext = os.path.splitext(filename)[1].lower()
+            path = os.path.join(staging, f"upload_{stamp}_{i}{ext if ext in IMAGE_EXTENSIONS else '.jpg'}")
+            if ext in IMAGE_EXTENSIONS:
+                with open(path, "wb") as f:
+                    f.write(payload)
+            else:
+                cv.imwrite(path, img)
+            staged.append(path)
+        checks, report = await asyncio.to_thread(state.enroll_student, student_dir, staged, replace)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Gallery rebuild failed, nothing enrolled: {e}")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    uploads = [
+        {"filename": filename, "status": status, **quality}
+        for (filename, _, _), (status, quality) in zip(images, checks)
+    ]
+    if report is None:
+        raise HTTPException(status_code=422, detail={"message": "No usable face in the uploaded images", "uploads": uploads})
+    student = os.path.basename(student_dir)
+    added = sum(1 for upload in uploads if upload["status"] == "ok")
+    state.add_log("Student enrolled", "system", component="recognizer", student=student, images=added)
+    return {"status": "ok", "student": student, "uploads": uploads, "quality": report.get(student), **_gallery_summary()}
+
+
+@app.delete("/gallery/students/{name}")
+async def remove_student(name: str):
+    """Delete a student's images and remove the identity from the live gallery."""
+    student_dir = _student_dir(name)
+    try:
+        removed = await asyncio.to_thread(state.remove_student, student_dir)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Gallery rebuild failed, student kept: {e}")
+    if not removed:
+        raise HTTPException(status_code=404, detail="Unknown student")
+    state.add_log("Student removed", "system", component="recognizer", student=os.path.basename(student_dir))
+    return {"status": "ok", "student": os.path.basename(student_dir), **_gallery_summary()}
+
+
+@app.post("/gallery/reload")
+async def reload_gallery(body: dict = Body(default_factory=dict)):
+    """
+    Swap in the embedding store on disk (e.g. after python -m src.database_utils).
+    Body: {build?: bool} to first run the incremental build over faces/.
+    """
+    build = bool((body or {}).get("build", False))
+    report = await asyncio.to_thread(state.reload_gallery, build)
+    return {"status": "ok", **_gallery_summary(), "quality": report}
+
+
 @app.get("/stats")
-async def get_stats():
-    with state.lock:
-        return {"active_students": state.active_count, "is_running": state.is_running}
+async def get_stats(stream_id: str = DEFAULT_STREAM_ID):
+    stream_id = _resolve_stream_id(stream_id)
+    session = state.get_session(stream_id)
+    if session is None:
+        return {"stream_id": stream_id, "active_students": 0, "is_running": False}
+    return session.stats()
+
+
+@app.get("/streams")
+async def list_streams():
+    """
+    Per-stream FPS, latency and student counts for every known stream.
+    """
+    sessions = state.list_sessions()
+    return {
+        "streams": [session.stats() for session in sessions],
+        "running": sum(1 for session in sessions if session.is_running),
+        "max_streams": CONFIG.max_streams,
+        "inference_broker": state.inference_broker.stats() if state.inference_broker is not None else None,
+        "detector_pool": state.detector_pool.stats() if state.detector_pool is not None else None,
+    }
 
 @app.get("/config")
 async def get_config():
@@ -1132,23 +2132,54 @@ async def get_config():
                 "upload_dir": CONFIG.upload_dir,
                 "cleanup_uploads": CONFIG.cleanup_uploads,
                 "detect_interval": CONFIG.detect_interval,
+                "detector_backend": CONFIG.detector_backend,
+                "detector_pool_size": CONFIG.detector_pool_size,
+                "motion_gate": CONFIG.motion_gate,
+                "motion_threshold": CONFIG.motion_threshold,
+                "track_prediction": CONFIG.track_prediction,
+                "tiled_detection": CONFIG.tiled_detection,
+                "gallery_index": CONFIG.gallery_index,
+                "detection_tiles": CONFIG.detection_tiles,
+                "detection_tile_scale": CONFIG.detection_tile_scale,
+                "detection_tile_size": CONFIG.detection_tile_size,
                 "recheck_interval": CONFIG.recheck_interval,
                 "behavior_interval": CONFIG.behavior_interval,
                 "processing_width": CONFIG.processing_width,
+                "overlay_mode": CONFIG.overlay_mode,
                 "require_single_worker": CONFIG.require_single_worker,
                 "max_stream_seconds": CONFIG.max_stream_seconds,
+                "stream_idle_seconds": CONFIG.stream_idle_seconds,
+                "headless_streams": CONFIG.headless_streams,
+                "output_jpeg_quality": CONFIG.output_jpeg_quality,
+                "adaptive_output": CONFIG.adaptive_output,
+                "snapshot_max_age": CONFIG.snapshot_max_age,
+                "capture_queue_size": CONFIG.capture_queue_size,
+                "capture_drop_policy": CONFIG.capture_drop_policy,
+                "pipeline_enabled": CONFIG.pipeline_enabled,
+                "pipeline_queue_size": CONFIG.pipeline_queue_size,
+                "max_streams": CONFIG.max_streams,
+                "inference_broker": CONFIG.inference_broker_enabled,
+                "inference_max_batch": CONFIG.inference_max_batch,
+                "inference_max_wait_ms": CONFIG.inference_max_wait_ms,
+                "stream_workers": CONFIG.stream_workers,
+                "shm_ring_slots": CONFIG.shm_ring_slots,
                 "recognition_threshold": CONFIG.recognition_threshold,
                 "recognition_min_margin": CONFIG.recognition_min_margin,
                 "min_recognition_face_size": CONFIG.min_recognition_face_size,
                 "min_recognition_face_score": CONFIG.min_recognition_face_score,
             },
             "state": {
-                "is_running": state.is_running,
-                "active_students": state.active_count,
-                "source_type": state.active_source_type,
+                "streams": {
+                    session.stream_id: {
+                        "is_running": session.is_running,
+                        "active_students": session.active_count,
+                        "source_type": session.active_source_type,
+                    }
+                    for session in state.sessions.values()
+                },
             },
             "models": {
-                "detector_loaded": state.detector is not None,
+                "detector_loaded": state.detector_pool is not None,
                 "recognizer_loaded": state.recognizer is not None,
                 "behavior_classifier_loaded": state.behavior_classifier is not None,
                 "behavior_model_valid": state.behavior_model_valid,
@@ -1157,7 +2188,8 @@ async def get_config():
                 "detector_model_exists": os.path.exists(state.model_path),
                 "behavior_model_exists": os.path.exists(state.behavior_model_path),
                 "faces_dir_exists": os.path.exists(state.faces_dir),
-                "embeddings_cache_exists": os.path.exists(os.path.join(state.faces_dir, "embeddings.pkl")),
+                "embeddings_cache_exists": store_exists(gallery_path(state.faces_dir)),
+                "gallery_generation": state.recognizer.generation if state.recognizer is not None else 0,
             },
             "acceleration": get_acceleration_status()
         }
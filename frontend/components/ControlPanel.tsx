@@ -4,6 +4,37 @@ import { Camera, Loader2, Monitor, RotateCcw, StopCircle, Upload } from "lucide-
 import { useRef, useState, useEffect } from "react";
 import { backendUrl } from "@/lib/api";
 
+type IngestFormat = { width: number; height: number; quality: number };
+
+// Ask the backend which size/quality to send webcam frames at, so it does not have to rescale them.
+async function fetchIngestFormat(video: HTMLVideoElement): Promise<IngestFormat | null> {
+    const params = new URLSearchParams({
+        width: String(video.videoWidth),
+        height: String(video.videoHeight),
+    });
+    try {
+        const response = await fetch(`${backendUrl("/ingest/capabilities")}?${params}`);
+        if (!response.ok) {
+            return null;
+        }
+        const caps = (await response.json()) as {
+            target_width?: number;
+            target_height?: number | null;
+            jpeg_quality?: number;
+        };
+        if (!caps.target_width || !caps.target_height) {
+            return null;
+        }
+        return {
+            width: caps.target_width,
+            height: caps.target_height,
+            quality: (caps.jpeg_quality ?? 72) / 100,
+        };
+    } catch {
+        return null;
+    }
+}
+
 export function ControlPanel() {
     const fileInputRef = useRef<HTMLInputElement>(null);
     const frontendStreamRef = useRef<MediaStream | null>(null);
@@ -11,6 +42,7 @@ export function ControlPanel() {
     const frontendUploadBusyRef = useRef(false);
     const captureVideoRef = useRef<HTMLVideoElement | null>(null);
     const captureCanvasRef = useRef<HTMLCanvasElement | null>(null);
+    const ingestFormatRef = useRef<IngestFormat | null>(null);
     const [isLoading, setIsLoading] = useState(false);
     const [status, setStatus] = useState<"idle" | "streaming">("idle");
     const [mode, setMode] = useState<"frontend" | "backend" | null>(null);
@@ -132,6 +164,7 @@ export function ControlPanel() {
 
             captureVideoRef.current.srcObject = stream;
             await captureVideoRef.current.play().catch(() => undefined);
+            ingestFormatRef.current = await fetchIngestFormat(captureVideoRef.current);
 
             if (frontendLoopRef.current) {
                 clearInterval(frontendLoopRef.current);
@@ -149,8 +182,9 @@ export function ControlPanel() {
                 }
 
                 frontendUploadBusyRef.current = true;
-                c.width = v.videoWidth;
-                c.height = v.videoHeight;
+                const ingest = ingestFormatRef.current;
+                c.width = ingest?.width ?? v.videoWidth;
+                c.height = ingest?.height ?? v.videoHeight;
                 const ctx = c.getContext("2d");
                 if (!ctx) {
                     frontendUploadBusyRef.current = false;
@@ -174,7 +208,7 @@ export function ControlPanel() {
                     } finally {
                         frontendUploadBusyRef.current = false;
                     }
-                }, "image/jpeg", 0.72);
+                }, "image/jpeg", ingest?.quality ?? 0.72);
             }, 220);
 
             setMode("frontend");
@@ -3,6 +3,7 @@
 import { Maximize2, VideoOff } from "lucide-react";
 import { useEffect, useRef, useState } from "react";
 import { backendUrl } from "@/lib/api";
+import { OverlayCanvas } from "@/components/OverlayCanvas";
 
 export function LivePreview() {
     const [backendStreaming, setBackendStreaming] = useState(false);
@@ -82,15 +83,18 @@ export function LivePreview() {
                 className="relative aspect-video bg-border/20 border border-border rounded-lg overflow-hidden flex items-center justify-center"
             >
                 {backendStreaming && streamUrl ? (
-                    <img
-                        src={streamUrl}
-                        alt="Live Stream"
-                        className="w-full h-full object-cover"
-                        onError={() => {
-                            setBackendStreaming(false);
-                            setStreamUrl("");
-                        }}
-                    />
+                    <>
+                        <img
+                            src={streamUrl}
+                            alt="Live Stream"
+                            className="w-full h-full object-cover"
+                            onError={() => {
+                                setBackendStreaming(false);
+                                setStreamUrl("");
+                            }}
+                        />
+                        <OverlayCanvas active={backendStreaming} />
+                    </>
                 ) : frontendStream ? (
                     <video
                         ref={videoRef}
@@ -0,0 +1,105 @@
+"use client";
+
+import { useEffect, useRef } from "react";
+import { backendUrl } from "@/lib/api";
+
+type OverlayTrack = {
+    track_id: number;
+    box: [number, number, number, number];
+    overlay_box?: [number, number, number, number];
+    name: string;
+    display_name: string;
+    confidence: number;
+    behavior: string;
+    behavior_confidence: number;
+};
+
+type OverlayFrame = {
+    frame_id: number;
+    overlay: "server" | "client";
+    frame_size: [number, number] | null;
+    tracks: OverlayTrack[];
+};
+
+// Same palette as src/visualization_utils.py.
+const BOX_COLOR = "#8CE4FF";
+const LABEL_COLOR = "#FEEE91";
+const BEHAVIOR_COLOR = "#FFA239";
+const SHADOW_COLOR = "rgb(20, 20, 31)";
+const FONT_SIZE = 12;
+
+function drawText(ctx: CanvasRenderingContext2D, text: string, x: number, y: number, color: string) {
+    ctx.fillStyle = SHADOW_COLOR;
+    ctx.fillText(text, x + 1, y + 1);
+    ctx.fillStyle = color;
+    ctx.fillText(text, x, y);
+}
+
+function drawOverlay(canvas: HTMLCanvasElement, frame: OverlayFrame) {
+    const ctx = canvas.getContext("2d");
+    if (!ctx || !frame.frame_size) return;
+    const [width, height] = frame.frame_size;
+    if (canvas.width !== width || canvas.height !== height) {
+        canvas.width = width;
+        canvas.height = height;
+    }
+    ctx.clearRect(0, 0, width, height);
+    if (frame.overlay !== "client") return; // Already burned into the video.
+
+    ctx.font = `${FONT_SIZE}px monospace`;
+    ctx.textBaseline = "top";
+    ctx.lineWidth = 2;
+    for (const track of frame.tracks) {
+        const [x1, y1, x2, y2] = track.overlay_box ?? track.box;
+        ctx.strokeStyle = BOX_COLOR;
+        ctx.strokeRect(x1 + 1, y1 + 1, Math.max(1, x2 - x1 - 1), Math.max(1, y2 - y1 - 1));
+
+        const known = track.name !== "Unknown";
+        const label = known ? `${track.display_name} ${track.confidence.toFixed(2)}` : `#${track.track_id}`;
+        drawText(ctx, label, x1 + 4, Math.max(4, y1 - FONT_SIZE - 6), LABEL_COLOR);
+        if (track.behavior !== "negative") {
+            const behaviorY = Math.min(height - FONT_SIZE - 4, y2 + 4);
+            drawText(ctx, `${track.behavior} ${track.behavior_confidence.toFixed(2)}`, x1 + 4, behaviorY, BEHAVIOR_COLOR);
+        }
+    }
+}
+
+/**
+ * Draws box/label metadata from /overlay/stream over the live video when the
+ * stream runs with overlay=client (raw video frames from the backend).
+ */
+export function OverlayCanvas({ active }: { active: boolean }) {
+    const canvasRef = useRef<HTMLCanvasElement>(null);
+
+    useEffect(() => {
+        const canvas = canvasRef.current;
+        if (!active || !canvas) return;
+        const source = new EventSource(backendUrl("/overlay/stream"));
+        let pending: OverlayFrame | null = null;
+        let raf = 0;
+        source.addEventListener("overlay", (event) => {
+            try {
+                pending = JSON.parse((event as MessageEvent).data) as OverlayFrame;
+            } catch {
+                return;
+            }
+            // Draw at most once per display refresh, always the newest frame.
+            if (!raf) {
+                raf = requestAnimationFrame(() => {
+                    raf = 0;
+                    if (pending) drawOverlay(canvas, pending);
+                });
+            }
+        });
+        source.addEventListener("stream_ended", () => source.close());
+
+        return () => {
+            source.close();
+            if (raf) cancelAnimationFrame(raf);
+            canvas.getContext("2d")?.clearRect(0, 0, canvas.width, canvas.height);
+        };
+    }, [active]);
+
+    // object-cover matches the <img> it sits on, so frame coordinates line up.
+    return <canvas ref={canvasRef} className="absolute inset-0 w-full h-full object-cover pointer-events-none" />;
+}
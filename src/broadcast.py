@@ -0,0 +1,197 @@
+import asyncio
+import threading
+import time
+
+
+class _FixedRate:
+    def __init__(self, max_fps):
+        self.min_interval = 1.0 / max_fps if max_fps and max_fps > 0 else 0.0
+
+    def stats(self):
+        return {"max_fps": round(1.0 / self.min_interval, 2) if self.min_interval else 0.0}
+
+
+class FrameHub:
+    """
+    Latest-frame broadcast slot for one stream.
+
+    A single producer publishes encoded frames; any number of subscribers wait for
+    a version newer than the last one they saw. A slow subscriber skips straight to
+    the newest frame, so it never holds up the producer or the other viewers.
+    Threads wait on a condition variable; asyncio subscribers are woken on their
+    own event loop, so idle viewers cost no polling and no threadpool workers.
+
+    Producers ask wants_frame() before drawing and encoding a frame: with no viewers
+    (or none whose max_fps slot is open) the work is skipped entirely. One-off readers
+    such as snapshots call request_frame() to have the next frame rendered anyway.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self.version = 0
+        self.closed = False
+        self.subscribers = 0
+        self._viewers = []  # one pacing object (with min_interval) per subscriber
+        self._render_claimed_at = 0.0
+        self._frame_requested = False
+        self._idle_since = time.monotonic()
+        self._async_waiters = set()  # (loop, asyncio.Event)
+
+    def publish(self, frame) -> int:
+        with self._cond:
+            self.version += 1
+            self._frame = frame
+            self._frame_requested = False
+            self._cond.notify_all()
+            version = self.version
+        self._wake_async()
+        return version
+
+    def close(self):
+        """Wake every subscriber; they finish once they have seen the last frame."""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        self._wake_async()
+
+    def _wake_async(self):
+        with self._cond:
+            waiters = list(self._async_waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # loop already closed
+
+    def _newer_than(self, after_version):
+        if self.version <= after_version:
+            return None
+        return self.version, self._frame
+
+    def latest(self):
+        """(version, frame) of the newest published frame, or None before the first one."""
+        with self._cond:
+            return self._newer_than(0)
+
+    def request_frame(self):
+        """
+        Ask the producer to render its next frame even if no viewer is subscribed.
+        Counts as viewer activity for idle_seconds().
+        """
+        with self._cond:
+            self._frame_requested = True
+            if self.subscribers == 0:
+                self._idle_since = time.monotonic()
+
+    def touch(self):
+        """Count a one-off read (e.g. a snapshot served from cache) as viewer activity."""
+        with self._cond:
+            if self.subscribers == 0:
+                self._idle_since = time.monotonic()
+
+    def wait_for_frame(self, after_version=0, timeout=None):
+        """Newest (version, frame) after after_version, or None on timeout / once closed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.version <= after_version and not self.closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._newer_than(after_version)
+
+    async def next_frame(self, after_version=0, timeout=None):
+        """Async wait_for_frame: awaits the producer's notification instead of blocking a thread."""
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        waiter = (loop, event)
+        with self._cond:
+            if self.version > after_version or self.closed:
+                return self._newer_than(after_version)
+            self._async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+        with self._cond:
+            return self._newer_than(after_version)
+
+    async def subscribe(self, max_fps=0.0, poll_timeout=1.0, viewer=None):
+        """
+        Async-iterate frames for one viewer until the hub closes. Each published
+        version is delivered at most once; with max_fps > 0 frames published faster
+        than that are skipped and the viewer gets the newest one when its slot opens.
+        viewer: optional object whose min_interval (seconds) replaces max_fps and may
+        change while subscribed.
+        """
+        viewer = viewer if viewer is not None else _FixedRate(max_fps)
+        with self._cond:
+            self.subscribers += 1
+            self._viewers.append(viewer)
+        try:
+            version = 0
+            next_at = 0.0
+            while True:
+                if viewer.min_interval:
+                    delay = next_at - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                latest = await self.next_frame(version, timeout=poll_timeout)
+                if latest is None:
+                    if self.closed:
+                        return
+                    continue
+                version, frame = latest
+                next_at = time.monotonic() + viewer.min_interval
+                yield frame
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+                self._viewers.remove(viewer)
+                if self.subscribers == 0:
+                    self._idle_since = time.monotonic()
+
+    def render_interval(self):
+        """Shortest frame interval any viewer asked for (0 = every frame), or None with no viewers."""
+        with self._cond:
+            if not self._viewers:
+                return 0.0 if self._frame_requested else None
+            return min(viewer.min_interval for viewer in self._viewers)
+
+    def wants_frame(self) -> bool:
+        """
+        Whether a frame produced now would be delivered to at least one viewer.
+        A True answer claims the slot, so the next frame waits for the shortest interval again.
+        """
+        with self._cond:
+            now = time.monotonic()
+            if self._frame_requested:
+                self._frame_requested = False
+                self._render_claimed_at = now
+                return True
+            if not self._viewers:
+                return False
+            if now - self._render_claimed_at < min(viewer.min_interval for viewer in self._viewers):
+                return False
+            self._render_claimed_at = now
+            return True
+
+    def idle_seconds(self) -> float:
+        """Seconds since the last subscriber left (0 while anyone is watching)."""
+        with self._cond:
+            if self.subscribers > 0:
+                return 0.0
+            return time.monotonic() - self._idle_since
+
+    def stats(self):
+        with self._cond:
+            return {
+                "viewers": self.subscribers,
+                "viewer_outputs": [viewer.stats() for viewer in self._viewers],
+                "frames_published": self.version,
+                "closed": self.closed,
+            }
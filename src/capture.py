@@ -0,0 +1,210 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import NamedTuple, Optional
+
+import cv2 as cv
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class CapturedFrame(NamedTuple):
+    frame: np.ndarray
+    frame_id: int
+    captured_at: float  # time.time() when the frame came off the decoder
+
+
+class CaptureReader:
+    """
+    Reads a cv.VideoCapture on a dedicated thread into a small bounded queue.
+
+    Decoding overlaps with inference, and with the default drop-oldest policy the
+    consumer always gets the freshest frame instead of a backlog from the camera buffer.
+    Use the "block" policy for uploaded files so no frames are skipped.
+    """
+
+    def __init__(
+        self,
+        cap,
+        source=None,
+        queue_size=2,
+        drop_policy=DROP_OLDEST,
+        reconnect=True,
+        read_retry_count=10,
+        read_retry_interval=0.3,
+        log_callback=None,
+    ):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy} (expected one of {DROP_POLICIES})")
+        self.cap = cap
+        self.source = source
+        self.queue_size = max(1, int(queue_size))
+        self.drop_policy = drop_policy
+        self.reconnect = reconnect
+        self.read_retry_count = max(0, int(read_retry_count))
+        self.read_retry_interval = read_retry_interval
+        self.log_callback = log_callback
+
+        self._frames = deque()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.ended = False
+        self.end_reason = None  # "eof", "error" or "stopped"
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._thread = threading.Thread(target=self._run, name="capture-reader", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        """
+        Signal the reader and wait up to timeout for it to exit. The reader thread releases
+        the capture itself on the way out, so a read or reconnect still in progress when
+        the join times out never has its handle released underneath it.
+        """
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is None:
+            self._release_cap()  # never started: nothing else owns the handle
+        elif self._thread is not threading.current_thread():
+            self._thread.join(timeout=timeout)
+
+    def read(self, timeout=None) -> Optional[CapturedFrame]:
+        """
+        Return the next queued frame, or None on timeout / end of stream.
+        Check `ended` to tell the two apart.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._frames:
+                if self.ended:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            packet = self._frames.popleft()
+            self._cond.notify_all()
+            return packet
+
+    def stats(self):
+        with self._cond:
+            depth = len(self._frames)
+        return {
+            "queue_depth": depth,
+            "queue_size": self.queue_size,
+            "drop_policy": self.drop_policy,
+            "frames_read": self.frames_read,
+            "frames_dropped": self.frames_dropped,
+            "ended": self.ended,
+            "end_reason": self.end_reason,
+        }
+
+    def _log(self, message, level="system", **details):
+        if self.log_callback:
+            try:
+                self.log_callback(message, level, **details)
+            except Exception:
+                pass
+
+    def _push(self, packet: CapturedFrame):
+        with self._cond:
+            if len(self._frames) >= self.queue_size:
+                if self.drop_policy == DROP_OLDEST:
+                    self._frames.popleft()
+                    self.frames_dropped += 1
+                elif self.drop_policy == DROP_NEWEST:
+                    self.frames_dropped += 1
+                    return
+                else:
+                    while len(self._frames) >= self.queue_size and not self._stop.is_set():
+                        self._cond.wait(0.5)
+                    if self._stop.is_set():
+                        return
+            self._frames.append(packet)
+            self._cond.notify_all()
+
+    def _finish(self, reason):
+        with self._cond:
+            self.ended = True
+            self.end_reason = reason
+            self._cond.notify_all()
+
+    def _release_cap(self):
+        try:
+            if self.cap is not None:
+                self.cap.release()
+        except Exception:
+            pass
+
+    def _reopen(self):
+        """Reopen capture - handles connection drops for live streams."""
+        if self._stop.wait(1.0):
+            return False, None
+        try:
+            self.cap.release()
+            reopen_src = self.source
+            if isinstance(self.source, str) and self.source.startswith("rtsp://"):
+                reopen_src = self.source + ("&" if "?" in self.source else "?") + "rtsp_transport=tcp"
+            # Assigned even if stop() came in meanwhile, so _run's exit releases it.
+            self.cap = cv.VideoCapture(reopen_src, cv.CAP_FFMPEG)
+            if self._stop.is_set():
+                return False, None
+            if self.cap.isOpened():
+                ret, frame = self.cap.read()
+                if ret:
+                    logger.info("Stream reconnected")
+                    self._log("Stream reconnected", "system")
+                    return ret, frame
+        except Exception as e:
+            logger.warning(f"Reconnect failed: {e}")
+        return False, None
+
+    def _read_with_retry(self):
+        ret, frame = self.cap.read()
+        if ret or not self.reconnect:
+            return ret, frame
+        # Live sources (RTSP/webcam): retry transient failures, then attempt reconnect.
+        for _ in range(self.read_retry_count):
+            if self._stop.wait(self.read_retry_interval):
+                return False, None
+            ret, frame = self.cap.read()
+            if ret:
+                return ret, frame
+        if self._stop.is_set():
+            return False, None
+        return self._reopen()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                ret, frame = self._read_with_retry()
+                if self._stop.is_set():
+                    break
+                if not ret:
+                    self._finish("error" if self.reconnect else "eof")
+                    return
+                self.frames_read += 1
+                self._push(CapturedFrame(frame, self.frames_read, time.time()))
+        except Exception as e:
+            logger.error(f"Capture reader error: {e}")
+            self._finish("error")
+            return
+        finally:
+            # The reader thread owns the handle (it may have been reopened), so it releases it.
+            self._release_cap()
+        self._finish("stopped")
@@ -1,75 +1,314 @@
 import os
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+
 import cv2 as cv
 import numpy as np
-import pickle
-from insightface.app import FaceAnalysis
 from src.runtime_utils import resolve_insightface_runtime
+from src.embedding_store import atomic_write, gallery_path, store_exists, write_store
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+DET_SIZE = (640, 640)  # larger than the live detector for better recall on static photos
+MANIFEST_FILE = "manifest.npz"
+MANIFEST_VERSION = 1
+QUALITY_FILE = "quality.json"
+
+# Per-student quality warnings
+MIN_IMAGES = 3
+MIN_FACE_PX = 80         # shorter bbox side in the source image
+MIN_SHARPNESS = 60.0     # variance of the Laplacian on the 112x112 aligned crop
+OUTLIER_SIMILARITY = 0.4 # cosine to the student's mean embedding
+
+_worker_detector = None
+
+
+def _load_analysis(modules=None):
+    from insightface.app import FaceAnalysis
+
+    providers, ctx_id = resolve_insightface_runtime()
+    app = FaceAnalysis(name='buffalo_l', providers=providers, allowed_modules=modules)
+    app.prepare(ctx_id=ctx_id, det_size=DET_SIZE)
+    return app
 
-def build_database(faces_dir='faces', output_path='faces/embeddings.pkl'):
+
+def _init_worker():
+    global _worker_detector
+    _worker_detector = _load_analysis(['detection']).det_model
+
+
+def _detect_and_align(detector, img_path):
+    """
+    Decode one image, keep its largest face and align it for the recognizer.
+    Returns (status, aligned crop or None, quality dict); status is ok, no_face or unreadable.
     """
-    Crawls the faces directory, computes embeddings for each student, and saves them to a pickle file.
+    from insightface.utils import face_align
+
+    img = cv.imread(img_path)
+    if img is None:
+        return "unreadable", None, {}
+    bboxes, kpss = detector.detect(img, max_num=0, metric='default')
+    if len(bboxes) == 0 or kpss is None:
+        return "no_face", None, {}
+    # Assume the largest face is the target
+    best = int(np.argmax((bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])))
+    aligned = face_align.norm_crop(img, landmark=kpss[best])
+    x1, y1, x2, y2, score = bboxes[best]
+    quality = {
+        "det_score": float(score),
+        "face_px": float(min(x2 - x1, y2 - y1)),
+        "sharpness": float(cv.Laplacian(cv.cvtColor(aligned, cv.COLOR_BGR2GRAY), cv.CV_64F).var()),
+    }
+    return "ok", aligned, quality
+
+
+def _worker_detect(img_path):
+    return _detect_and_align(_worker_detector, img_path)
+
+
+def check_images(paths, app=None):
+    """
+    (status, quality) per image path from the same detection and alignment the build
+    uses, without touching the manifest or store. Lets callers reject unusable uploads
+    before they reach faces_dir.
+    """
+    if app is None:
+        app = _load_analysis(['detection'])
+    return [_detect_and_align(app.det_model, path)[::2] for path in paths]
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_faces_dir(faces_dir):
+    """(relative path, mtime, size) of every student image: faces_dir/StudentName/image.jpg."""
+    found = []
+    for student_name in sorted(os.listdir(faces_dir)):
+        student_path = os.path.join(faces_dir, student_name)
+        if not os.path.isdir(student_path) or student_name == os.path.basename(gallery_path(faces_dir)):
+            continue
+        for img_name in sorted(os.listdir(student_path)):
+            if not img_name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            stat = os.stat(os.path.join(student_path, img_name))
+            found.append((f"{student_name}/{img_name}", stat.st_mtime, stat.st_size))
+    return found
+
+
+def load_manifest(path):
+    """relative path -> entry dict from a previous build, or {} if there is none (or it is unreadable)."""
+    try:
+        with np.load(os.path.join(path, MANIFEST_FILE)) as data:
+            if int(data["version"]) != MANIFEST_VERSION:
+                return {}
+            columns = {key: data[key] for key in data.files if key != "version"}
+    except (FileNotFoundError, OSError, KeyError, ValueError):
+        return {}
+    return {
+        str(rel_path): {key: values[i] for key, values in columns.items() if key != "paths"}
+        for i, rel_path in enumerate(columns["paths"])
+    }
+
+
+def save_manifest(path, manifest):
+    rel_paths = sorted(manifest)
+    dim = next((len(e["embedding"]) for e in manifest.values() if e["status"] == "ok"), 512)
+
+    def column(key, dtype, default):
+        return np.array([manifest[p].get(key, default) for p in rel_paths], dtype=dtype)
+
+    embeddings = np.zeros((len(rel_paths), dim), dtype=np.float32)
+    for i, rel_path in enumerate(rel_paths):
+        if manifest[rel_path]["status"] == "ok":
+            embeddings[i] = manifest[rel_path]["embedding"]
+    os.makedirs(path, exist_ok=True)
+    atomic_write(path, MANIFEST_FILE, lambda f: np.savez(
+        f,
+        version=np.int64(MANIFEST_VERSION),
+        paths=np.array(rel_paths, dtype=str).reshape(len(rel_paths)),
+        mtime=column("mtime", np.float64, 0.0),
+        size=column("size", np.int64, 0),
+        sha1=np.array([str(manifest[p]["sha1"]) for p in rel_paths], dtype=str).reshape(len(rel_paths)),
+        status=np.array([str(manifest[p]["status"]) for p in rel_paths], dtype=str).reshape(len(rel_paths)),
+        embedding=embeddings,
+        det_score=column("det_score", np.float32, 0.0),
+        face_px=column("face_px", np.float32, 0.0),
+        sharpness=column("sharpness", np.float32, 0.0),
+    ))
+
+
+def _embed_images(faces_dir, rel_paths, manifest, workers, batch_size, app=None):
+    """Detect/align rel_paths (process pool when workers > 1) and embed the crops in batches."""
+    if not rel_paths:
+        return
+    if app is None:
+        app = _load_analysis(['detection', 'recognition'])
+    rec_model = app.models['recognition']
+    pending = []
+
+    def flush():
+        feats = rec_model.get_feat([aligned for _, aligned in pending])
+        for (rel_path, _), feat in zip(pending, feats):
+            manifest[rel_path]["embedding"] = np.asarray(feat, dtype=np.float32).reshape(-1)
+        pending.clear()
+
+    def collect(results):
+        for rel_path, (status, aligned, quality) in zip(rel_paths, results):
+            manifest[rel_path].update(status=status, **quality)
+            if aligned is not None:
+                pending.append((rel_path, aligned))
+                if len(pending) >= batch_size:
+                    flush()
+        if pending:
+            flush()
+
+    abs_paths = [os.path.join(faces_dir, rel_path) for rel_path in rel_paths]
+    if workers > 1 and len(rel_paths) > 1:
+        # spawn: onnxruntime sessions in the parent must not be inherited by fork.
+        with ProcessPoolExecutor(max_workers=min(workers, len(rel_paths)), mp_context=mp.get_context("spawn"),
+                                 initializer=_init_worker) as pool:
+            collect(pool.map(_worker_detect, abs_paths, chunksize=4))
+    else:
+        collect(_detect_and_align(app.det_model, path) for path in abs_paths)
+
+
+def student_quality(entries):
+    """Quality summary for one student's manifest entries ({rel_path: entry})."""
+    ok = {p: e for p, e in entries.items() if e["status"] == "ok"}
+    report = {
+        "images": len(entries),
+        "faces": len(ok),
+        "no_face": sorted(p for p, e in entries.items() if e["status"] == "no_face"),
+        "unreadable": sorted(p for p, e in entries.items() if e["status"] == "unreadable"),
+        "warnings": [],
+    }
+    if not ok:
+        report["warnings"].append("no usable face")
+        return report, None
+
+    embeddings = np.stack([np.asarray(e["embedding"], dtype=np.float32) for e in ok.values()])
+    mean = embeddings.mean(axis=0)
+    unit = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-10)
+    similarity = unit @ (mean / max(np.linalg.norm(mean), 1e-10))
+    report.update(
+        det_score=round(float(np.mean([e["det_score"] for e in ok.values()])), 3),
+        min_face_px=round(float(min(e["face_px"] for e in ok.values())), 1),
+        sharpness=round(float(np.median([e["sharpness"] for e in ok.values()])), 1),
+        consistency=round(float(similarity.mean()), 3),
+        outliers=sorted(p for p, s in zip(ok, similarity) if s < OUTLIER_SIMILARITY),
+    )
+    if len(ok) < MIN_IMAGES:
+        report["warnings"].append(f"only {len(ok)} usable image(s)")
+    if report["min_face_px"] < MIN_FACE_PX:
+        report["warnings"].append(f"small face ({report['min_face_px']:.0f}px)")
+    if report["sharpness"] < MIN_SHARPNESS:
+        report["warnings"].append("blurry images")
+    if report["outliers"]:
+        report["warnings"].append(f"{len(report['outliers'])} outlier image(s)")
+    return report, mean
+
+
+def build_database(faces_dir='faces', output_path=None, workers=None, batch_size=32, rebuild=False, app=None):
+    """
+    Crawls the faces directory, computes embeddings for each student, and saves them to the
+    embedding store (faces_dir/gallery by default, see src/embedding_store.py).
     Structure: faces_dir/StudentName/image.jpg
+
+    Incremental: per-image embeddings are kept in a manifest next to the store, keyed by
+    path and checked by mtime/size (then content hash), so only new or changed images are
+    decoded, detected and embedded. Pass an already prepared FaceAnalysis as app to reuse
+    its models in-process. Returns the per-student quality report, or None if faces_dir is missing.
+    Raises if the store, manifest or quality report cannot be written.
     """
+    output_path = output_path or gallery_path(faces_dir)
     print(f"Building face database from {faces_dir}...")
-    
-    # Initialize InsightFace for analysis
-    # increased det_size for better detection on static images
-    providers, ctx_id = resolve_insightface_runtime()
-    app = FaceAnalysis(name='buffalo_l', providers=providers)
-    app.prepare(ctx_id=ctx_id, det_size=(640, 640))
-    
-    known_faces = {}
-    
     if not os.path.exists(faces_dir):
         print(f"Warning: Faces directory {faces_dir} not found.")
-        return
+        return None
+    workers = (os.cpu_count() or 1) if workers is None else int(workers)
 
-    for student_name in os.listdir(faces_dir):
-        student_path = os.path.join(faces_dir, student_name)
-        if not os.path.isdir(student_path):
+    previous = {} if rebuild else load_manifest(output_path)
+    manifest = {}
+    changed = []
+    for rel_path, mtime, size in scan_faces_dir(faces_dir):
+        entry = previous.get(rel_path)
+        if entry is not None and float(entry["mtime"]) == mtime and int(entry["size"]) == size:
+            manifest[rel_path] = entry
             continue
-        
-        embeddings = []
-        valid_images = 0
-        
-        for img_name in os.listdir(student_path):
-            if not img_name.lower().endswith(('.jpg', '.jpeg', '.png')):
-                continue
-            
-            img_path = os.path.join(student_path, img_name)
-            img = cv.imread(img_path)
-            if img is None: continue
-            
-            # Get embedding
-            faces = app.get(img)
-            
-            if len(faces) > 0:
-                # Assume the largest face is the target
-                faces = sorted(faces, key=lambda x: (x.bbox[2]-x.bbox[0]) * (x.bbox[3]-x.bbox[1]), reverse=True)
-                embeddings.append(faces[0].embedding)
-                valid_images += 1
-        
-        if embeddings:
-            # Average embedding
-            avg_embedding = np.mean(embeddings, axis=0)
-            # Normalize
-            avg_embedding = avg_embedding / np.linalg.norm(avg_embedding)
-            known_faces[student_name] = avg_embedding
-            print(f"Loaded {student_name} ({valid_images} images)")
-        else:
+        sha1 = _file_hash(os.path.join(faces_dir, rel_path))
+        if entry is not None and str(entry["sha1"]) == sha1:  # touched or copied, same content
+            manifest[rel_path] = dict(entry, mtime=mtime, size=size)
+            continue
+        manifest[rel_path] = {"mtime": mtime, "size": size, "sha1": sha1, "status": "pending"}
+        changed.append(rel_path)
+    removed = len(set(previous) - set(manifest))
+    print(f"{len(manifest)} images: {len(changed)} new or changed, {len(manifest) - len(changed)} cached, {removed} removed")
+
+    started = time.perf_counter()
+    _embed_images(faces_dir, changed, manifest, workers, batch_size, app=app)
+    if changed:
+        print(f"Embedded {len(changed)} images in {time.perf_counter() - started:.1f}s")
+
+    by_student = {}
+    for rel_path, entry in manifest.items():
+        by_student.setdefault(rel_path.split("/", 1)[0], {})[rel_path] = entry
+
+    known_faces = {}
+    metadata = {}
+    report = {}
+    for student_name in sorted(by_student):
+        quality, mean = student_quality(by_student[student_name])
+        report[student_name] = quality
+        if mean is None:
             print(f"Skipping {student_name} (No valid faces found)")
-    
-    # Save cache
+            continue
+        known_faces[student_name] = mean / np.linalg.norm(mean)
+        metadata[student_name] = {"images": quality["faces"], "consistency": quality["consistency"]}
+        warnings = f"  [{'; '.join(quality['warnings'])}]" if quality["warnings"] else ""
+        print(
+            f"Loaded {student_name} ({quality['faces']}/{quality['images']} images, "
+            f"consistency {quality['consistency']:.2f}, sharpness {quality['sharpness']:.0f}){warnings}"
+        )
+
+    if not changed and not removed and not rebuild and store_exists(output_path):
+        print(f"Database at {output_path} is up to date ({len(known_faces)} students)")
+        return report
+
+    # Save store, then the manifest (a crash in between only costs re-embedding)
     try:
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        with open(output_path, 'wb') as f:
-            pickle.dump(known_faces, f)
-        print(f"Saved database to {output_path} ({len(known_faces)} students)")
+        names = sorted(known_faces)
+        generation = write_store(output_path, names, [known_faces[n] for n in names], metadata=metadata)
+        save_manifest(output_path, manifest)
+        atomic_write(output_path, QUALITY_FILE, lambda f: f.write(json.dumps(report, indent=2).encode("utf-8")))
+        print(f"Saved database to {output_path} ({len(known_faces)} students, generation {generation})")
     except Exception as e:
         print(f"Error saving database: {e}")
+        raise
+    return report
+
 
 if __name__ == "__main__":
     # Allow running this script directly to rebuild DB
-    build_database()
+    parser = argparse.ArgumentParser(description="Build the face embedding store from faces/<StudentName>/*.jpg")
+    parser.add_argument("--faces-dir", default="faces")
+    parser.add_argument("--output", default=None, help="store directory (default: <faces-dir>/gallery)")
+    parser.add_argument("--workers", type=int, default=None, help="decode/detect processes (default: CPU count, 1 = in-process)")
+    parser.add_argument("--batch-size", type=int, default=32, help="aligned faces per recognition forward pass")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the manifest and re-embed every image")
+    args = parser.parse_args()
+    try:
+        report = build_database(
+            args.faces_dir, args.output, workers=args.workers, batch_size=args.batch_size, rebuild=args.rebuild
+        )
+    except Exception:
+        raise SystemExit(1)
+    if report is None:
+        raise SystemExit(1)
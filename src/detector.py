@@ -1,7 +1,13 @@
+import logging
 import cv2 as cv
+import numpy as np
 import os
 
+logger = logging.getLogger(__name__)
+
 class YunetFaceDetector:
+    batched = False  # no detect_batch
+
     def __init__(self, model_path, conf_threshold=0.7, nms_threshold=0.3):
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Face detection model not found at: {model_path}")
@@ -22,3 +28,155 @@ class YunetFaceDetector:
         # faces format: [x, y, w, h, x_re, y_re, x_le, y_le, x_nose, y_nose, x_rm, y_rm, x_lm, y_lm, score]
         _, faces = self.model.detect(image)
         return faces if faces is not None else []
+
+
+class OnnxYunetFaceDetector:
+    """
+    YuNet run directly in an onnxruntime session instead of cv.FaceDetectorYN.
+
+    Gives control over execution providers and intra/inter-op threads, keeps one
+    preallocated NCHW input buffer per input size, and can run several same-size
+    images (frames or tiles) in one session call when the graph has a dynamic batch
+    dimension. Post-processing mirrors OpenCV's FaceDetectorYN, so detect() returns
+    the same (N, 15) rows: [x, y, w, h, five landmark (x, y) pairs, score].
+    """
+
+    batched = True
+    STRIDES = (8, 16, 32)
+    PAD_DIVISOR = 32
+
+    def __init__(self, model_path, conf_threshold=0.7, nms_threshold=0.3, intra_op_threads=0,
+                 inter_op_threads=0, providers=None, max_batch=8, top_k=5000):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Face detection model not found at: {model_path}")
+        import onnxruntime as ort
+        from src.runtime_utils import resolve_insightface_runtime
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = max(0, int(intra_op_threads))
+        options.inter_op_num_threads = max(0, int(inter_op_threads))
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if providers is None:
+            providers, _ = resolve_insightface_runtime()
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=providers)
+        self.conf_threshold = float(conf_threshold)
+        self.nms_threshold = float(nms_threshold)
+        self.top_k = int(top_k)
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, width = model_input.shape
+        # Static graph dims (e.g. 640x640): frames are zero-padded into that size at their own
+        # resolution, like FaceDetectorYN pads to a multiple of 32, and only frames larger
+        # than it are scaled down (the one case where results can differ from OpenCV).
+        self.fixed_size = (width, height) if isinstance(width, int) and isinstance(height, int) else None
+        self.max_batch = max(1, int(max_batch)) if not isinstance(batch, int) else 1
+
+        names = [output.name for output in self.session.get_outputs()]
+        wanted = [f"{kind}_{stride}" for kind in ("cls", "obj", "bbox", "kps") for stride in self.STRIDES]
+        # Same output order FaceDetectorYN assumes when the graph uses other names.
+        self.output_names = wanted if all(name in names for name in wanted) else names[:12]
+
+        self.input_size = None
+        self._blob = None
+        self._scale = 1.0
+        self.set_input_size(320, 320)
+
+    def set_input_size(self, width, height):
+        width, height = int(width), int(height)
+        if self.input_size == (width, height):
+            return
+        self.input_size = (width, height)
+        if self.fixed_size is not None:
+            pad_w, pad_h = self.fixed_size
+            self._scale = min(1.0, pad_w / width, pad_h / height)
+            if self._scale < 1.0:
+                logger.warning(
+                    f"YuNet graph input is fixed at {pad_w}x{pad_h}; {width}x{height} frames are scaled by "
+                    f"{self._scale:.2f}, so detections can differ from DETECTOR_BACKEND=opencv"
+                )
+        else:
+            pad_w = ((width - 1) // self.PAD_DIVISOR + 1) * self.PAD_DIVISOR
+            pad_h = ((height - 1) // self.PAD_DIVISOR + 1) * self.PAD_DIVISOR
+            self._scale = 1.0
+        # Zero padding right/bottom is never written, so the buffer is reused as-is.
+        self._blob = np.zeros((self.max_batch, 3, pad_h, pad_w), dtype=np.float32)
+        self._anchors = {}
+        for stride in self.STRIDES:
+            cols, rows = pad_w // stride, pad_h // stride
+            self._anchors[stride] = (
+                np.tile(np.arange(cols, dtype=np.float32), rows),
+                np.repeat(np.arange(rows, dtype=np.float32), cols),
+            )
+
+    def _fill(self, index, image):
+        width, height = self.input_size
+        size = (round(width * self._scale), round(height * self._scale))
+        if (image.shape[1], image.shape[0]) != size:
+            image = cv.resize(image, size)
+        h, w = image.shape[:2]
+        self._blob[index, :, :h, :w] = image.transpose(2, 0, 1)
+
+    def _decode(self, outputs, index):
+        rows = []
+        for i, stride in enumerate(self.STRIDES):
+            cls = outputs[i][index].reshape(-1)
+            obj = outputs[i + 3][index].reshape(-1)
+            scores = np.sqrt(np.clip(cls, 0.0, 1.0) * np.clip(obj, 0.0, 1.0))
+            keep = np.flatnonzero(scores >= self.conf_threshold)
+            if keep.size == 0:
+                continue
+            bbox = outputs[i + 6][index].reshape(-1, 4)[keep]
+            kps = outputs[i + 9][index].reshape(-1, 10)[keep]
+            cx_grid, cy_grid = self._anchors[stride]
+            cx = (cx_grid[keep] + bbox[:, 0]) * stride
+            cy = (cy_grid[keep] + bbox[:, 1]) * stride
+            w = np.exp(bbox[:, 2]) * stride
+            h = np.exp(bbox[:, 3]) * stride
+            face = np.empty((keep.size, 15), dtype=np.float32)
+            face[:, 0] = cx - w / 2
+            face[:, 1] = cy - h / 2
+            face[:, 2] = w
+            face[:, 3] = h
+            face[:, 4:14:2] = (kps[:, 0::2] + cx_grid[keep, None]) * stride
+            face[:, 5:14:2] = (kps[:, 1::2] + cy_grid[keep, None]) * stride
+            face[:, 14] = scores[keep]
+            rows.append(face)
+        if not rows:
+            return []
+        faces = np.concatenate(rows, axis=0)
+        keep = cv.dnn.NMSBoxes(
+            faces[:, :4].tolist(), faces[:, 14].tolist(), self.conf_threshold, self.nms_threshold, top_k=self.top_k
+        )
+        faces = faces[np.array(keep, dtype=int).reshape(-1)]
+        if self._scale != 1.0:
+            faces[:, :14] /= self._scale
+        return faces
+
+    def detect_batch(self, images):
+        """detect() for several images of the current input size, max_batch per session call."""
+        results = []
+        for start in range(0, len(images), self.max_batch):
+            chunk = images[start:start + self.max_batch]
+            for i, image in enumerate(chunk):
+                self._fill(i, image)
+            outputs = self.session.run(self.output_names, {self.input_name: self._blob[:len(chunk)]})
+            results.extend(self._decode(outputs, i) for i in range(len(chunk)))
+        return results
+
+    def detect(self, image):
+        return self.detect_batch([image])[0]
+
+
+def create_face_detector(model_path, conf_threshold=0.7, nms_threshold=0.3, backend="opencv",
+                         intra_op_threads=0, inter_op_threads=0):
+    """YunetFaceDetector, or OnnxYunetFaceDetector for backend="onnxruntime"."""
+    if backend == "onnxruntime":
+        return OnnxYunetFaceDetector(
+            model_path,
+            conf_threshold=conf_threshold,
+            nms_threshold=nms_threshold,
+            intra_op_threads=intra_op_threads,
+            inter_op_threads=inter_op_threads,
+        )
+    return YunetFaceDetector(model_path, conf_threshold=conf_threshold, nms_threshold=nms_threshold)
@@ -0,0 +1,132 @@
+import threading
+from contextlib import contextmanager
+
+
+class DetectorPool:
+    """
+    Face detector instances shared by all thread-mode streams.
+
+    A YuNet instance is configured for one input size and must not run on two threads
+    at once, so streams check an instance out for every detect call instead of sharing
+    one. Returned instances are kept per input size and reused. At most max_instances
+    exist: at the cap, the least recently used idle instance of another size is
+    reconfigured, and if none is idle the caller waits for one to come back.
+    """
+
+    def __init__(self, factory, max_instances=4):
+        self.factory = factory
+        self.max_instances = max(1, int(max_instances))
+        self._cond = threading.Condition()
+        # Created eagerly so a missing or broken model fails at load time.
+        first = factory()
+        self.batched = bool(getattr(first, "batched", False))
+        self._idle = [(None, first)]  # (input size, detector), least recently used first
+        self._count = 1
+        self.created = 1
+        self.reused = 0
+        self.reconfigured = 0
+        self.waits = 0
+
+    def _take_idle(self, size):
+        for wanted in (size, None):
+            for i, (idle_size, detector) in enumerate(self._idle):
+                if idle_size == wanted:
+                    del self._idle[i]
+                    return idle_size, detector
+        return None
+
+    def acquire(self, size):
+        """An instance set to size (w, h), for the caller's exclusive use until release()."""
+        size = (int(size[0]), int(size[1]))
+        with self._cond:
+            while True:
+                taken = self._take_idle(size)
+                if taken is not None:
+                    idle_size, detector = taken
+                    if idle_size == size:
+                        self.reused += 1
+                        return detector
+                    break
+                if self._count < self.max_instances:
+                    self._count += 1
+                    detector = None
+                    break
+                if self._idle:
+                    _, detector = self._idle.pop(0)
+                    self.reconfigured += 1
+                    break
+                self.waits += 1
+                self._cond.wait()
+
+        if detector is None:
+            try:
+                detector = self.factory()
+            except Exception:
+                with self._cond:
+                    self._count -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self.created += 1
+        detector.set_input_size(*size)
+        return detector
+
+    def release(self, detector, size):
+        with self._cond:
+            self._idle.append(((int(size[0]), int(size[1])), detector))
+            self._cond.notify()
+
+    @contextmanager
+    def checkout(self, size):
+        detector = self.acquire(size)
+        try:
+            yield detector
+        finally:
+            self.release(detector, size)
+
+    def detector(self):
+        """A per-stream handle with the usual detector interface."""
+        return PooledFaceDetector(self)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "instances": self._count,
+                "max_instances": self.max_instances,
+                "idle": len(self._idle),
+                "idle_sizes": sorted({size for size, _ in self._idle if size is not None}),
+                "created": self.created,
+                "reused": self.reused,
+                "reconfigured": self.reconfigured,
+                "waits": self.waits,
+            }
+
+
+class PooledFaceDetector:
+    """
+    Stream-side stand-in for a face detector: set_input_size() only records the
+    stream's size, and each detect() borrows a pool instance of that size.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.batched = pool.batched
+        self.input_size = None
+
+    def set_input_size(self, width, height):
+        self.input_size = (int(width), int(height))
+
+    def _size(self, image):
+        return self.input_size or (image.shape[1], image.shape[0])
+
+    def detect(self, image):
+        with self.pool.checkout(self._size(image)) as detector:
+            return detector.detect(image)
+
+    def detect_batch(self, images):
+        if not images:
+            return []
+        with self.pool.checkout(self._size(images[0])) as detector:
+            if self.batched:
+                return detector.detect_batch(images)
+            return [detector.detect(image) for image in images]
@@ -0,0 +1,162 @@
+import json
+import os
+import time
+
+import numpy as np
+
+STORE_FORMAT = "classroom-gallery"
+STORE_VERSION = 1  # bump when the on-disk layout changes
+INDEX_FILE = "index.json"
+DEFAULT_DIM = 512
+
+
+def gallery_path(faces_dir):
+    """Where the embedding store for faces_dir lives."""
+    return os.path.join(faces_dir, "gallery")
+
+
+def legacy_pickle_path(faces_dir):
+    return os.path.join(faces_dir, "embeddings.pkl")
+
+
+def store_exists(path) -> bool:
+    return os.path.exists(os.path.join(path, INDEX_FILE))
+
+
+def read_header(path):
+    """The store's index.json (version, generation, file names), or None if absent."""
+    try:
+        with open(os.path.join(path, INDEX_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class EmbeddingStore:
+    """
+    Read-only view of a gallery written by write_store().
+
+    The (N, D) float32 matrix of unit-norm embeddings and the names column are
+    memory-mapped, so opening is cheap regardless of gallery size, and every recognizer
+    or worker process that opens the same generation shares the same page-cache pages
+    instead of holding a copy. Row i belongs to names[i]; metadata (read on first use)
+    maps a name to build details such as image counts.
+    """
+
+    def __init__(self, path, header, embeddings, names):
+        self.path = path
+        self.version = header["version"]
+        self.generation = header["generation"]
+        self.created_at = header.get("created_at")
+        self.names = names
+        self.embeddings = embeddings
+        self._metadata_file = os.path.join(path, header["metadata"])
+        self._metadata = None
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            try:
+                with open(self._metadata_file, "r", encoding="utf-8") as f:
+                    self._metadata = json.load(f)
+            except FileNotFoundError:  # replaced by a newer generation meanwhile
+                self._metadata = {}
+        return self._metadata
+
+    @classmethod
+    def open(cls, path):
+        header = read_header(path)
+        if header is None:
+            raise FileNotFoundError(f"No embedding store at {path}")
+        if header.get("format") != STORE_FORMAT or header.get("version", 0) > STORE_VERSION:
+            raise ValueError(
+                f"Unsupported embedding store at {path}: {header.get('format')} v{header.get('version')}"
+            )
+        matrix_path = os.path.join(path, header["matrix"])
+        embeddings = np.load(matrix_path, mmap_mode="r")
+        names = np.load(os.path.join(path, header["names"]), mmap_mode="r")
+        if embeddings.dtype != np.float32 or embeddings.shape != (header["count"], header["dim"]):
+            raise ValueError(f"Embedding matrix {matrix_path} does not match {INDEX_FILE}")
+        if len(names) != header["count"]:
+            raise ValueError(f"Names column in {path} does not match {INDEX_FILE}")
+        return cls(path, header, embeddings, names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def as_dict(self):
+        """name -> embedding row (views into the mapped matrix)."""
+        return dict(zip(map(str, self.names), self.embeddings))
+
+
+def write_store(path, names, embeddings, metadata=None) -> int:
+    """
+    Write a new generation of the store at path and return its number.
+
+    The matrix, names and metadata go to generation-specific files first and
+    index.json is swapped in last with os.replace, so readers see either the old or the
+    new gallery, never a mix. Files of older generations are removed; processes that
+    still map them keep their pages until they reopen.
+    """
+    names = list(names)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if len(names) == 0:
+        embeddings = embeddings.reshape(0, embeddings.shape[-1] if embeddings.ndim == 2 else DEFAULT_DIM)
+    if embeddings.ndim != 2 or len(embeddings) != len(names):
+        raise ValueError("embeddings must be (N, D) with one row per name")
+    if len(set(names)) != len(names):
+        raise ValueError("names must be unique")
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = np.ascontiguousarray(embeddings / np.maximum(norms, 1e-10), dtype=np.float32)
+
+    os.makedirs(path, exist_ok=True)
+    previous = read_header(path)
+    generation = (previous.get("generation", 0) if previous else 0) + 1
+    files = {
+        "matrix": f"embeddings-{generation}.npy",
+        "names": f"names-{generation}.npy",
+        "metadata": f"metadata-{generation}.json",
+    }
+    atomic_write(path, files["matrix"], lambda f: np.save(f, embeddings))
+    atomic_write(path, files["names"], lambda f: np.save(f, np.array(names, dtype=str).reshape(len(names))))
+    atomic_write(path, files["metadata"], lambda f: f.write(json.dumps(metadata or {}).encode("utf-8")))
+
+    header = {
+        "format": STORE_FORMAT,
+        "version": STORE_VERSION,
+        "generation": generation,
+        "created_at": time.time(),
+        "dim": int(embeddings.shape[1]),
+        "count": len(names),
+        **files,
+    }
+    atomic_write(path, INDEX_FILE, lambda f: f.write(json.dumps(header, indent=2).encode("utf-8")))
+
+    current = set(files.values())
+    for name in os.listdir(path):
+        if name.startswith(("embeddings-", "names-", "metadata-")) and name not in current:
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError:
+                pass
+    return generation
+
+
+def atomic_write(path, name, write):
+    """Write via a temp file + fsync + os.replace so the file appears complete or not at all."""
+    tmp_path = os.path.join(path, f".{name}.tmp")
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(path, name))
+
+
+def migrate_pickle(pickle_path, path) -> int:
+    """Convert a legacy embeddings.pkl (name -> embedding) into a store. Returns the generation."""
+    import pickle
+
+    with open(pickle_path, "rb") as f:
+        known_faces = pickle.load(f)
+    names = list(known_faces.keys())
+    return write_store(path, names, [known_faces[name] for name in names], metadata={"migrated_from": pickle_path})
@@ -0,0 +1,165 @@
+import threading
+
+import cv2 as cv
+import numpy as np
+
+DEFAULT_JPEG_QUALITY = 80
+QUALITY_STEP = 5  # variants are keyed on multiples of this so viewers share encodes
+
+
+def quantize_quality(quality) -> int:
+    """The JPEG quality variants are cached (and should be encoded) at: a multiple of QUALITY_STEP."""
+    quality = int(min(100, max(1, int(quality))))
+    return max(QUALITY_STEP, quality - quality % QUALITY_STEP)
+
+
+class VideoFrame:
+    """
+    One rendered frame on a stream's video hub.
+
+    JPEG variants (max width, quality) are encoded the first time a viewer asks for
+    them and cached on the frame, so every viewer with the same settings shares a
+    single encode. Frames that arrive already encoded (worker processes) are decoded
+    only if a viewer wants a different variant.
+    """
+
+    def __init__(self, frame_id, captured_at=None, image=None, jpeg=None, jpeg_quality=DEFAULT_JPEG_QUALITY):
+        self.frame_id = frame_id
+        self.captured_at = captured_at
+        self._image = image
+        self._lock = threading.Lock()
+        self._variants = {}  # (max_width, quality) -> bytes; max_width 0 = full size
+        self._source_jpeg = None  # pre-encoded bytes whose quality is not a variant key
+        if jpeg is not None:
+            # Cached only under the quality the bytes really have; otherwise they are just
+            # the source to decode when a viewer asks for a variant.
+            if int(jpeg_quality) == quantize_quality(jpeg_quality):
+                self._variants[(0, int(jpeg_quality))] = jpeg
+            else:
+                self._source_jpeg = jpeg
+
+    def _key(self, max_width, quality):
+        width = int(max_width or 0)
+        if self._image is not None and width >= self._image.shape[1]:
+            width = 0
+        return max(0, width), quantize_quality(quality)
+
+    def cached(self, max_width=0, quality=DEFAULT_JPEG_QUALITY):
+        """The variant if it has been encoded already, else None (never encodes)."""
+        with self._lock:
+            return self._variants.get(self._key(max_width, quality))
+
+    def encode(self, max_width=0, quality=DEFAULT_JPEG_QUALITY):
+        """JPEG bytes of the requested variant, encoding it on first use. None if encoding fails."""
+        with self._lock:
+            key = self._key(max_width, quality)
+            jpeg = self._variants.get(key)
+            if jpeg is not None:
+                return jpeg
+            if self._image is None:
+                source = self._source_jpeg or next(iter(self._variants.values()))
+                self._image = cv.imdecode(np.frombuffer(source, dtype=np.uint8), cv.IMREAD_COLOR)
+                if self._image is None:
+                    return None
+                self._source_jpeg = None
+                key = self._key(max_width, quality)
+                jpeg = self._variants.get(key)
+                if jpeg is not None:
+                    return jpeg
+            image = self._image
+            width, quality = key
+            if width:
+                height = max(1, round(image.shape[0] * width / image.shape[1]))
+                image = cv.resize(image, (width, height), interpolation=cv.INTER_AREA)
+            ok, buffer = cv.imencode(".jpg", image, [cv.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                return None
+            jpeg = self._variants[key] = buffer.tobytes()
+            return jpeg
+
+    @property
+    def variants(self) -> int:
+        with self._lock:
+            return len(self._variants)
+
+
+class AdaptiveOutput:
+    """
+    Per-viewer output settings for /video_feed that back off when the client's socket
+    backs up.
+
+    record_send() gets how long handing a frame to the socket took. Consistently slow
+    sends lower the JPEG quality step by step, then the frame rate; after a run of fast
+    sends the settings recover towards what the viewer asked for. min_interval is read
+    by FrameHub on every frame, so a lower rate also lowers how often the stream renders.
+    """
+
+    MIN_QUALITY = 35
+    MIN_FPS = 2.0
+    BACKOFF_FPS = 15.0  # first cap applied to an uncapped viewer
+    SLOW_SEND_SECONDS = 0.1  # slow-send threshold for uncapped viewers
+    SLOW_STREAK = 2
+    RECOVER_STREAK = 30
+
+    def __init__(self, max_fps=0.0, max_width=0, quality=DEFAULT_JPEG_QUALITY, adaptive=True):
+        self.max_width = max(0, int(max_width or 0))
+        self.requested_quality = quantize_quality(quality)
+        self.requested_fps = float(max_fps) if max_fps and max_fps > 0 else 0.0
+        self.quality = self.requested_quality
+        self.fps = self.requested_fps
+        self.adaptive = adaptive
+        self.backoffs = 0
+        self._slow = 0
+        self._fast = 0
+
+    @property
+    def min_interval(self) -> float:
+        return 1.0 / self.fps if self.fps > 0 else 0.0
+
+    def record_send(self, seconds: float):
+        if not self.adaptive:
+            return
+        budget = 0.5 * self.min_interval if self.fps > 0 else self.SLOW_SEND_SECONDS
+        if seconds > budget:
+            self._slow += 1
+            self._fast = 0
+            if self._slow >= self.SLOW_STREAK:
+                self._slow = 0
+                self._degrade()
+        else:
+            self._fast += 1
+            self._slow = 0
+            if self._fast >= self.RECOVER_STREAK:
+                self._fast = 0
+                self._recover()
+
+    def _degrade(self):
+        min_quality = min(self.MIN_QUALITY, self.requested_quality)
+        if self.quality > min_quality:
+            self.quality = max(min_quality, self.quality - 3 * QUALITY_STEP)
+        elif self.fps == 0:
+            self.fps = self.BACKOFF_FPS
+        elif self.fps > self.MIN_FPS:
+            self.fps = max(self.MIN_FPS, self.fps / 2)
+        else:
+            return
+        self.backoffs += 1
+
+    def _recover(self):
+        # Frame rate first (smoother video), then image quality.
+        if self.fps and (self.requested_fps == 0 or self.fps < self.requested_fps):
+            self.fps *= 2
+            if self.requested_fps == 0 and self.fps > self.BACKOFF_FPS:
+                self.fps = 0.0
+            elif self.requested_fps and self.fps > self.requested_fps:
+                self.fps = self.requested_fps
+        elif self.quality < self.requested_quality:
+            self.quality = min(self.requested_quality, self.quality + 3 * QUALITY_STEP)
+
+    def stats(self):
+        return {
+            "max_width": self.max_width,
+            "quality": self.quality,
+            "max_fps": self.fps,
+            "backoffs": self.backoffs,
+        }
@@ -0,0 +1,349 @@
+import logging
+import os
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+import supervision as sv
+
+from src.track_manager import TrackManager
+from src.fixes import resolve_duplicate_ids
+from src.visualization_utils import draw_tracking_results, track_overlays
+from src.mongo_client import log_event, add_training_sample
+from src.tiled_detector import TiledFaceDetector
+
+logger = logging.getLogger(__name__)
+
+
+def processing_size(processing_width, width, height):
+    """
+    (width, height) a width x height source is processed at, or None if unknown.
+    A source already at processing_width keeps its height, so it needs no resize.
+    """
+    if not width or not height or width <= 0 or height <= 0:
+        return None
+    target_width = int(processing_width)
+    if width == target_width:
+        return target_width, int(height)
+    return target_width, max(1, int(target_width * (height / width)))
+
+
+def _self_learning_enabled() -> bool:
+    return os.getenv("ENABLE_SELF_LEARNING", "false").strip().lower() in {"1", "true", "yes", "on"}
+
+
+class FrontendWebcamProcessor:
+    """
+    Processes browser-sent webcam frames through the same core
+    detection/tracking/recognition/behavior flow used by live/upload streams.
+    """
+    def __init__(
+        self,
+        detector,
+        recognizer=None,
+        behavior_classifier=None,
+        detect_interval=1,
+        recheck_interval=1.5,
+        behavior_interval=1.0,
+        processing_width=960,
+        event_callback=None,
+        min_recognition_face_size=0,
+        min_recognition_face_score=0.0,
+        behavior_max_batch=None,
+        camera_id="cam_01",
+        inference_broker=None,
+        draw_overlays=True,
+        should_render=None,
+        motion_gate=None,
+        track_predictor=None,
+    ):
+        self.detector = detector
+        self.recognizer = recognizer
+        self.behavior_classifier = behavior_classifier
+        self.detect_interval = max(1, int(detect_interval))
+        # Optional MotionGate: skips the detector on frames where nothing moved.
+        self.motion_gate = motion_gate
+        # Optional TrackPredictor: moves track boxes along their velocity on skipped frames.
+        self.track_predictor = track_predictor
+        self.processing_width = processing_width
+        self.event_callback = event_callback
+        self.camera_id = camera_id
+        self.global_frame_index = 0
+        self.last_detections = sv.Detections.empty()
+        self.frame_width = None
+        self.frame_height = None
+        self.last_tracks = []  # track_overlays() of the most recent frame
+        # False: frames are returned un-annotated and clients draw last_tracks themselves.
+        self.draw_overlays = draw_overlays
+        # Called once per frame; False (e.g. nobody watching) skips drawing and encoding.
+        self.should_render = should_render
+
+        # P1: version-safe ByteTrack construction
+        try:
+            self.tracker = sv.ByteTrack(
+                frame_rate=30,
+                track_activation_threshold=0.5,
+                lost_track_buffer=90,
+            )
+        except TypeError:
+            self.tracker = sv.ByteTrack()
+        self.track_manager = TrackManager(
+            recheck_interval=recheck_interval,
+            behavior_classifier=behavior_classifier,
+            behavior_interval=behavior_interval,
+            max_behavior_batch=behavior_max_batch,
+            min_recognition_face_size=min_recognition_face_size,
+            min_recognition_face_score=min_recognition_face_score,
+            inference_broker=inference_broker,
+        )
+
+    def target_size(self, width=None, height=None):
+        """
+        (width, height) frames are processed at. Before the first frame it is derived
+        from the given source size; None if that is unknown too.
+        """
+        if self.frame_width is not None and self.frame_height is not None:
+            return self.frame_width, self.frame_height
+        return processing_size(self.processing_width, width, height)
+
+    def _ensure_input_size(self, frame):
+        if self.frame_width is not None and self.frame_height is not None:
+            return
+        h, w = frame.shape[:2]
+        size = self.target_size(w, h)
+        if size is None:
+            return
+        self.frame_width, self.frame_height = size
+        self.detector.set_input_size(self.frame_width, self.frame_height)
+
+    def release(self):
+        if isinstance(self.detector, TiledFaceDetector):
+            self.detector.close()
+
+    def process_frame(self, frame):
+        """Returns (count, annotated frame); the frame is None when rendering was skipped."""
+        if frame is None or frame.size == 0:
+            return 0, None
+
+        if frame.ndim == 2 or frame.shape[2] == 1:
+            # Grayscale ingest (see /ingest/capabilities); the detector expects 3 channels.
+            frame = cv.cvtColor(frame, cv.COLOR_GRAY2BGR)
+        self._ensure_input_size(frame)
+        source = frame
+        if frame.shape[1] != self.frame_width or frame.shape[0] != self.frame_height:
+            frame = cv.resize(frame, (self.frame_width, self.frame_height))
+        self.global_frame_index += 1
+        run_detection = self.global_frame_index % self.detect_interval == 0
+        motion_skipped = False
+        if run_detection and self.motion_gate is not None:
+            run_detection = self.motion_gate.should_detect(frame)
+            motion_skipped = not run_detection
+
+        faces = []
+        if run_detection:
+            if isinstance(self.detector, TiledFaceDetector):
+                # Tiles are cut from the frame as received, before the resize.
+                faces = self.detector.detect(frame, source=source)
+            else:
+                faces = self.detector.detect(frame)
+
+        if len(faces) > 0:
+            xywh = faces[:, :4]
+            conf = faces[:, -1]
+            x = xywh[:, 0]
+            y = xywh[:, 1]
+            w = xywh[:, 2]
+            h = xywh[:, 3]
+            xyxy = np.stack([x, y, x + w, y + h], axis=1)
+            detections = sv.Detections(
+                xyxy=xyxy,
+                confidence=conf,
+                class_id=np.zeros(len(faces), dtype=int),
+            )
+        else:
+            detections = sv.Detections.empty()
+
+        if run_detection:
+            detections = self.tracker.update_with_detections(detections)
+            self.last_detections = detections
+            if self.track_predictor is not None:
+                self.track_predictor.update(detections, self.global_frame_index)
+        elif self.track_predictor is not None:
+            if motion_skipped:
+                self.track_predictor.hold()
+            detections = self.track_predictor.predict(self.global_frame_index, (self.frame_width, self.frame_height))
+            if detections is None:  # nothing detected yet
+                detections = self.last_detections
+        else:
+            detections = self.last_detections
+
+        if self.recognizer or self.behavior_classifier:
+            self.track_manager.process_batch(frame, detections, faces, self.recognizer, profiler=None)
+
+        for i in range(len(detections)):
+            track_id = int(detections.tracker_id[i]) if detections.tracker_id is not None else -1
+            if track_id == -1:
+                continue
+
+            meta = self.track_manager.get_metadata().get(track_id)
+            if not meta:
+                continue
+            current_b = meta.get("behavior", "negative")
+            last_logged_b = meta.get("last_logged_behavior")
+            last_logged_t = meta.get("last_logged_time", 0.0)
+            current_time = time.time()
+
+            should_log = current_b != last_logged_b or (current_time - last_logged_t) > 10.0
+            if should_log and current_b != "negative":
+                crop_path = meta.get("last_crop_path", "")
+                event_id = ""
+                if crop_path and _self_learning_enabled():
+                    event_id = add_training_sample(
+                        crop_path=crop_path,
+                        predicted=current_b,
+                        confidence=meta.get("behavior_conf", 0.0),
+                        tracker_id=track_id,
+                        name=meta.get("name", "Unknown"),
+                        source="logged",
+                    )
+                log_event(
+                    tracker_id=track_id,
+                    name=meta.get("name", "Unknown"),
+                    behavior=current_b,
+                    confidence=meta.get("behavior_conf", 0.0),
+                    camera_id=self.camera_id,
+                )
+                meta["last_logged_behavior"] = current_b
+                meta["last_logged_time"] = current_time
+                if self.event_callback:
+                    self.event_callback(
+                        {
+                            "track_id": track_id,
+                            "name": meta.get("name", "Unknown"),
+                            "behavior": current_b,
+                            "confidence": float(meta.get("behavior_conf", 0.0)),
+                            "event_id": event_id or None,
+                        }
+                    )
+
+        track_metadata = self.track_manager.get_metadata()
+        active_names = resolve_duplicate_ids(detections, track_metadata)
+        self.last_tracks = track_overlays(
+            detections, track_metadata, active_names, frame_size=(self.frame_width, self.frame_height)
+        )
+        if self.should_render is not None and not self.should_render():
+            return int(len(detections)), None
+        if not self.draw_overlays:
+            return int(len(detections)), frame
+        annotated = draw_tracking_results(frame.copy(), detections, track_metadata, active_names)
+        return int(len(detections)), annotated
+
+
+class FrontendIngestWorker:
+    """
+    Runs a FrontendWebcamProcessor on its own thread so /frontend_frame never blocks
+    the event loop. submit() parks the encoded frame in a single pending slot and
+    returns at once; if the browser sends faster than we process, a newer frame
+    replaces the one still waiting (latest frame wins).
+
+    on_result(result) is called on the worker thread with a dict holding frame_id
+    (the frame's submit sequence number), count, frame (the rendered BGR frame, or
+    None when nobody is watching), received_at, tracks and frame_size. Encoding is
+    left to the consumer so each output variant is encoded only when requested.
+    """
+
+    def __init__(self, processor, on_result=None, name="frontend-ingest"):
+        self.processor = processor
+        self.on_result = on_result
+        self._cond = threading.Condition()
+        self._pending = None  # (payload, received_at, frame_id)
+        self._stopped = False
+        self.submitted = 0
+        self.processed = 0
+        self.coalesced = 0
+        self.decode_errors = 0
+        self.last_count = 0
+        self.last_lag_ms = 0.0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stopped = True
+            self._pending = None
+            self._cond.notify_all()
+        if timeout is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=timeout)
+
+    def submit(self, payload, received_at=None) -> bool:
+        """
+        Queue an encoded frame (bytes) or an already decoded BGR array.
+        Returns True if it replaced a frame that was still waiting.
+        """
+        with self._cond:
+            if self._stopped:
+                return False
+            replaced = self._pending is not None
+            if replaced:
+                self.coalesced += 1
+            self.submitted += 1
+            self._pending = (payload, time.time() if received_at is None else received_at, self.submitted)
+            self._cond.notify()
+            return replaced
+
+    def stats(self):
+        with self._cond:
+            pending_age_ms = (time.time() - self._pending[1]) * 1000.0 if self._pending else 0.0
+            return {
+                "active_students": self.last_count,
+                # Receive-to-result time of the last processed frame.
+                "lag_ms": round(self.last_lag_ms, 1),
+                "pending": self._pending is not None,
+                "pending_age_ms": round(pending_age_ms, 1),
+                "submitted": self.submitted,
+                "processed": self.processed,
+                "coalesced": self.coalesced,
+                "decode_errors": self.decode_errors,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    self.processor.release()
+                    return
+                payload, received_at, frame_id = self._pending
+                self._pending = None
+
+            if isinstance(payload, np.ndarray):
+                frame = payload
+            else:
+                frame = cv.imdecode(np.frombuffer(payload, dtype=np.uint8), cv.IMREAD_COLOR)
+            if frame is None:
+                with self._cond:
+                    self.decode_errors += 1
+                continue
+            try:
+                count, annotated = self.processor.process_frame(frame)
+            except Exception as e:
+                logger.error(f"Frontend frame processing failed: {e}")
+                continue
+            with self._cond:
+                self.processed += 1
+                self.last_count = count
+                self.last_lag_ms = (time.time() - received_at) * 1000.0
+            if self.on_result is not None:
+                self.on_result({
+                    "frame_id": frame_id,
+                    "count": count,
+                    "frame": annotated,
+                    "received_at": received_at,
+                    "tracks": self.processor.last_tracks,
+                    "frame_size": [self.processor.frame_width, self.processor.frame_height],
+                })
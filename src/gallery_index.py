@@ -0,0 +1,170 @@
+import numpy as np
+
+INDEX_KINDS = ("exact", "fp16", "int8", "ivf")
+
+_BLOCK_ROWS = 8192  # gallery rows converted to float32 at a time by quantized indexes
+
+
+def _top2(scores, offset=0):
+    """Best two (scores, indices) per row of (K, N) scores, best first; padded with (-1.0, -1)."""
+    count = scores.shape[1]
+    if count == 0:
+        return np.full((len(scores), 2), -1.0, dtype=np.float32), np.full((len(scores), 2), -1, dtype=np.int64)
+    if count > 2:
+        top = np.argpartition(scores, -2, axis=1)[:, -2:]
+    else:
+        top = np.broadcast_to(np.arange(count), (len(scores), count))
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1) + offset
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    if count == 1:
+        top = np.concatenate([top, np.full((len(scores), 1), -1)], axis=1)
+        top_scores = np.concatenate([top_scores, np.full((len(scores), 1), -1.0)], axis=1)
+    return top_scores.astype(np.float32), top.astype(np.int64)
+
+
+def _merge_top2(a, b):
+    """Combine two _top2 results over disjoint gallery slices."""
+    scores = np.concatenate([a[0], b[0]], axis=1)
+    indices = np.concatenate([a[1], b[1]], axis=1)
+    order = np.argsort(-scores, axis=1)[:, :2]
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+
+class ExactIndex:
+    """Brute-force cosine search over a float32 (N, D) matrix of unit vectors."""
+
+    kind = "exact"
+
+    def __init__(self, embeddings):
+        self.matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.matrix)
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes
+
+    def search(self, queries):
+        """Top-2 (scores, indices), each (K, 2), for (K, D) unit queries."""
+        return _top2(np.asarray(queries, dtype=np.float32) @ self.matrix.T)
+
+
+class QuantizedIndex:
+    """
+    Brute-force search over a gallery stored as float16, or as int8 with one scale per
+    row (symmetric, max-abs). Half / a quarter of the float32 memory; rows are widened
+    block by block at search time.
+    """
+
+    def __init__(self, embeddings, dtype="fp16"):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.kind = dtype
+        if dtype == "int8":
+            scale = np.abs(embeddings).max(axis=1, keepdims=True) / 127.0
+            scale[scale == 0] = 1.0
+            self.matrix = np.round(embeddings / scale).astype(np.int8)
+            self.scale = scale.reshape(-1).astype(np.float32)
+        else:
+            self.matrix = embeddings.astype(np.float16)
+            self.scale = None
+
+    def __len__(self):
+        return len(self.matrix)
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def search(self, queries):
+        queries = np.asarray(queries, dtype=np.float32)
+        best = None
+        for start in range(0, max(1, len(self.matrix)), _BLOCK_ROWS):
+            block = self.matrix[start:start + _BLOCK_ROWS].astype(np.float32)
+            scores = queries @ block.T
+            if self.scale is not None:
+                scores *= self.scale[start:start + _BLOCK_ROWS]
+            found = _top2(scores, offset=start)
+            best = found if best is None else _merge_top2(best, found)
+        return best
+
+
+class IVFIndex:
+    """
+    Inverted-file index: spherical k-means splits the gallery into n_lists cells, and a
+    query is scored exactly (float32) against the rows of its n_probe closest cells only.
+    Approximate: a match whose embedding falls in an unprobed cell is missed.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, embeddings, n_lists=None, n_probe=8, iterations=6, seed=0):
+        self.matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        count = len(self.matrix)
+        n_lists = int(n_lists) if n_lists else int(round(4 * np.sqrt(count)))
+        self.n_lists = max(1, min(n_lists, count))
+        self.n_probe = max(1, min(int(n_probe), self.n_lists))
+        self.centroids = self._train(iterations, seed)
+        assignment = np.argmax(self.matrix @ self.centroids.T, axis=1) if count else np.zeros(0, dtype=np.int64)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(self.n_lists + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(self.n_lists)]
+
+    def _train(self, iterations, seed):
+        dim = self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+        if len(self.matrix) == 0:
+            return np.zeros((1, dim), dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        sample = self.matrix
+        if len(sample) > 48 * self.n_lists:
+            sample = sample[rng.choice(len(sample), 48 * self.n_lists, replace=False)]
+        centroids = sample[rng.choice(len(sample), self.n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assignment, kind="stable")
+            cells, starts = np.unique(assignment[order], return_index=True)
+            sums = np.add.reduceat(sample[order], starts, axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            filled = norms[:, 0] > 0
+            centroids[cells[filled]] = sums[filled] / norms[filled]
+        return centroids
+
+    def __len__(self):
+        return len(self.matrix)
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + self.centroids.nbytes + sum(ids.nbytes for ids in self.lists)
+
+    def search(self, queries):
+        queries = np.asarray(queries, dtype=np.float32)
+        scores = np.full((len(queries), 2), -1.0, dtype=np.float32)
+        indices = np.full((len(queries), 2), -1, dtype=np.int64)
+        if len(self.matrix) == 0:
+            return scores, indices
+        cells = np.argpartition(-(queries @ self.centroids.T), self.n_probe - 1, axis=1)[:, :self.n_probe]
+        for k, query in enumerate(queries):
+            candidates = np.concatenate([self.lists[c] for c in cells[k]])
+            if len(candidates) == 0:
+                continue
+            top_scores, top = _top2((self.matrix[candidates] @ query)[None, :])
+            found = top[0] >= 0
+            scores[k, found] = top_scores[0, found]
+            indices[k, found] = candidates[top[0, found]]
+        return scores, indices
+
+
+def build_gallery_index(embeddings, kind="exact", **options):
+    """
+    Index over (N, D) unit-norm embeddings. kind: exact, fp16, int8 or ivf (options:
+    n_lists, n_probe). Every index answers search(queries) with the top-2 matches.
+    """
+    if kind == "ivf":
+        return IVFIndex(embeddings, **options)
+    if kind in ("fp16", "int8"):
+        return QuantizedIndex(embeddings, dtype=kind)
+    if kind != "exact":
+        raise ValueError(f"Unknown gallery index {kind!r}; expected one of {', '.join(INDEX_KINDS)}")
+    return ExactIndex(embeddings)
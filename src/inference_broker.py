@@ -0,0 +1,170 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class _BatchLane:
+    """
+    One model's request queue plus the worker that turns queued requests from
+    many streams into shared forward passes.
+    """
+
+    def __init__(self, name, run_batch, max_batch, max_wait):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait))
+        self.requests = queue.Queue()
+        self.carry = None  # request that did not fit the previous batch
+        self.thread = None
+        self.batches = 0
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def submit(self, items):
+        future = Future()
+        self.requests.put((list(items), future, time.perf_counter()))
+        return future
+
+    def stats(self):
+        return {
+            "lane": self.name,
+            "pending_requests": self.requests.qsize(),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "avg_forward_ms": round((self.busy_seconds / self.batches) * 1000.0, 2) if self.batches else 0.0,
+            "avg_queue_wait_ms": round((self.wait_seconds / self.batches) * 1000.0, 2) if self.batches else 0.0,
+        }
+
+    def collect(self, stop):
+        """Block for the first request, then gather more until max_batch items or the deadline."""
+        if self.carry is not None:
+            first, self.carry = self.carry, None
+            return self._fill([first])
+        while not stop.is_set():
+            try:
+                first = self.requests.get(timeout=0.2)
+                break
+            except queue.Empty:
+                continue
+        else:
+            return []
+        return self._fill([first])
+
+    def _fill(self, pending):
+        count = len(pending[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while count < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if count + len(request[0]) > self.max_batch:
+                self.carry = request
+                break
+            pending.append(request)
+            count += len(request[0])
+        return pending
+
+    def process(self, pending):
+        started = time.perf_counter()
+        items = [item for request_items, _, _ in pending for item in request_items]
+        try:
+            results = []
+            # A single request may exceed max_batch on its own; chunk instead of refusing it.
+            for offset in range(0, len(items), self.max_batch):
+                results.extend(self.run_batch(items[offset:offset + self.max_batch]))
+        except Exception as e:
+            logger.error(f"Inference broker {self.name} batch failed: {e}")
+            for _, future, _ in pending:
+                future.set_exception(e)
+            return
+        finally:
+            self.batches += 1
+            self.items += len(items)
+            self.busy_seconds += time.perf_counter() - started
+            self.wait_seconds += sum(started - queued_at for _, _, queued_at in pending) / len(pending)
+
+        offset = 0
+        for request_items, future, _ in pending:
+            future.set_result(results[offset:offset + len(request_items)])
+            offset += len(request_items)
+
+
+class InferenceBroker:
+    """
+    Central batching service shared by every active monitor.
+
+    Streams submit behavior crops and aligned faces and block on the result;
+    a worker per model merges concurrent requests under a max-batch / max-wait
+    deadline and runs one forward pass, then routes each slice back to the
+    TrackManager that asked for it.
+    """
+
+    def __init__(self, behavior_classifier=None, recognizer=None, max_batch=32, max_wait_ms=8.0):
+        self.behavior_classifier = behavior_classifier
+        self.recognizer = recognizer
+        self._stop = threading.Event()
+        max_wait = max_wait_ms / 1000.0
+        self.lanes = {
+            "behavior": _BatchLane("behavior", self._run_behavior, max_batch, max_wait),
+            "recognition": _BatchLane("recognition", self._run_recognition, max_batch, max_wait),
+        }
+
+    def start(self):
+        for lane in self.lanes.values():
+            if lane.thread is None:
+                lane.thread = threading.Thread(
+                    target=self._run_lane, args=(lane,), name=f"inference-{lane.name}", daemon=True
+                )
+                lane.thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        for lane in self.lanes.values():
+            if lane.thread is not None:
+                lane.thread.join(timeout=timeout)
+
+    def classify_behavior(self, crops, timeout=None):
+        """Same contract as BehaviorClassifier.classify_batch."""
+        if not crops:
+            return []
+        return self.lanes["behavior"].submit(crops).result(timeout=timeout)
+
+    def recognize_aligned(self, aligned_faces, timeout=None):
+        """(name, score) for each 112x112 aligned face, in order."""
+        if not aligned_faces:
+            return []
+        return self.lanes["recognition"].submit(aligned_faces).result(timeout=timeout)
+
+    def stats(self):
+        return [lane.stats() for lane in self.lanes.values()]
+
+    def _run_behavior(self, crops):
+        classifier = self.behavior_classifier
+        if classifier is None:
+            return [("negative", 0.0)] * len(crops)
+        return classifier.classify_batch(crops)
+
+    def _run_recognition(self, aligned_faces):
+        recognizer = self.recognizer
+        if recognizer is None:
+            return [("Unknown", 0.0)] * len(aligned_faces)
+        embeddings = recognizer.embed_aligned(aligned_faces)
+        return recognizer.match_embeddings(embeddings)
+
+    def _run_lane(self, lane):
+        while not self._stop.is_set():
+            pending = lane.collect(self._stop)
+            if pending:
+                lane.process(pending)
@@ -6,9 +6,12 @@ import os
 
 from src.track_manager import TrackManager
 from src.fixes import resolve_duplicate_ids
-from src.visualization_utils import draw_tracking_results
+from src.visualization_utils import draw_tracking_results, track_overlays
 from src.mongo_client import log_event, add_training_sample
-from src.profiler import Profiler
+from src.profiler import FrameTimings, Profiler
+from src.capture import CaptureReader, DROP_OLDEST
+from src.pipeline import FramePipeline
+from src.tiled_detector import TiledFaceDetector
 
 class ClassroomMonitorStage2:
     def __init__(
@@ -25,12 +28,30 @@ class ClassroomMonitorStage2:
         min_recognition_face_size=36,
         min_recognition_face_score=0.70,
         behavior_max_batch=None,
+        camera_id="cam_01",
+        inference_broker=None,
+        draw_overlays=True,
+        should_render=None,
+        motion_gate=None,
+        track_predictor=None,
     ):
+        self.input_source = input_source
         self.cap = cv.VideoCapture(input_source)
+        self.capture = None
         self.detector = detector
         self.recognizer = recognizer
         self.processing_width = processing_width
         self.detect_interval = detect_interval
+        # Optional MotionGate: skips the detector on frames where nothing moved.
+        self.motion_gate = motion_gate
+        # Optional TrackPredictor: moves track boxes along their velocity on skipped frames.
+        self.track_predictor = track_predictor
+        # False: frames leave un-annotated and clients draw last_tracks themselves.
+        self.draw_overlays = draw_overlays
+        # Called once per frame; False (e.g. nobody watching) skips drawing and encoding.
+        self.should_render = should_render
+        self.rendered = True  # whether the most recent frame was rendered
+        self.last_tracks = []  # track_overlays() of the most recent frame
 
         self.profiler = Profiler()
 
@@ -47,6 +68,7 @@ class ClassroomMonitorStage2:
         self.behavior_classifier = behavior_classifier
         self.behavior_interval = behavior_interval
         self.event_callback = event_callback
+        self.camera_id = camera_id
         self.track_manager = TrackManager(
             recheck_interval=recheck_interval,
             behavior_classifier=self.behavior_classifier,
@@ -54,6 +76,7 @@ class ClassroomMonitorStage2:
             max_behavior_batch=behavior_max_batch,
             min_recognition_face_size=min_recognition_face_size,
             min_recognition_face_score=min_recognition_face_score,
+            inference_broker=inference_broker,
         )
         self.enable_self_learning = os.getenv("ENABLE_SELF_LEARNING", "false").strip().lower() in {
             "1", "true", "yes", "on"
@@ -74,16 +97,124 @@ class ClassroomMonitorStage2:
 
         self.detector.set_input_size(self.frame_width, self.frame_height)
 
+    def start_capture(
+        self,
+        queue_size=2,
+        drop_policy=DROP_OLDEST,
+        reconnect=True,
+        read_retry_count=10,
+        read_retry_interval=0.3,
+        log_callback=None,
+    ):
+        """Hand the capture over to a background reader thread. Returns the reader."""
+        if self.capture is None:
+            self.capture = CaptureReader(
+                self.cap,
+                source=self.input_source,
+                queue_size=queue_size,
+                drop_policy=drop_policy,
+                reconnect=reconnect,
+                read_retry_count=read_retry_count,
+                read_retry_interval=read_retry_interval,
+                log_callback=log_callback,
+            ).start()
+        return self.capture
+
+    def read_frame(self, timeout=None):
+        """Next CapturedFrame from the reader thread, or None on timeout / end of stream."""
+        if self.capture is None:
+            self.start_capture()
+        return self.capture.read(timeout=timeout)
+
+    def release(self):
+        if self.capture is not None:
+            # The reader owns the (possibly reopened) capture handle.
+            self.capture.stop()
+        elif self.cap is not None:
+            self.cap.release()
+        if isinstance(self.detector, TiledFaceDetector):
+            self.detector.close()
+
     def process_frame(self, frame):
-        frame = cv.resize(frame, (self.frame_width, self.frame_height))
+        ctx = self._detect_stage(frame, profiler=self.profiler)
+        ctx = self._track_stage(ctx, profiler=self.profiler)
+        ctx = self._analyze_stage(ctx, profiler=self.profiler)
+        ctx = self._render_stage(ctx, profiler=self.profiler)
+        self.profiler.end_frame(ctx["index"])
+        return ctx["frame"], ctx["count"]
+
+    def build_pipeline(self, queue_size=2, extra_stages=None):
+        """
+        Same steps as process_frame, but each on its own thread so consecutive
+        frames overlap. Items entering the pipeline are CapturedFrame packets;
+        items leaving it are the per-frame context dicts.
+
+        Stage timings travel with each frame (ctx["timings"]) and reach self.profiler
+        once the frame is rendered, since stages of different frames run concurrently.
+        """
+        def detect(packet):
+            timings = FrameTimings()
+            ctx = self._detect_stage(packet.frame, profiler=timings)
+            ctx["timings"] = timings
+            ctx["frame_id"] = packet.frame_id
+            ctx["captured_at"] = packet.captured_at
+            return ctx
+
+        def render(ctx):
+            ctx = self._render_stage(ctx, profiler=ctx["timings"])
+            self.profiler.add_frame(ctx["index"], ctx.pop("timings").data)
+            return ctx
+
+        stages = [
+            ("detect", detect),
+            ("track", lambda ctx: self._track_stage(ctx, profiler=ctx["timings"])),
+            # Render runs on a later frame while analyze mutates track state, so it
+            # needs its own copy of the metadata.
+            ("analyze", lambda ctx: self._analyze_stage(ctx, profiler=ctx["timings"], snapshot=True)),
+            ("render", render),
+        ]
+        stages.extend(extra_stages or [])
+        return FramePipeline(stages, queue_size=queue_size)
+
+    def _detect_stage(self, frame, profiler=None):
+        source = frame
+        if frame.shape[1] != self.frame_width or frame.shape[0] != self.frame_height:
+            frame = cv.resize(frame, (self.frame_width, self.frame_height))
         self.global_frame_index += 1
+        run_detection = self.global_frame_index % self.detect_interval == 0
 
-        # 1. Detect faces (gated by interval)
+        # 1. Detect faces (gated by interval, then by motion)
+        motion_skipped = False
+        if run_detection and self.motion_gate is not None:
+            if profiler:
+                profiler.start('motion_gate')
+            run_detection = self.motion_gate.should_detect(frame)
+            motion_skipped = not run_detection
+            if profiler:
+                profiler.stop('motion_gate')
+                profiler.record('detection_skipped', 0.0 if run_detection else 1.0)
         faces = []
-        if self.global_frame_index % self.detect_interval == 0:
-            self.profiler.start('detection')
-            faces = self.detector.detect(frame)
-            self.profiler.stop('detection')
+        if run_detection:
+            if profiler:
+                profiler.start('detection')
+            if isinstance(self.detector, TiledFaceDetector):
+                # Tiles are cut from the full-resolution frame.
+                faces = self.detector.detect(frame, source=source)
+            else:
+                faces = self.detector.detect(frame)
+            if profiler:
+                profiler.stop('detection')
+
+        return {
+            "frame": frame,
+            "index": self.global_frame_index,
+            "faces": faces,
+            "detected": run_detection,
+            "motion_skipped": motion_skipped,
+        }
+
+    def _track_stage(self, ctx, profiler=None):
+        faces = ctx["faces"]
 
         # 2. Format for Supervision
         if len(faces) > 0:
@@ -102,21 +233,73 @@ class ClassroomMonitorStage2:
         else:
             detections = sv.Detections.empty()
 
-        # 3. Update tracker (reuse cached result on skipped frames)
-        self.profiler.start('tracking')
-        if self.global_frame_index % self.detect_interval == 0:
+        # 3. Update tracker (cached or motion-predicted boxes on skipped frames)
+        if profiler:
+            profiler.start('tracking')
+        if ctx["detected"]:
             detections = self.tracker.update_with_detections(detections)
             self.last_detections = detections
+            if self.track_predictor is not None:
+                self.track_predictor.update(detections, ctx["index"])
+        elif self.track_predictor is not None:
+            if ctx["motion_skipped"]:
+                self.track_predictor.hold()
+            detections = self.track_predictor.predict(ctx["index"], (self.frame_width, self.frame_height))
+            if detections is None:  # nothing detected yet
+                detections = self.last_detections
         else:
             detections = self.last_detections
-        self.profiler.stop('tracking')
+        if profiler:
+            profiler.stop('tracking')
+
+        ctx["detections"] = detections
+        ctx["count"] = len(detections)
+        return ctx
+
+    def _analyze_stage(self, ctx, profiler=None, snapshot=False):
+        frame = ctx["frame"]
+        faces = ctx["faces"]
+        detections = ctx["detections"]
 
         # 4. Handle tracks (identification & behaviour) - batched
         if self.recognizer or self.behavior_classifier:
-            self.track_manager.process_batch(frame, detections, faces, self.recognizer, profiler=self.profiler)
+            self.track_manager.process_batch(frame, detections, faces, self.recognizer, profiler=profiler)
 
         # 5. Log events for all active tracks
-        self.profiler.start('logging_check')
+        if profiler:
+            profiler.start('logging_check')
+        self._log_track_events(detections)
+        if profiler:
+            profiler.stop('logging_check')
+
+        # 6. Conflict resolution
+        track_metadata = self.track_manager.get_metadata()
+        if snapshot:
+            track_metadata = {tid: dict(meta) for tid, meta in track_metadata.items()}
+        ctx["track_metadata"] = track_metadata
+        ctx["active_names"] = resolve_duplicate_ids(detections, track_metadata)
+        return ctx
+
+    def _render_stage(self, ctx, profiler=None):
+        # 7. Draw results
+        if profiler:
+            profiler.start('visualization')
+        frame = ctx["frame"]
+        ctx["tracks"] = track_overlays(
+            ctx["detections"], ctx["track_metadata"], ctx["active_names"],
+            frame_size=(frame.shape[1], frame.shape[0]),
+        )
+        self.last_tracks = ctx["tracks"]
+        ctx["rendered"] = self.rendered = self.should_render is None or bool(self.should_render())
+        if self.draw_overlays and ctx["rendered"]:
+            ctx["frame"] = draw_tracking_results(
+                frame, ctx["detections"], ctx["track_metadata"], ctx["active_names"]
+            )
+        if profiler:
+            profiler.stop('visualization')
+        return ctx
+
+    def _log_track_events(self, detections):
         for i in range(len(detections)):
             track_id = int(detections.tracker_id[i]) if detections.tracker_id is not None else -1
             if track_id == -1:
@@ -148,6 +331,7 @@ class ClassroomMonitorStage2:
                         name=meta["name"],
                         behavior=current_b,
                         confidence=meta["behavior_conf"],
+                        camera_id=self.camera_id,
                     )
                     meta["last_logged_behavior"] = current_b
                     meta["last_logged_time"] = current_time
@@ -159,17 +343,3 @@ class ClassroomMonitorStage2:
                             "confidence": float(meta.get("behavior_conf", 0.0)),
                             "event_id": event_id or None,
                         })
-        self.profiler.stop('logging_check')
-
-        # 6. Conflict resolution
-        track_metadata = self.track_manager.get_metadata()
-        active_names = resolve_duplicate_ids(detections, track_metadata)
-
-        # 7. Draw results
-        self.profiler.start('visualization')
-        frame = draw_tracking_results(frame, detections, track_metadata, active_names)
-        self.profiler.stop('visualization')
-
-        self.profiler.end_frame(self.global_frame_index)
-
-        return frame, len(detections)
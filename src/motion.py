@@ -0,0 +1,140 @@
+import copy
+import threading
+
+import cv2 as cv
+import numpy as np
+
+
+class MotionGate:
+    """
+    Cheap frame-difference check in front of the face detector.
+
+    Each frame is shrunk to a tiny grayscale image and compared with the one from the
+    last frame the detector ran on. If fewer than `threshold` (fraction) of its pixels
+    changed by more than `pixel_delta`, the room is static and detection is skipped;
+    the tracker keeps its previous boxes. Comparing against the last detected frame,
+    not the previous one, means slow drift still adds up to a detection, and
+    `max_skip` forces one every so many gated frames regardless.
+    """
+
+    def __init__(self, threshold=0.005, pixel_delta=15, width=96, max_skip=30):
+        self.threshold = float(threshold)
+        self.pixel_delta = int(pixel_delta)
+        self.width = max(8, int(width))
+        self.max_skip = max(1, int(max_skip))
+        self._lock = threading.Lock()
+        self._reference = None
+        self._skipped_in_row = 0
+        self.frames = 0
+        self.skipped = 0
+        self.last_motion = 0.0
+
+    def _thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        height = max(1, round(h * self.width / w))
+        small = cv.resize(frame, (self.width, height), interpolation=cv.INTER_AREA)
+        if small.ndim == 3:
+            small = cv.cvtColor(small, cv.COLOR_BGR2GRAY)
+        return small
+
+    def should_detect(self, frame) -> bool:
+        """True if the detector should run on this frame."""
+        small = self._thumbnail(frame)
+        with self._lock:
+            self.frames += 1
+            reference = self._reference
+            if reference is not None and reference.shape == small.shape and self._skipped_in_row < self.max_skip:
+                diff = cv.absdiff(small, reference)
+                self.last_motion = float(np.count_nonzero(diff > self.pixel_delta)) / diff.size
+                if self.last_motion < self.threshold:
+                    self._skipped_in_row += 1
+                    self.skipped += 1
+                    return False
+            self._reference = small
+            self._skipped_in_row = 0
+            return True
+
+    def reset(self):
+        with self._lock:
+            self._reference = None
+            self._skipped_in_row = 0
+
+    @property
+    def skip_ratio(self) -> float:
+        with self._lock:
+            return self.skipped / self.frames if self.frames else 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "gated_frames": self.frames,
+                "skipped": self.skipped,
+                "skip_ratio": round(self.skipped / self.frames, 3) if self.frames else 0.0,
+                "last_motion": round(self.last_motion, 4),
+            }
+
+
+class TrackPredictor:
+    """
+    Constant-velocity track boxes for frames the face detector skipped.
+
+    update() gets the tracker's output on every detected frame and keeps a smoothed
+    per-frame velocity of each track's box edges. predict() moves the last boxes
+    along those velocities, so boxes (and the behavior/recognition crops cut from
+    them) follow moving students between detections instead of lagging until the
+    next one. Extrapolation stops after max_horizon frames; hold() zeroes the
+    velocities when the motion gate reports a static scene.
+    """
+
+    def __init__(self, smoothing=0.5, max_horizon=8):
+        self.smoothing = min(1.0, max(0.0, float(smoothing)))
+        self.max_horizon = max(0, int(max_horizon))
+        self._detections = None
+        self._velocities = None  # (N, 4) px/frame, rows aligned with _detections
+        self._tracks = {}  # tracker_id -> (xyxy, velocity, frame_index)
+        self._frame_index = 0
+
+    def update(self, detections, frame_index):
+        tracks = {}
+        velocities = np.zeros((len(detections), 4), dtype=np.float32)
+        if detections.tracker_id is not None:
+            for i, track_id in enumerate(detections.tracker_id):
+                box = detections.xyxy[i].astype(np.float32)
+                previous = self._tracks.get(int(track_id))
+                if previous is not None and frame_index > previous[2]:
+                    observed = (box - previous[0]) / (frame_index - previous[2])
+                    velocities[i] = self.smoothing * observed + (1.0 - self.smoothing) * previous[1]
+                tracks[int(track_id)] = (box, velocities[i], frame_index)
+        self._tracks = tracks
+        self._detections = detections
+        self._velocities = velocities
+        self._frame_index = frame_index
+
+    def hold(self):
+        """Nothing moved: keep the current boxes where they are."""
+        if self._velocities is not None:
+            self._velocities[:] = 0.0  # _tracks holds row views of this array
+
+    def predict(self, frame_index, frame_size=None):
+        """
+        The last detections moved to frame_index (None before the first update);
+        frame_size (w, h) clips the boxes.
+        """
+        detections = self._detections
+        if detections is None or len(detections) == 0:
+            return detections
+        steps = min(frame_index - self._frame_index, self.max_horizon)
+        if steps <= 0 or not self._velocities.any():
+            return detections
+        xyxy = detections.xyxy + self._velocities * steps
+        if frame_size is not None:
+            xyxy[:, [0, 2]] = np.clip(xyxy[:, [0, 2]], 0, frame_size[0] - 1)
+            xyxy[:, [1, 3]] = np.clip(xyxy[:, [1, 3]], 0, frame_size[1] - 1)
+        predicted = copy.copy(detections)
+        predicted.xyxy = xyxy.astype(detections.xyxy.dtype)
+        return predicted
+
+    def reset(self):
+        self._detections = None
+        self._velocities = None
+        self._tracks = {}
@@ -0,0 +1,160 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class _StageError:
+    """Carries an exception from a stage to the consumer, skipping later stages."""
+
+    def __init__(self, stage, exc):
+        self.stage = stage
+        self.exc = exc
+
+
+class PipelineStage:
+    def __init__(self, name, fn, queue_size=2):
+        self.name = name
+        self.fn = fn
+        self.inbox = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.outbox = None
+        self.thread = None
+        self.processed = 0
+        self.busy_seconds = 0.0
+        self.started_at = None
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        return {
+            "stage": self.name,
+            "queue_depth": self.inbox.qsize(),
+            "queue_size": self.inbox.maxsize,
+            "processed": self.processed,
+            "avg_ms": round((self.busy_seconds / self.processed) * 1000.0, 2) if self.processed else 0.0,
+            # Fraction of wall time spent inside the stage; the bottleneck sits near 1.0.
+            "occupancy": round(self.busy_seconds / elapsed, 3) if elapsed > 0 else 0.0,
+        }
+
+
+class FramePipeline:
+    """
+    Runs frame-processing stages on their own threads, connected by bounded queues.
+
+    Consecutive frames move through the stages concurrently while each stage still
+    sees frames strictly in order, so stateful steps (tracker, TrackManager) stay
+    correct. A stage returning None drops that frame.
+    """
+
+    def __init__(self, stages, queue_size=2):
+        if not stages:
+            raise ValueError("FramePipeline needs at least one stage")
+        self.stages = [PipelineStage(name, fn, queue_size) for name, fn in stages]
+        self.output = queue.Queue(maxsize=max(1, int(queue_size)))
+        for stage, nxt in zip(self.stages, self.stages[1:]):
+            stage.outbox = nxt.inbox
+        self.stages[-1].outbox = self.output
+        self._stop = threading.Event()
+        self._feeder = None
+        self.drained = False
+
+    def start(self, source=None):
+        """
+        Start stage threads. If `source` is given (anything with read(timeout) and
+        `ended`, e.g. CaptureReader), a feeder thread pulls frames from it.
+        """
+        for stage in self.stages:
+            stage.started_at = time.perf_counter()
+            stage.thread = threading.Thread(
+                target=self._run_stage, args=(stage,), name=f"pipeline-{stage.name}", daemon=True
+            )
+            stage.thread.start()
+        if source is not None:
+            self._feeder = threading.Thread(
+                target=self._run_feeder, args=(source,), name="pipeline-feeder", daemon=True
+            )
+            self._feeder.start()
+        return self
+
+    def submit(self, item, timeout=None) -> bool:
+        return self._put(self.stages[0].inbox, item, timeout)
+
+    def finish(self):
+        """Mark end of input; get() drains remaining frames, then sets `drained`."""
+        self._put(self.stages[0].inbox, _END, None)
+
+    def get(self, timeout=None):
+        """
+        Next fully processed item, or None on timeout / after the last item.
+        Check `drained` to tell the two apart. Re-raises stage exceptions.
+        """
+        if self.drained:
+            return None
+        try:
+            item = self.output.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if item is _END:
+            self.drained = True
+            return None
+        if isinstance(item, _StageError):
+            raise RuntimeError(f"Pipeline stage '{item.stage}' failed: {item.exc}") from item.exc
+        return item
+
+    def close(self, timeout=2.0):
+        self._stop.set()
+        threads = [s.thread for s in self.stages] + [self._feeder]
+        for thread in threads:
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(timeout=timeout)
+
+    def stats(self):
+        return [stage.stats() for stage in self.stages]
+
+    def _put(self, target, item, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._stop.is_set():
+            wait = 0.2 if deadline is None else min(0.2, deadline - time.monotonic())
+            if wait <= 0:
+                return False
+            try:
+                target.put(item, timeout=wait)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run_feeder(self, source):
+        while not self._stop.is_set():
+            packet = source.read(timeout=0.2)
+            if packet is None:
+                if source.ended:
+                    break
+                continue
+            self.submit(packet)
+        self.finish()
+
+    def _run_stage(self, stage):
+        while not self._stop.is_set():
+            try:
+                item = stage.inbox.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if item is _END or isinstance(item, _StageError):
+                self._put(stage.outbox, item, None)
+                if item is _END:
+                    return
+                continue
+            started = time.perf_counter()
+            try:
+                result = stage.fn(item)
+            except Exception as e:
+                logger.error(f"Pipeline stage {stage.name} error: {e}")
+                result = _StageError(stage.name, e)
+            stage.busy_seconds += time.perf_counter() - started
+            stage.processed += 1
+            if result is not None:
+                self._put(stage.outbox, result, None)
@@ -1,12 +1,36 @@
 import time
 import csv
 import os
+import threading
+
+
+class FrameTimings:
+    """
+    Stage timings of one frame, with the Profiler's start/stop/record interface. Used by
+    the pipelined monitor, where consecutive frames are in different stages at once.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self._start_times = {}
+
+    def start(self, stage_name):
+        self._start_times[stage_name] = time.perf_counter()
+
+    def stop(self, stage_name):
+        if stage_name in self._start_times:
+            self.data[stage_name] = (time.perf_counter() - self._start_times.pop(stage_name)) * 1000.0  # ms
+
+    def record(self, name, value):
+        self.data[name] = value
+
 
 class Profiler:
     def __init__(self):
         self.frame_data = {}
         self.history = []
         self.start_times = {}
+        self._lock = threading.Lock()  # add_frame() is called from pipeline threads
         
     def start(self, stage_name):
         self.start_times[stage_name] = time.perf_counter()
@@ -15,24 +39,34 @@ class Profiler:
         if stage_name in self.start_times:
             elapsed = (time.perf_counter() - self.start_times[stage_name]) * 1000.0 # ms
             self.frame_data[stage_name] = elapsed
+
+    def record(self, name, value):
+        """Per-frame value that is not a timing (e.g. a 0/1 flag), saved alongside the stage times."""
+        self.frame_data[name] = value
             
     def end_frame(self, frame_idx):
-        self.frame_data['frame'] = frame_idx
-        # Ensure all stages have a value (0.0 if skipped)
-        all_keys = set().union(*(d.keys() for d in self.history), self.frame_data.keys())
-        for k in all_keys:
-            if k not in self.frame_data:
-                self.frame_data[k] = 0.0
-                
-        self.history.append(self.frame_data)
+        self.add_frame(frame_idx, self.frame_data)
         self.frame_data = {}
         self.start_times = {}
+
+    def add_frame(self, frame_idx, frame_data):
+        """Append one finished frame's timings (e.g. FrameTimings.data); thread-safe."""
+        frame_data = dict(frame_data, frame=frame_idx)
+        with self._lock:
+            # Ensure all stages have a value (0.0 if skipped)
+            all_keys = set().union(*(d.keys() for d in self.history), frame_data.keys())
+            for k in all_keys:
+                if k not in frame_data:
+                    frame_data[k] = 0.0
+            self.history.append(frame_data)
         
     def save(self, filename='performance_metrics.csv'):
-        if not self.history:
+        with self._lock:
+            history = list(self.history)
+        if not history:
             return
             
-        keys = sorted(list(set().union(*(d.keys() for d in self.history))))
+        keys = sorted(list(set().union(*(d.keys() for d in history))))
         # Ensure 'frame' is first
         if 'frame' in keys:
             keys.remove('frame')
@@ -41,5 +75,8 @@ class Profiler:
         with open(filename, 'w', newline='') as f:
             writer = csv.DictWriter(f, fieldnames=keys)
             writer.writeheader()
-            writer.writerows(self.history)
+            writer.writerows(history)
         print(f"📊 Performance metrics saved to {filename}")
+        skipped = [d["detection_skipped"] for d in history if "detection_skipped" in d]
+        if skipped:
+            print(f"   Motion gate skipped detection on {100.0 * sum(skipped) / len(skipped):.1f}% of frames")
@@ -1,18 +1,35 @@
 import os
-import pickle
+import threading
 import numpy as np
 import cv2 as cv
 from insightface.app import FaceAnalysis
 from src.runtime_utils import resolve_insightface_runtime
+from src.gallery_index import build_gallery_index
+from src.embedding_store import EmbeddingStore, gallery_path, legacy_pickle_path, migrate_pickle, read_header, store_exists
+
+
+class _Gallery:
+    """One store generation and its search index; replaced as a whole on reload."""
+
+    def __init__(self, store=None, index=None):
+        self.store = store
+        self.names = store.names if store is not None else []
+        self.embeddings = store.embeddings if store is not None else []
+        self.index = index
+
 
 class FaceRecognizer:
-    def __init__(self, faces_dir='faces', threshold=0.5, min_margin=0.04):
+    def __init__(self, faces_dir='faces', threshold=0.5, min_margin=0.04, index='exact', index_options=None):
         self.faces_dir = faces_dir
         self.threshold = threshold
         self.min_margin = min_margin
-        self.known_faces = {}      # name -> embedding (1D array)
-        self.known_embeddings = [] # Matrix (N, 512) for vectorized search
-        self.known_names = []      # List of names corresponding to rows
+        # Store, names, (N, 512) memory-mapped matrix and search index, read through one
+        # reference so a reload can swap them while other threads are matching.
+        self._gallery = _Gallery()
+        self._reload_lock = threading.Lock()
+        # Gallery search backend (see src/gallery_index.py): exact, fp16, int8 or ivf
+        self.index_kind = index
+        self.index_options = index_options or {}
         
         # Initialize InsightFace with platform-aware providers
         providers, ctx_id = resolve_insightface_runtime()
@@ -22,6 +39,7 @@ class FaceRecognizer:
         # Cache Recognition Model for fast access
         self.rec_model = self._get_recognition_model()
         self._face_align = None
+        self._local = threading.local()  # per-thread alignment buffer (streams share the recognizer)
         try:
             from insightface.utils import face_align as _face_align
             self._face_align = _face_align
@@ -29,7 +47,7 @@ class FaceRecognizer:
             self._face_align = None
         
         # Load DB
-        self.cache_path = os.path.join(self.faces_dir, 'embeddings.pkl')
+        self.store_path = gallery_path(self.faces_dir)
         self.load_database()
 
     def _get_recognition_model(self):
@@ -42,26 +60,119 @@ class FaceRecognizer:
                     return model
         return rec_model
 
+    @property
+    def store(self):
+        """EmbeddingStore the current gallery was loaded from (None if nothing is loaded)."""
+        return self._gallery.store
+
+    @property
+    def known_names(self):
+        return self._gallery.names
+
+    @property
+    def known_embeddings(self):
+        return self._gallery.embeddings
+
+    @property
+    def index(self):
+        return self._gallery.index
+
+    @property
+    def generation(self):
+        return self._gallery.store.generation if self._gallery.store is not None else 0
+
     def load_database(self):
-        if not os.path.exists(self.cache_path):
-            print(f"Error: Database cache {self.cache_path} not found. Run src/database_utils.py first.")
-            return
+        """Open the store and index it; the new gallery replaces the current one in one step. Returns success."""
+        if not store_exists(self.store_path):
+            legacy_path = legacy_pickle_path(self.faces_dir)
+            if not os.path.exists(legacy_path):
+                print(f"Error: Embedding store {self.store_path} not found. Run src/database_utils.py first.")
+                return False
+            # One-time conversion; later starts map the store instead of unpickling.
+            try:
+                migrate_pickle(legacy_path, self.store_path)
+                print(f"Migrated {legacy_path} to {self.store_path}")
+            except Exception as e:
+                print(f"Failed to migrate {legacy_path}: {e}")
+                return False
 
         try:
-            with open(self.cache_path, 'rb') as f:
-                self.known_faces = pickle.load(f)
-            
-            # Prepare vectorized structures
-            if self.known_faces:
-                self.known_names = list(self.known_faces.keys())
-                self.known_embeddings = np.array([self.known_faces[n] for n in self.known_names])
-                # Ensure normalized (should be already, but safety first)
-                norms = np.linalg.norm(self.known_embeddings, axis=1, keepdims=True)
-                self.known_embeddings = self.known_embeddings / (norms + 1e-10)
-                
-            print(f"Recognizer loaded: {len(self.known_faces)} students.")
+            # Rows are unit-norm float32 (write_store normalizes), mapped rather than copied.
+            store = EmbeddingStore.open(self.store_path)
+            index = build_gallery_index(store.embeddings, self.index_kind, **self.index_options)
         except Exception as e:
-            print(f"Failed to load cache: {e}")
+            print(f"Failed to load embedding store: {e}")
+            return False
+        self._gallery = _Gallery(store, index)
+        print(f"Recognizer loaded: {len(store)} students (store generation {store.generation}).")
+        return True
+
+    def reload_database(self, force=False):
+        """
+        Load a newer store generation if one was written. The index is built on the
+        calling thread while matching continues against the old gallery. Returns True
+        if the gallery was replaced.
+        """
+        with self._reload_lock:
+            header = read_header(self.store_path)
+            if not force and header is not None and header.get("generation") == self.generation:
+                return False
+            return self.load_database()
+
+    @property
+    def can_align(self):
+        """True when faces can be aligned from landmarks and embedded in batches."""
+        return self.rec_model is not None and self._face_align is not None
+
+    def align_face(self, face_img, landmarks):
+        """ArcFace-aligned 112x112 crop from a full frame and (5, 2) landmarks."""
+        return self._face_align.norm_crop(face_img, landmark=landmarks)
+
+    def embed_aligned(self, aligned_faces):
+        """Run one recognition forward pass over a list of aligned crops. Returns (K, 512)."""
+        if not aligned_faces:
+            return np.zeros((0, 512), dtype=np.float32)
+        return self.rec_model.get_feat(list(aligned_faces))
+
+    def _aligned_slots(self, count):
+        """(count, 112, 112, 3) view of this thread's reusable alignment buffer."""
+        buffer = getattr(self._local, "aligned", None)
+        if buffer is None or len(buffer) < count:
+            size = max(count, 2 * len(buffer)) if buffer is not None else max(count, 32)
+            buffer = self._local.aligned = np.zeros((size, 112, 112, 3), dtype=np.uint8)
+        return buffer[:count]
+
+    def recognize_batch(self, face_img, landmarks_list):
+        """
+        recognize() for several faces of one frame: every face is aligned into a shared
+        buffer, embedded in one forward pass and scored in one matrix multiply.
+        Returns a (name, score) per landmarks entry.
+        """
+        if not landmarks_list:
+            return []
+        if self.rec_model is None:
+            return [("ModelError", 0.0)] * len(landmarks_list)
+        if self._face_align is None:
+            return [self.recognize(face_img, landmarks=lm) for lm in landmarks_list]
+
+        slots = self._aligned_slots(len(landmarks_list))
+        results = [("AlignError", 0.0)] * len(landmarks_list)
+        aligned = []  # indexes into landmarks_list that have a filled slot
+        for k, landmarks in enumerate(landmarks_list):
+            try:
+                matrix = self._face_align.estimate_norm(landmarks, 112)
+                cv.warpAffine(face_img, matrix, (112, 112), dst=slots[len(aligned)], borderValue=0.0)
+            except Exception as e:
+                print(f"Align Error: {e}")
+                continue
+            aligned.append(k)
+        if not aligned:
+            return results
+
+        embeddings = self.rec_model.get_feat(list(slots[:len(aligned)]))
+        for k, match in zip(aligned, self.match_embeddings(embeddings)):
+            results[k] = match
+        return results
 
     def recognize(self, face_img, landmarks=None):
         """
@@ -78,7 +189,7 @@ class FaceRecognizer:
         if landmarks is not None and self._face_align is not None:
              # Fast Path: Alignment -> Embedding
              try:
-                 norm_face = self._face_align.norm_crop(face_img, landmark=landmarks)
+                 norm_face = self.align_face(face_img, landmarks)
                  embedding = self.rec_model.get_feat(norm_face).flatten()
              except Exception as e:
                  print(f"Align Error: {e}")
@@ -91,25 +202,36 @@ class FaceRecognizer:
              target = sorted(faces, key=lambda x: (x.bbox[2]-x.bbox[0]) * (x.bbox[3]-x.bbox[1]), reverse=True)[0]
              embedding = target.embedding
 
-        # Normalize input embedding
-        emb_norm = float(np.linalg.norm(embedding))
-        if emb_norm < 1e-10:
-            return "Unknown", 0.0
-        embedding = embedding / emb_norm
-        
-        if len(self.known_embeddings) == 0:
-            return "Unknown", 0.0
-
-        # Vectorized Matching: (N, 512) @ (512,) -> (N,)
-        scores = np.dot(self.known_embeddings, embedding)
-        best_idx = np.argmax(scores)
-        max_score = scores[best_idx]
-        second_best = -1.0
-        if len(scores) > 1:
-            second_best = np.partition(scores, -2)[-2]
-        margin = max_score - second_best if second_best >= 0 else 1.0
-        
-        if max_score > self.threshold and margin >= self.min_margin:
-            return self.known_names[best_idx], float(max_score)
-        else:
-            return "Unknown", float(max_score)
+        return self.match_embedding(embedding)
+
+    def match_embedding(self, embedding):
+        """Score one raw embedding against the gallery. Returns (name, score)."""
+        return self.match_embeddings(np.asarray(embedding).reshape(1, -1))[0]
+
+    def match_embeddings(self, embeddings):
+        """Score (K, 512) raw embeddings against the gallery at once. Returns K (name, score)."""
+        embeddings = np.asarray(embeddings)
+        gallery = self._gallery  # one consistent generation even if a reload swaps it meanwhile
+        # Normalize input embeddings
+        norms = np.linalg.norm(embeddings, axis=1)
+        valid = norms >= 1e-10
+        if gallery.index is None or len(gallery.index) == 0:
+            return [("Unknown", 0.0)] * len(embeddings)
+        embeddings = embeddings / np.where(valid, norms, 1.0)[:, None]
+
+        # Top-2 gallery matches per embedding: (K, 2) scores and row indices
+        scores, indices = gallery.index.search(embeddings)
+        best_idx = indices[:, 0]
+        max_score = scores[:, 0]
+        second_best = np.where(indices[:, 1] >= 0, scores[:, 1], -1.0)
+        margin = np.where(second_best >= 0, max_score - second_best, 1.0)
+
+        results = []
+        for k in range(len(embeddings)):
+            if not valid[k]:
+                results.append(("Unknown", 0.0))
+            elif max_score[k] > self.threshold and margin[k] >= self.min_margin:
+                results.append((str(gallery.names[best_idx[k]]), float(max_score[k])))
+            else:
+                results.append(("Unknown", float(max_score[k])))
+        return results
@@ -0,0 +1,131 @@
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Per-slot header: seq, nbytes, height, width, channels, timestamp (microseconds), frame id
+_HEADER_FIELDS = 7
+_CONTROL_FIELDS = 2  # latest seq, slot capacity
+
+
+def _open_shm(name):
+    """Attach to an existing segment; the creator owns unlinking."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: attaching registers the name again, but spawned children share
+        # the creator's resource tracker, so the duplicate is harmless. Unregistering
+        # here would drop the creator's entry too.
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedFrameRing:
+    """
+    Single-writer, multi-reader ring of frame slots in multiprocessing shared memory.
+
+    Frames (uint8 arrays) or encoded buffers (bytes) are copied into the next slot
+    instead of being pickled through a pipe. Readers always take the newest slot;
+    a per-slot sequence number acts as a seqlock so a torn read is detected and retried.
+    """
+
+    def __init__(self, shm, slots, slot_bytes, owner):
+        self.shm = shm
+        self.slots = int(slots)
+        self.slot_bytes = int(slot_bytes)
+        self.owner = owner
+        header_len = (_CONTROL_FIELDS + self.slots * _HEADER_FIELDS) * 8
+        self._control = np.ndarray((_CONTROL_FIELDS,), dtype=np.int64, buffer=shm.buf, offset=0)
+        self._headers = np.ndarray(
+            (self.slots, _HEADER_FIELDS), dtype=np.int64, buffer=shm.buf, offset=_CONTROL_FIELDS * 8
+        )
+        self._data = np.ndarray(
+            (self.slots, self.slot_bytes), dtype=np.uint8, buffer=shm.buf, offset=header_len
+        )
+        self._write_seq = int(self._control[0])
+
+    @classmethod
+    def create(cls, slots=3, slot_bytes=1920 * 1080 * 3):
+        slots = max(2, int(slots))
+        size = (_CONTROL_FIELDS + slots * _HEADER_FIELDS) * 8 + slots * int(slot_bytes)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        ring = cls(shm, slots, slot_bytes, owner=True)
+        ring._control[:] = (0, slot_bytes)
+        ring._headers[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, spec):
+        name, slots, slot_bytes = spec
+        return cls(_open_shm(name), slots, slot_bytes, owner=False)
+
+    @property
+    def spec(self):
+        """Picklable (name, slots, slot_bytes) for attaching from another process."""
+        return (self.shm.name, self.slots, self.slot_bytes)
+
+    @property
+    def latest_seq(self):
+        return int(self._control[0])
+
+    def write(self, payload, timestamp=None, frame_id=0) -> int:
+        """
+        Copy a uint8 frame or a bytes buffer into the next slot. Returns its sequence number.
+        frame_id is an opaque caller id stored alongside (e.g. when not every frame is written).
+        """
+        if isinstance(payload, np.ndarray):
+            view = np.ascontiguousarray(payload, dtype=np.uint8)
+            shape = view.shape + (0,) * (3 - view.ndim)
+            flat = view.reshape(-1)
+        else:
+            flat = np.frombuffer(payload, dtype=np.uint8)
+            shape = (0, 0, 0)
+        nbytes = flat.size
+        if nbytes > self.slot_bytes:
+            raise ValueError(f"Payload of {nbytes} bytes exceeds ring slot size {self.slot_bytes}")
+
+        seq = self._write_seq + 1
+        slot = seq % self.slots
+        self._headers[slot, 0] = -1  # mark slot as being written
+        self._data[slot, :nbytes] = flat
+        ts = time.time() if timestamp is None else timestamp
+        self._headers[slot, 1:] = (nbytes, shape[0], shape[1], shape[2], int(ts * 1e6), int(frame_id))
+        self._headers[slot, 0] = seq
+        self._control[0] = seq
+        self._write_seq = seq
+        return seq
+
+    def read_latest(self, after_seq=0, retries=3):
+        """
+        Newest (seq, payload, timestamp, frame_id) newer than after_seq, or None.
+        payload is an (h, w[, c]) uint8 array for frames and bytes for buffers.
+        """
+        for _ in range(retries):
+            seq = int(self._control[0])
+            if seq <= after_seq:
+                return None
+            slot = seq % self.slots
+            if int(self._headers[slot, 0]) != seq:
+                continue
+            nbytes, h, w, c, ts_us, frame_id = (int(v) for v in self._headers[slot, 1:])
+            data = self._data[slot, :nbytes].copy()
+            if int(self._headers[slot, 0]) != seq:
+                continue  # overwritten while copying
+            if h > 0:
+                payload = data.reshape((h, w, c) if c > 0 else (h, w))
+            else:
+                payload = data.tobytes()
+            return seq, payload, ts_us / 1e6, frame_id
+        return None
+
+    def close(self):
+        # Drop numpy views first; SharedMemory.close fails while buffers are exported.
+        self._control = self._headers = self._data = None
+        try:
+            self.shm.close()
+        except Exception:
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except Exception:
+                pass
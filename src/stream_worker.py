@@ -0,0 +1,389 @@
+"""
+Run one stream's full pipeline in a dedicated worker process.
+
+The API process keeps a StreamWorkerProcess handle per stream. Decoded browser
+frames go to the worker and annotated JPEGs come back through SharedFrameRing
+shared-memory buffers; events, logs and per-frame stats are forwarded over a
+multiprocessing queue and replayed into the API's in-memory state.
+"""
+
+import logging
+import multiprocessing as mp
+import queue
+import threading
+import time
+from functools import partial
+
+import cv2 as cv
+import numpy as np
+
+from src.motion import MotionGate, TrackPredictor
+from src.shm_ring import SharedFrameRing
+
+logger = logging.getLogger(__name__)
+
+
+def _load_models(spec, send_log):
+    # Imported here so the API process does not pay for them when only spawning.
+    from src.detector import create_face_detector
+    from src.behavior_classifier import BehaviorClassifier
+
+    detector = create_face_detector(**spec["detector"])
+    if spec.get("tiled_detection"):
+        from src.tiled_detector import TiledFaceDetector
+
+        detector = TiledFaceDetector(
+            detector, partial(create_face_detector, **spec["detector"]), **spec["tiled_detection"]
+        )
+    recognizer = _create_recognizer(spec, spec["faces_dir"]) if spec.get("faces_dir") else None
+    behavior_classifier = None
+    if spec.get("behavior_model_path"):
+        behavior_classifier = BehaviorClassifier(spec["behavior_model_path"])
+    send_log(
+        "Worker models loaded",
+        "system",
+        recognizer_loaded=recognizer is not None,
+        behavior_classifier_loaded=behavior_classifier is not None,
+    )
+    return detector, recognizer, behavior_classifier
+
+
+def _create_recognizer(spec, faces_dir):
+    from src.recognizer import FaceRecognizer
+
+    return FaceRecognizer(
+        faces_dir=faces_dir,
+        threshold=spec["recognition_threshold"],
+        min_margin=spec["recognition_min_margin"],
+        index=spec.get("gallery_index", "exact"),
+        index_options=spec.get("gallery_index_options"),
+    )
+
+
+class _RenderGate:
+    """
+    Worker-side should_render callback. The API relay publishes its viewers' shortest
+    frame interval into a shared double (negative = nobody watching).
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._rendered_at = 0.0
+
+    def __call__(self):
+        interval = self.interval.value
+        now = time.monotonic()
+        if interval < 0 or now - self._rendered_at < interval:
+            return False
+        self._rendered_at = now
+        return True
+
+
+class _GalleryWatcher:
+    """
+    Reloads the worker's recognizer when the API publishes a newer gallery generation
+    into a shared integer. The reload runs on a background thread; frames keep being
+    matched against the old gallery until the new one is swapped in. A worker started
+    without a gallery builds its recognizer with create_recognizer on the first bump and
+    attaches it to processor.
+    """
+
+    def __init__(self, recognizer, generation, send_log, create_recognizer=None):
+        self.recognizer = recognizer
+        self.generation = generation
+        self.send_log = send_log
+        self.create_recognizer = create_recognizer
+        self.processor = None
+        self._thread = None
+
+    def poll(self):
+        if self.recognizer is None and self.create_recognizer is None:
+            return
+        current = self.recognizer.generation if self.recognizer is not None else 0
+        if self.generation.value <= current:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._reload, name="gallery-reload", daemon=True)
+        self._thread.start()
+
+    def _reload(self):
+        before = self.recognizer.generation if self.recognizer is not None else 0
+        try:
+            if self.recognizer is None:
+                self.recognizer = self.create_recognizer()  # loads the store, if it is readable yet
+            else:
+                self.recognizer.reload_database()
+            if self.recognizer.generation > before:
+                # Streams started without a gallery get the recognizer once it has one.
+                if self.processor is not None and self.processor.recognizer is None:
+                    self.processor.recognizer = self.recognizer
+                self.send_log(
+                    "Worker gallery reloaded", "system",
+                    generation=self.recognizer.generation, known_identities=len(self.recognizer.known_names),
+                )
+        except Exception as e:
+            self.send_log("Worker gallery reload failed", "error", error=str(e))
+        current = self.recognizer.generation if self.recognizer is not None else 0
+        if self.generation.value > current:
+            time.sleep(1.0)  # store not readable yet (or failed): retry on a later poll, not in a tight loop
+
+
+def _processor_kwargs(spec, detector, recognizer, behavior_classifier, event_callback, should_render):
+    return dict(
+        detector=detector,
+        recognizer=recognizer,
+        behavior_classifier=behavior_classifier,
+        behavior_interval=spec["behavior_interval"],
+        detect_interval=spec["detect_interval"],
+        recheck_interval=spec["recheck_interval"],
+        processing_width=spec["processing_width"],
+        event_callback=event_callback,
+        min_recognition_face_size=spec["min_recognition_face_size"],
+        min_recognition_face_score=spec["min_recognition_face_score"],
+        behavior_max_batch=spec["behavior_max_batch"],
+        camera_id=spec["camera_id"],
+        draw_overlays=spec.get("draw_overlays", True),
+        should_render=should_render,
+        motion_gate=MotionGate(**spec["motion_gate"]) if spec.get("motion_gate") else None,
+        track_predictor=TrackPredictor(**spec["track_prediction"]) if spec.get("track_prediction") else None,
+    )
+
+
+def run_stream_worker(spec, in_ring_spec, out_ring_spec, messages, stop_event, render_interval, gallery_generation):
+    """Worker process entry point."""
+    def send(kind, *payload):
+        try:
+            messages.put((kind,) + payload)
+        except Exception:
+            pass
+
+    def send_log(message, level="info", **details):
+        send("log", message, level, details)
+
+    in_ring = SharedFrameRing.attach(in_ring_spec) if in_ring_spec else None
+    out_ring = SharedFrameRing.attach(out_ring_spec)
+    end_reason = "stopped"
+    try:
+        detector, recognizer, behavior_classifier = _load_models(spec, send_log)
+        gallery_dir = spec.get("gallery_dir")
+        gallery = _GalleryWatcher(
+            recognizer, gallery_generation, send_log,
+            create_recognizer=partial(_create_recognizer, spec, gallery_dir) if gallery_dir else None,
+        )
+        kwargs = _processor_kwargs(
+            spec, detector, recognizer, behavior_classifier, lambda event: send("event", event),
+            _RenderGate(render_interval),
+        )
+
+        def publish(annotated, count, captured_at, frame_id, frame_size, tracks=None):
+            # annotated is None when nobody is watching: only the metadata goes out.
+            seq = None
+            if annotated is not None:
+                ok, buffer = cv.imencode(".jpg", annotated, [cv.IMWRITE_JPEG_QUALITY, spec["jpeg_quality"]])
+                if ok:
+                    seq = out_ring.write(buffer.tobytes(), timestamp=captured_at, frame_id=frame_id)
+            send("frame", {
+                "seq": seq,
+                "frame_id": frame_id,
+                "count": int(count),
+                "captured_at": captured_at,
+                "tracks": tracks,
+                "frame_size": frame_size,
+            })
+
+        if spec["source_type"] == "frontend":
+            from src.frontend_processor import FrontendWebcamProcessor
+
+            processor = FrontendWebcamProcessor(**kwargs)
+            gallery.processor = processor
+            last_seq = 0
+            while not stop_event.is_set():
+                latest = in_ring.read_latest(after_seq=last_seq)
+                if latest is None:
+                    time.sleep(0.002)
+                    continue
+                last_seq, frame, received_at, _ = latest
+                gallery.poll()
+                if isinstance(frame, bytes):
+                    # Encoded browser frame: decode here rather than on the API event loop.
+                    frame = cv.imdecode(np.frombuffer(frame, dtype=np.uint8), cv.IMREAD_COLOR)
+                    if frame is None:
+                        continue
+                count, annotated = processor.process_frame(frame)
+                if processor.frame_width is not None:
+                    publish(
+                        annotated, count, received_at, last_seq,
+                        [processor.frame_width, processor.frame_height], tracks=processor.last_tracks,
+                    )
+        else:
+            from src.monitor import ClassroomMonitorStage2
+
+            monitor = ClassroomMonitorStage2(input_source=spec["source"], **kwargs)
+            gallery.processor = monitor
+            is_upload = spec["source_type"] == "upload"
+            reader = monitor.start_capture(
+                queue_size=spec["capture_queue_size"],
+                drop_policy="block" if is_upload else spec["capture_drop_policy"],
+                reconnect=not is_upload,
+                read_retry_count=spec["read_retry_count"],
+                read_retry_interval=spec["read_retry_interval"],
+                log_callback=send_log,
+            )
+            try:
+                while not stop_event.is_set():
+                    packet = monitor.read_frame(timeout=0.5)
+                    if packet is None:
+                        if reader.ended:
+                            end_reason = reader.end_reason
+                            break
+                        continue
+                    gallery.poll()
+                    processed_frame, count = monitor.process_frame(packet.frame)
+                    publish(
+                        processed_frame if monitor.rendered else None, count, packet.captured_at, packet.frame_id,
+                        [processed_frame.shape[1], processed_frame.shape[0]], tracks=monitor.last_tracks,
+                    )
+            finally:
+                monitor.release()
+                try:
+                    monitor.profiler.save()
+                except Exception as e:
+                    logger.warning(f"Profiler save failed: {e}")
+    except Exception as e:
+        end_reason = "error"
+        send_log("Stream worker error", "error", error=str(e))
+    finally:
+        send("ended", end_reason)
+        if in_ring is not None:
+            in_ring.close()
+        out_ring.close()
+
+
+class StreamWorkerProcess:
+    """
+    API-side handle for a stream running in its own process.
+
+    on_message(kind, *payload) is called on a drain thread for "log", "event",
+    "frame" and "ended" messages from the worker.
+    """
+
+    def __init__(self, stream_id, spec, on_message=None, ring_slots=3, max_frame_bytes=1920 * 1080 * 3,
+                 max_jpeg_bytes=2 * 1024 * 1024):
+        self.stream_id = stream_id
+        self.on_message = on_message
+        ctx = mp.get_context("spawn")
+        self.in_ring = None
+        if spec["source_type"] == "frontend":
+            self.in_ring = SharedFrameRing.create(slots=ring_slots, slot_bytes=max_frame_bytes)
+        self.out_ring = SharedFrameRing.create(slots=ring_slots, slot_bytes=max_jpeg_bytes)
+        self.messages = ctx.Queue()
+        self.stop_event = ctx.Event()
+        # Shortest frame interval the API-side viewers want; negative = render nothing.
+        self.render_interval = ctx.Value("d", -1.0, lock=False)
+        # Newest embedding store generation; the worker reloads its recognizer when it grows.
+        self.gallery_generation = ctx.Value("q", 0, lock=False)
+        self.process = ctx.Process(
+            target=run_stream_worker,
+            args=(
+                spec,
+                self.in_ring.spec if self.in_ring is not None else None,
+                self.out_ring.spec,
+                self.messages,
+                self.stop_event,
+                self.render_interval,
+                self.gallery_generation,
+            ),
+            name=f"stream-worker-{stream_id}",
+            daemon=True,
+        )
+        self._cond = threading.Condition()
+        self._drain_thread = None
+        self.last_frame = {"seq": None, "frame_id": 0, "count": 0, "captured_at": None}
+        self.ended = False
+        self.end_reason = None
+        self._closed = False
+
+    def start(self):
+        self.process.start()
+        self._drain_thread = threading.Thread(
+            target=self._drain, name=f"stream-worker-drain-{self.stream_id}", daemon=True
+        )
+        self._drain_thread.start()
+        return self
+
+    def submit_frame(self, frame, timestamp=None):
+        """Hand a frame (decoded array or encoded JPEG bytes) to the worker; the newest frame wins."""
+        with self._cond:
+            if self._closed:
+                return None
+            return self.in_ring.write(frame, timestamp=timestamp)
+
+    def set_render_interval(self, interval):
+        """Shortest interval between rendered frames the viewers want; None = nobody watching."""
+        self.render_interval.value = -1.0 if interval is None else float(interval)
+
+    def set_gallery_generation(self, generation):
+        """Tell the worker a newer embedding store generation is on disk."""
+        self.gallery_generation.value = int(generation)
+
+    def wait_for_frame(self, after_seq=0, timeout=0.5):
+        """Newest (seq, jpeg_bytes, captured_at, frame_id) after after_seq, or None on timeout / end."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._closed and self.out_ring.latest_seq <= after_seq and not self.ended:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            if self._closed:
+                return None
+            return self.out_ring.read_latest(after_seq=after_seq)
+
+    def release(self, timeout=5.0):
+        self.stop_event.set()
+        self.process.join(timeout=timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=1.0)
+        if self._drain_thread is not None and self._drain_thread is not threading.current_thread():
+            self._drain_thread.join(timeout=1.0)
+        with self._cond:
+            if self._closed:
+                return
+            self.ended = True
+            self._closed = True
+            self._cond.notify_all()
+            if self.in_ring is not None:
+                self.in_ring.close()
+            self.out_ring.close()
+
+    def _dispatch(self, message):
+        if self.on_message is None:
+            return
+        try:
+            self.on_message(*message)
+        except Exception as e:
+            logger.warning(f"Worker message handler failed: {e}")
+
+    def _drain(self):
+        while True:
+            try:
+                message = self.messages.get(timeout=0.2)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    break
+                continue
+            kind = message[0]
+            if kind == "frame":
+                with self._cond:
+                    self.last_frame = message[1]
+                    self._cond.notify_all()
+            self._dispatch(message)
+            if kind == "ended":
+                with self._cond:
+                    self.end_reason = message[1]
+                break
+        with self._cond:
+            self.ended = True
+            self._cond.notify_all()
@@ -0,0 +1,176 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2 as cv
+import numpy as np
+
+# Smallest tile worth running: YuNet's coarsest feature stride. Thinner slivers (e.g. a
+# very narrow region) would give set_input_size a 0-px side and fail on every frame.
+MIN_TILE = 32
+
+
+def parse_regions(raw):
+    """
+    Parse "x1,y1,x2,y2;..." (fractions of the frame, 0-1) into a list of 4-tuples.
+    Invalid or empty regions are dropped.
+    """
+    regions = []
+    for part in (raw or "").split(";"):
+        try:
+            x1, y1, x2, y2 = (min(1.0, max(0.0, float(v))) for v in part.split(","))
+        except ValueError:
+            continue
+        if x2 > x1 and y2 > y1:
+            regions.append((x1, y1, x2, y2))
+    return regions
+
+
+def _tile_spans(start, end, size, overlap):
+    """Start offsets of tiles of `size` covering [start, end) with the given overlap."""
+    length = end - start
+    if length <= size:
+        return [start]
+    step = max(1, int(size * (1.0 - overlap)))
+    spans = list(range(start, end - size, step))
+    spans.append(end - size)
+    return spans
+
+
+class TiledFaceDetector:
+    """
+    Coarse full-frame face detection plus higher-resolution tiles over chosen regions.
+
+    The coarse pass runs the shared detector on the processing-size frame as usual.
+    Each region (e.g. the back rows) is cut from the full-resolution source frame,
+    scaled by tile_scale and split into overlapping tiles of at most tile_size pixels
+    (regions thinner than MIN_TILE there are skipped).
+    Tiles run in parallel, each on its own detector instance sized for that tile;
+    batched detectors (the onnxruntime backend) share one instance per tile size and
+    run those tiles in a single detect_batch call.
+    All faces are mapped back to processing-frame coordinates and merged with NMS, so
+    callers get the same (N, 15) YuNet rows as from YunetFaceDetector.detect.
+    """
+
+    def __init__(self, detector, detector_factory, regions, tile_scale=1.0, tile_size=640,
+                 overlap=0.2, workers=4, nms_threshold=0.3):
+        self.detector = detector
+        self.detector_factory = detector_factory
+        self.regions = list(regions)
+        self.tile_scale = float(tile_scale)
+        self.tile_size = max(64, int(tile_size))
+        self.overlap = min(0.9, max(0.0, float(overlap)))
+        self.nms_threshold = float(nms_threshold)
+        self.input_size = None
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="face-tile")
+        self._closed = False
+        self._tiles = []  # (x, y, w, h) in scaled-source pixels
+        self._groups = []  # (detector, tile indices) run as one job
+        self._layout_key = None
+
+    def set_input_size(self, width, height):
+        self.input_size = (int(width), int(height))
+        self.detector.set_input_size(width, height)
+
+    def _layout(self, source_shape):
+        """Tile rectangles for this source size; detectors are (re)created when it changes."""
+        key = source_shape[:2]
+        if key == self._layout_key:
+            return
+        h, w = key
+        sw, sh = round(w * self.tile_scale), round(h * self.tile_scale)
+        tiles = []
+        for x1, y1, x2, y2 in self.regions:
+            rx1, ry1, rx2, ry2 = int(x1 * sw), int(y1 * sh), int(x2 * sw), int(y2 * sh)
+            for ty in _tile_spans(ry1, ry2, self.tile_size, self.overlap):
+                for tx in _tile_spans(rx1, rx2, self.tile_size, self.overlap):
+                    tw, th = min(self.tile_size, rx2 - tx), min(self.tile_size, ry2 - ty)
+                    if tw >= MIN_TILE and th >= MIN_TILE:
+                        tiles.append((tx, ty, tw, th))
+        groups = []
+        by_size = {}
+        for index, (_, _, tw, th) in enumerate(tiles):
+            if (tw, th) in by_size:
+                by_size[(tw, th)][1].append(index)
+                continue
+            detector = self.detector_factory()
+            detector.set_input_size(tw, th)
+            groups.append((detector, [index]))
+            if getattr(detector, "batched", False):
+                by_size[(tw, th)] = groups[-1]
+        self._tiles, self._groups, self._layout_key = tiles, groups, key
+
+    def _detect_tiles(self, scaled, detector, indices):
+        crops = [
+            np.ascontiguousarray(scaled[ty:ty + th, tx:tx + tw])
+            for tx, ty, tw, th in (self._tiles[i] for i in indices)
+        ]
+        if len(crops) > 1:
+            results = detector.detect_batch(crops)
+        else:
+            results = [detector.detect(crops[0])]
+        found = []
+        for index, faces in zip(indices, results):
+            if len(faces) == 0:
+                continue
+            tx, ty = self._tiles[index][:2]
+            faces = np.array(faces, dtype=np.float32)
+            # Columns: x, y, w, h, five landmark (x, y) pairs, score.
+            faces[:, [0, 4, 6, 8, 10, 12]] += tx
+            faces[:, [1, 5, 7, 9, 11, 13]] += ty
+            found.append(faces)
+        return found
+
+    def detect(self, image, source=None):
+        """
+        Faces in `image` coordinates. source: the full-resolution frame `image` was
+        resized from (defaults to image itself).
+        """
+        if self._closed:
+            return self.detector.detect(image)
+        source = image if source is None else source
+        scaled = source
+        tile_jobs = []
+        try:
+            coarse = self._pool.submit(self.detector.detect, image)
+            if self.regions:
+                self._layout(source.shape)
+            if self._groups:
+                if self.tile_scale != 1.0:
+                    scaled = cv.resize(source, (round(source.shape[1] * self.tile_scale),
+                                                round(source.shape[0] * self.tile_scale)),
+                                       interpolation=cv.INTER_AREA if self.tile_scale < 1.0 else cv.INTER_LINEAR)
+                tile_jobs = [
+                    self._pool.submit(self._detect_tiles, scaled, detector, indices)
+                    for detector, indices in self._groups
+                ]
+        except RuntimeError:
+            # close() shut the pool down while this frame was in flight: finish it untiled.
+            return self.detector.detect(image)
+
+        results = []
+        if tile_jobs:
+            # Tile coordinates -> image coordinates.
+            fx = image.shape[1] / scaled.shape[1]
+            fy = image.shape[0] / scaled.shape[0]
+            for job in tile_jobs:
+                for faces in job.result():
+                    faces[:, 0:14:2] *= fx
+                    faces[:, 1:14:2] *= fy
+                    results.append(faces)
+
+        faces = coarse.result()
+        if len(faces) > 0:
+            results.append(np.asarray(faces, dtype=np.float32))
+        if not results:
+            return []
+        merged = np.concatenate(results, axis=0)
+        if len(results) == 1:
+            return merged
+        keep = cv.dnn.NMSBoxes(
+            merged[:, :4].tolist(), merged[:, -1].tolist(), score_threshold=0.0, nms_threshold=self.nms_threshold
+        )
+        return merged[np.array(keep, dtype=int).reshape(-1)]
+
+    def close(self):
+        """Stop the tile threads. Safe while another thread is in detect(): later frames run untiled."""
+        self._closed = True
+        self._pool.shutdown(wait=False)
@@ -17,7 +17,8 @@ class TrackManager:
         id_history_size=8,
         min_id_hits=2,
         min_recognition_face_size=36,
-        min_recognition_face_score=0.70
+        min_recognition_face_score=0.70,
+        inference_broker=None
     ):
         self.recheck_interval = recheck_interval
         self.behavior_classifier = behavior_classifier
@@ -28,6 +29,8 @@ class TrackManager:
         self.min_id_hits = min_id_hits
         self.min_recognition_face_size = min_recognition_face_size
         self.min_recognition_face_score = min_recognition_face_score
+        # Optional shared InferenceBroker: batches behavior/recognition across streams.
+        self.inference_broker = inference_broker
         self.enable_self_learning = os.getenv("ENABLE_SELF_LEARNING", "false").strip().lower() in {
             "1", "true", "yes", "on"
         }
@@ -181,6 +184,12 @@ class TrackManager:
         # --- Face Recognition Execution (oldest-first fairness) ---
         if recognizer and due_recognition:
             due_recognition.sort(key=lambda x: x[0])
+            # With a broker, aligned faces are sent together and batched with other streams.
+            use_broker = self.inference_broker is not None and getattr(recognizer, "can_align", False)
+            # Otherwise faces with landmarks are embedded together in one recognize_batch call.
+            use_batch = not use_broker and hasattr(recognizer, "recognize_batch")
+            aligned_jobs = []
+            landmark_jobs = []
             for _, i, track_id, best_match_face in due_recognition:
                 meta = self.track_metadata.get(track_id)
                 if not meta:
@@ -198,6 +207,12 @@ class TrackManager:
                             meta['last_check_time'] = current_time
                             continue
                         lm = best_match_face[4:14].reshape(5, 2).astype(np.float32)
+                        if use_broker:
+                            aligned_jobs.append((track_id, recognizer.align_face(frame, lm)))
+                            continue
+                        if use_batch:
+                            landmark_jobs.append((track_id, lm))
+                            continue
                         rec_name, rec_conf = recognizer.recognize(frame, landmarks=lm)
                     else:
                         # Fallback path for skipped/failed detector frames.
@@ -211,10 +226,35 @@ class TrackManager:
                 except Exception:
                     rec_name, rec_conf = "Unknown", 0.0
 
-                if rec_name != "Unknown":
-                    meta['id_history'].append((rec_name, float(rec_conf)))
-                    self._stabilize_identity(meta, current_time)
-                meta['last_check_time'] = current_time
+                self._apply_recognition(meta, rec_name, rec_conf, current_time)
+
+            if landmark_jobs:
+                if profiler:
+                    profiler.start('recognition_batch')
+                try:
+                    results = recognizer.recognize_batch(frame, [lm for _, lm in landmark_jobs])
+                except Exception:
+                    results = [("Unknown", 0.0)] * len(landmark_jobs)
+                if profiler:
+                    profiler.stop('recognition_batch')
+                for (track_id, _), (rec_name, rec_conf) in zip(landmark_jobs, results):
+                    meta = self.track_metadata.get(track_id)
+                    if meta:
+                        self._apply_recognition(meta, rec_name, rec_conf, current_time)
+
+            if aligned_jobs:
+                if profiler:
+                    profiler.start('recognition_broker')
+                try:
+                    results = self.inference_broker.recognize_aligned([face for _, face in aligned_jobs])
+                except Exception:
+                    results = [("Unknown", 0.0)] * len(aligned_jobs)
+                if profiler:
+                    profiler.stop('recognition_broker')
+                for (track_id, _), (rec_name, rec_conf) in zip(aligned_jobs, results):
+                    meta = self.track_metadata.get(track_id)
+                    if meta:
+                        self._apply_recognition(meta, rec_name, rec_conf, current_time)
 
         # --- Behavior Crop Build (oldest-first fairness) ---
         if self.behavior_classifier and due_behavior:
@@ -278,7 +318,10 @@ class TrackManager:
         if behavior_crops:
             if profiler:
                 profiler.start('behavior_inference')
-            results = self.behavior_classifier.classify_batch(behavior_crops)
+            if self.inference_broker is not None:
+                results = self.inference_broker.classify_behavior(behavior_crops)
+            else:
+                results = self.behavior_classifier.classify_batch(behavior_crops)
             if profiler:
                 profiler.stop('behavior_inference')
             
@@ -309,6 +352,12 @@ class TrackManager:
 
     # _match_face Removed (Integrated into process_batch)
 
+    def _apply_recognition(self, meta, rec_name, rec_conf, current_time):
+        if rec_name != "Unknown":
+            meta['id_history'].append((rec_name, float(rec_conf)))
+            self._stabilize_identity(meta, current_time)
+        meta['last_check_time'] = current_time
+
     def _stabilize_identity(self, meta, current_time):
         """
         Stabilize recognition over multiple observations to prevent ID flicker.
@@ -1,3 +1,6 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Tuple, Union
 
@@ -34,6 +37,12 @@ def _load_font(size: int) -> Union[ImageFont.FreeTypeFont, ImageFont.ImageFont]:
     return ImageFont.load_default()
 
 
+@lru_cache(maxsize=None)
+def _cached_font(size: int) -> Union[ImageFont.FreeTypeFont, ImageFont.ImageFont]:
+    """_load_font probes the filesystem; do it once per size."""
+    return _load_font(size)
+
+
 def _bgr_to_rgb(color: Tuple[int, int, int]) -> Tuple[int, int, int]:
     b, g, r = color
     return (r, g, b)
@@ -58,29 +67,29 @@ def _draw_text(
     draw.text((x, y), text, font=font, fill=fill_rgb)
 
 
-def draw_tracking_results(frame, detections, track_metadata, active_names):
+def _resolve_name(track_id: int, name: str, active_names) -> str:
+    """A name claimed by several tracks is only shown on the winning one."""
+    if name != "Unknown":
+        winner_id, _ = active_names.get(name, (-1, 0))
+        if winner_id != track_id:
+            return "Unknown"
+    return name
+
+
+def _overlay_layout(detections, track_metadata, active_names, w_frame, h_frame):
     """
-    Draw bounding boxes and labels for all tracks using the dashboard palette.
+    Yield (box, color, [(text, x, y, fill_rgb), ...]) per track; box is (x, y, w, h).
+    Shared by the OpenCV and PIL renderers so both draw the same overlay.
     """
-    h_frame, w_frame = frame.shape[:2]
-    font = _load_font(FONT_SIZE)
-    frame_rgb = cv.cvtColor(frame, cv.COLOR_BGR2RGB)
-    image = Image.fromarray(frame_rgb)
-    draw = ImageDraw.Draw(image)
-
     for i in range(len(detections)):
         x1, y1, x2, y2 = map(int, detections.xyxy[i])
         track_id = int(detections.tracker_id[i]) if detections.tracker_id is not None else -1
+        meta = track_metadata.get(track_id, {})
 
-        name = track_metadata.get(track_id, {}).get("name", "Unknown")
-        conf = track_metadata.get(track_id, {}).get("conf", 0.0)
+        name = _resolve_name(track_id, meta.get("name", "Unknown"), active_names)
+        conf = meta.get("conf", 0.0)
 
-        if name != "Unknown":
-            winner_id, _ = active_names.get(name, (-1, 0))
-            if winner_id != track_id:
-                name = "Unknown"
-
-        behavior_box = track_metadata.get(track_id, {}).get("last_behavior_box")
+        behavior_box = meta.get("last_behavior_box")
         if behavior_box:
             bx1, by1, bx2, by2 = map(int, behavior_box)
             new_x, new_y = bx1, by1
@@ -89,37 +98,152 @@ def draw_tracking_results(frame, detections, track_metadata, active_names):
             new_x, new_y, new_w, new_h = get_expanded_bbox(x1, y1, x2, y2, w_frame, h_frame)
 
         color = KNOWN_BOX_COLOR if name != "Unknown" else UNKNOWN_BOX_COLOR
-        draw.rectangle(
-            [(new_x, new_y), (new_x + new_w, new_y + new_h)],
-            outline=_bgr_to_rgb(color),
-            width=BOX_THICKNESS,
-        )
-
         label = f"{_display_name(name)} {conf:.2f}" if name != "Unknown" else f"#{track_id}"
-        label_y = max(4, new_y - FONT_SIZE - 6)
-        _draw_text(
-            draw,
-            label,
-            new_x + 4,
-            label_y,
-            font,
-            fill_rgb=LABEL_TEXT,
-        )
+        texts = [(label, new_x + 4, max(4, new_y - FONT_SIZE - 6), LABEL_TEXT)]
 
-        beh = track_metadata.get(track_id, {}).get("behavior", "negative")
-        beh_conf = track_metadata.get(track_id, {}).get("behavior_conf", 0.0)
+        beh = meta.get("behavior", "negative")
+        beh_conf = meta.get("behavior_conf", 0.0)
         if beh != "negative":
-            beh_label = f"{beh} {beh_conf:.2f}"
             behavior_y = min(h_frame - FONT_SIZE - 4, new_y + new_h + 4)
-            _draw_text(
-                draw,
-                beh_label,
-                new_x + 4,
-                behavior_y,
-                font,
-                fill_rgb=BEHAVIOR_TEXT,
-            )
+            texts.append((f"{beh} {beh_conf:.2f}", new_x + 4, behavior_y, BEHAVIOR_TEXT))
+
+        yield (new_x, new_y, new_w, new_h), color, texts
+
+
+_SPRITE_CACHE_SIZE = 2048
+_sprite_cache = OrderedDict()  # (text, fill_rgb) -> (dx, dy, premultiplied bgr, per-channel alpha)
+_sprite_lock = threading.Lock()
+
+
+def _label_sprite(text: str, fill_rgb: Tuple[int, int, int]):
+    """
+    Render a label (shadow + text) once into a premultiplied BGR + alpha sprite.
+
+    The label is drawn by PIL onto black and onto white; since PIL composites as
+    frame * (1 - a) + colour * a, the black render is the premultiplied colour and
+    the difference between the two gives a. Blending the sprite therefore matches
+    drawing the text onto the frame with PIL, up to rounding.
+    """
+    key = (text, fill_rgb)
+    with _sprite_lock:
+        sprite = _sprite_cache.get(key)
+        if sprite is not None:
+            _sprite_cache.move_to_end(key)
+            return sprite
+
+    font = _cached_font(FONT_SIZE)
+    left, top, right, bottom = ImageDraw.Draw(Image.new("L", (1, 1))).textbbox((0, 0), text, font=font)
+    size = (max(1, right + 1), max(1, bottom + 1))  # +1 for the shadow offset
+    renders = []
+    for background in (0, 255):
+        canvas = Image.new("RGB", size, (background, background, background))
+        _draw_text(ImageDraw.Draw(canvas), text, 0, 0, font, fill_rgb=fill_rgb)
+        renders.append(np.asarray(canvas, dtype=np.float32)[top:, left:, ::-1])
+    on_black, on_white = renders
+    bgr = np.ascontiguousarray(on_black)
+    alpha = np.ascontiguousarray(1.0 - (on_white - on_black) / 255.0)
+    sprite = (left, top, bgr, alpha)
+
+    with _sprite_lock:
+        _sprite_cache[key] = sprite
+        if len(_sprite_cache) > _SPRITE_CACHE_SIZE:
+            _sprite_cache.popitem(last=False)
+    return sprite
+
+
+def _blend_sprite(frame, sprite, x: int, y: int) -> None:
+    dx, dy, bgr, alpha = sprite
+    x, y = x + dx, y + dy
+    h, w = alpha.shape[:2]
+    fx1, fy1 = max(0, x), max(0, y)
+    fx2, fy2 = min(frame.shape[1], x + w), min(frame.shape[0], y + h)
+    if fx1 >= fx2 or fy1 >= fy2:
+        return
+    sx1, sy1 = fx1 - x, fy1 - y
+    sx2, sy2 = sx1 + (fx2 - fx1), sy1 + (fy2 - fy1)
+    roi = frame[fy1:fy2, fx1:fx2]
+    a = alpha[sy1:sy2, sx1:sx2]
+    blended = roi * (1.0 - a) + bgr[sy1:sy2, sx1:sx2]
+    np.clip(blended + 0.5, 0, 255, out=blended)
+    roi[:] = blended.astype(np.uint8)
+
+
+def _draw_box(frame, x: int, y: int, w: int, h: int, color) -> None:
+    # PIL's rectangle(width=n) draws n one-pixel outlines stepping inwards.
+    for inset in range(BOX_THICKNESS):
+        x1, y1 = x + inset, y + inset
+        x2, y2 = x + w - inset, y + h - inset
+        if x2 < x1 or y2 < y1:
+            break
+        cv.rectangle(frame, (x1, y1), (x2, y2), color, 1, lineType=cv.LINE_8)
+
+
+def draw_tracking_results(frame, detections, track_metadata, active_names):
+    """
+    Draw bounding boxes and labels for all tracks using the dashboard palette.
+    Draws in place on the BGR frame; labels are blended from cached sprites.
+    """
+    h_frame, w_frame = frame.shape[:2]
+    for (x, y, w, h), color, texts in _overlay_layout(detections, track_metadata, active_names, w_frame, h_frame):
+        _draw_box(frame, x, y, w, h, color)
+        for text, tx, ty, fill_rgb in texts:
+            _blend_sprite(frame, _label_sprite(text, fill_rgb), tx, ty)
+    return frame
+
+
+def draw_tracking_results_pil(frame, detections, track_metadata, active_names):
+    """
+    Reference Pillow renderer (whole-frame RGB round trip); kept for scripts/bench_overlay.py.
+    """
+    h_frame, w_frame = frame.shape[:2]
+    font = _cached_font(FONT_SIZE)
+    frame_rgb = cv.cvtColor(frame, cv.COLOR_BGR2RGB)
+    image = Image.fromarray(frame_rgb)
+    draw = ImageDraw.Draw(image)
+
+    for (x, y, w, h), color, texts in _overlay_layout(detections, track_metadata, active_names, w_frame, h_frame):
+        draw.rectangle(
+            [(x, y), (x + w, y + h)],
+            outline=_bgr_to_rgb(color),
+            width=BOX_THICKNESS,
+        )
+        for text, tx, ty, fill_rgb in texts:
+            _draw_text(draw, text, tx, ty, font, fill_rgb=fill_rgb)
 
     annotated_bgr = cv.cvtColor(np.array(image), cv.COLOR_RGB2BGR)
     frame[:] = annotated_bgr
     return frame
+
+
+def track_overlays(detections, track_metadata, active_names, frame_size=None):
+    """
+    Per-track overlay data matching draw_tracking_results: the same duplicate-name
+    resolution and box choice, as plain values so clients can draw the overlay.
+    Coordinates are in the processed frame. With frame_size (width, height) each
+    entry also carries overlay_box, the x1, y1, x2, y2 box the server would draw.
+    """
+    overlays = []
+    for i in range(len(detections)):
+        x1, y1, x2, y2 = map(int, detections.xyxy[i])
+        track_id = int(detections.tracker_id[i]) if detections.tracker_id is not None else -1
+        meta = track_metadata.get(track_id, {})
+        name = _resolve_name(track_id, meta.get("name", "Unknown"), active_names)
+        behavior_box = meta.get("last_behavior_box")
+        entry = {
+            "track_id": track_id,
+            "box": [x1, y1, x2, y2],
+            "behavior_box": [int(v) for v in behavior_box] if behavior_box else None,
+            "name": name,
+            "display_name": _display_name(name),
+            "confidence": round(float(meta.get("conf", 0.0)), 3),
+            "behavior": meta.get("behavior", "negative"),
+            "behavior_confidence": round(float(meta.get("behavior_conf", 0.0)), 3),
+        }
+        if frame_size is not None:
+            if behavior_box:
+                entry["overlay_box"] = entry["behavior_box"]
+            else:
+                bx, by, bw, bh = get_expanded_bbox(x1, y1, x2, y2, frame_size[0], frame_size[1])
+                entry["overlay_box"] = [int(bx), int(by), int(bx + bw), int(by + bh)]
+        overlays.append(entry)
+    return overlays
@@ -0,0 +1,52 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from src.embedding_store import EmbeddingStore, migrate_pickle, read_header, write_store
+
+
+def test_write_store_round_trips_and_bumps_generation(tmp_path):
+    embeddings = np.array([[3.0, 4.0], [0.0, 2.0]], dtype=np.float32)
+
+    first = write_store(tmp_path, ["Alice", "Bob"], embeddings, metadata={"Alice": {"images": 3}})
+    second = write_store(tmp_path, ["Alice", "Bob"], embeddings)
+    store = EmbeddingStore.open(tmp_path)
+
+    assert (first, second) == (1, 2)
+    assert store.generation == read_header(tmp_path)["generation"] == 2
+    assert list(store.names) == ["Alice", "Bob"]
+    # Rows are stored unit-norm.
+    np.testing.assert_allclose(store.embeddings, [[0.6, 0.8], [0.0, 1.0]], rtol=1e-6)
+    assert store.metadata == {}
+
+
+def test_old_generation_files_are_removed(tmp_path):
+    write_store(tmp_path, ["Alice"], np.ones((1, 4)))
+    write_store(tmp_path, ["Alice", "Bob"], np.eye(2, 4))
+
+    files = sorted(name for name in os.listdir(tmp_path) if not name.startswith("."))
+
+    assert files == ["embeddings-2.npy", "index.json", "metadata-2.json", "names-2.npy"]
+
+
+def test_write_store_rejects_duplicate_names(tmp_path):
+    with pytest.raises(ValueError):
+        write_store(tmp_path, ["Alice", "Alice"], np.eye(2, 4))
+    assert read_header(tmp_path) is None
+
+
+def test_migrate_pickle_converts_legacy_gallery(tmp_path):
+    legacy = {"Alice": np.array([1.0, 0.0, 0.0]), "Bob": np.array([0.0, 2.0, 0.0])}
+    pickle_path = tmp_path / "embeddings.pkl"
+    with open(pickle_path, "wb") as f:
+        pickle.dump(legacy, f)
+
+    generation = migrate_pickle(str(pickle_path), tmp_path / "gallery")
+    store = EmbeddingStore.open(tmp_path / "gallery")
+
+    assert generation == store.generation == 1
+    assert sorted(store.as_dict()) == ["Alice", "Bob"]
+    np.testing.assert_allclose(store.as_dict()["Bob"], [0.0, 1.0, 0.0])
+    assert store.metadata == {"migrated_from": str(pickle_path)}
@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src.gallery_index import INDEX_KINDS, build_gallery_index
+from src.recognizer import FaceRecognizer, _Gallery
+
+DIM = 512
+# Quantized rows are widened back to float32, so their scores are only close.
+SCORE_TOLERANCE = {"exact": 1e-6, "fp16": 1e-3, "int8": 2e-2, "ivf": 1e-6}
+
+
+def unit_rows(count, seed=0):
+    rows = np.random.default_rng(seed).normal(size=(count, DIM)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def brute_force_top2(gallery, queries):
+    scores = queries @ gallery.T
+    order = np.argsort(-scores, axis=1)[:, :2]
+    top = np.take_along_axis(scores, order, axis=1)
+    pad = 2 - order.shape[1]
+    return (
+        np.pad(top, ((0, 0), (0, pad)), constant_values=-1.0),
+        np.pad(order, ((0, 0), (0, pad)), constant_values=-1),
+    )
+
+
+@pytest.mark.parametrize("kind", INDEX_KINDS)
+@pytest.mark.parametrize("count", [0, 1, 2])
+def test_top2_matches_brute_force_on_tiny_galleries(kind, count):
+    gallery = unit_rows(count)
+    queries = unit_rows(5, seed=1)
+    if count:
+        queries[:count] = gallery + 0.05 * unit_rows(count, seed=2)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    scores, indices = build_gallery_index(gallery, kind).search(queries)
+    expected_scores, expected_indices = brute_force_top2(gallery, queries)
+
+    assert scores.shape == indices.shape == (len(queries), 2)
+    np.testing.assert_array_equal(indices, expected_indices)
+    np.testing.assert_allclose(scores, expected_scores, atol=SCORE_TOLERANCE[kind])
+
+
+def recognizer_for(kind, names, embeddings, threshold=0.5, min_margin=0.04):
+    # Skip __init__: it loads the InsightFace models, which matching does not need.
+    recognizer = object.__new__(FaceRecognizer)
+    recognizer.threshold = threshold
+    recognizer.min_margin = min_margin
+    store = SimpleNamespace(names=np.array(names), embeddings=embeddings)
+    recognizer._gallery = _Gallery(store, build_gallery_index(embeddings, kind))
+    return recognizer
+
+
+@pytest.mark.parametrize("kind", INDEX_KINDS)
+def test_match_embeddings_threshold_and_margin_do_not_depend_on_index(kind):
+    gallery = unit_rows(4)
+    # Bob and Bobby are near-duplicates, so a query close to both fails the margin.
+    gallery[3] = gallery[2] + 0.01 * unit_rows(1, seed=3)[0]
+    gallery[3] /= np.linalg.norm(gallery[3])
+    names = ["Alice", "Carol", "Bob", "Bobby"]
+    queries = np.stack([
+        gallery[0] + 0.1 * unit_rows(1, seed=4)[0],  # clear match
+        gallery[1] * 0.3 + unit_rows(1, seed=5)[0],  # below the threshold
+        gallery[2],                                  # ambiguous between Bob and Bobby
+        np.zeros(DIM, dtype=np.float32),             # no embedding
+    ])
+
+    expected = recognizer_for("exact", names, gallery).match_embeddings(queries)
+    results = recognizer_for(kind, names, gallery).match_embeddings(queries)
+
+    assert [name for name, _ in expected] == ["Alice", "Unknown", "Unknown", "Unknown"]
+    assert [name for name, _ in results] == [name for name, _ in expected]
+    np.testing.assert_allclose(
+        [score for _, score in results], [score for _, score in expected], atol=SCORE_TOLERANCE[kind]
+    )
+
+
+@pytest.mark.parametrize("kind", INDEX_KINDS)
+def test_single_student_gallery_has_no_margin_to_fail(kind):
+    gallery = unit_rows(1)
+    recognizer = recognizer_for(kind, ["Alice"], gallery, min_margin=0.5)
+
+    (name, score), = recognizer.match_embeddings(gallery)
+
+    assert name == "Alice"
+    assert score == pytest.approx(1.0, abs=SCORE_TOLERANCE[kind])